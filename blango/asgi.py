@@ -9,8 +9,16 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "blango.settings")
+os.environ.setdefault("DJANGO_CONFIGURATION", "Asgi")
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blango.settings')
+#from django.core.asgi import get_asgi_application
+from configurations.asgi import get_asgi_application
+
+#os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blango.settings')
 
 application = get_asgi_application()
+
+from blog.warmup import warm_up
+
+warm_up()
@@ -0,0 +1,22 @@
+"""blango URL Configuration for the Asgi configuration
+
+The read-only views that have async versions are routed to them here; the
+patterns come before the ones from blango.urls, so they take over both the
+resolving and the reversing of those names. Everything else is served by
+the patterns from blango.urls.
+"""
+from django.urls import path
+
+import blog.async_views
+import blog.api.async_views
+from blango.urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path("", blog.async_views.index),
+    path("api/v1/posts/", blog.api.async_views.post_list, name="post-list"),
+    path(
+        "api/v1/users/<str:email>",
+        blog.api.async_views.user_detail,
+        name="api_user_detail",
+    ),
+] + sync_urlpatterns
@@ -0,0 +1,185 @@
+"""
+Response compression for the HTML and API output.
+
+CompressionMiddleware compresses text responses (HTML, JSON, YAML and so
+on) with brotli, when the brotli package is installed and the client
+accepts it, or with gzip. Responses smaller than COMPRESSION_MIN_SIZE bytes
+are sent as they are, since compressing them saves little or nothing.
+
+Compressed bodies are kept in an in-process LRU keyed by a digest of the
+uncompressed body, holding up to COMPRESSION_CACHE_BYTES of compressed
+data. A page served from cache_page has the same body for every client,
+so it is compressed once per encoding rather than once per request.
+StreamingHttpResponse bodies are compressed chunk by chunk as they are
+sent and are not cached.
+"""
+import gzip
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/yaml",
+    "application/openapi+json",
+    "image/svg+xml",
+)
+
+
+def available_encodings():
+    # in order of preference
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding):
+    """
+    The content coding to use for a request's Accept-Encoding header, or
+    None if it accepts none of the available ones.
+    """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+
+    best, best_quality = None, 0.0
+    for coding in available_encodings():
+        quality = accepted.get(coding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(content, encoding):
+    if encoding == "br":
+        return brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(content, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def compress_stream(chunks, encoding):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        # wbits=31 writes a gzip header and trailer
+        compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class CompressedBodyCache:
+    """
+    An LRU of compressed bodies keyed by (encoding, digest of the body),
+    holding at most max_bytes of compressed data.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+            return body
+
+    def add(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self.entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compresses responses with brotli or gzip, see the module docstring.
+    Put it near the top of MIDDLEWARE so it compresses the response the
+    middleware below it produce.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.min_size = settings.COMPRESSION_MIN_SIZE
+        self.cache = CompressedBodyCache(settings.COMPRESSION_CACHE_BYTES)
+
+    def process_response(self, request, response):
+        if response.has_header("Content-Encoding"):
+            return response
+        content_type = response.get("Content-Type", "").lower()
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = choose_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_stream(response.streaming_content, encoding)
+            del response["Content-Length"]
+        else:
+            content = response.content
+            key = (encoding, hashlib.blake2b(content, digest_size=20).digest())
+            compressed = self.cache.get(key)
+            if compressed is None:
+                compressed = compress(content, encoding)
+                self.cache.add(key, compressed)
+            if len(compressed) >= len(content):
+                return response
+            response.content = compressed
+            response["Content-Length"] = str(len(compressed))
+
+        # the body is no longer byte for byte the one a strong ETag was made
+        # for, as in Django's GZipMiddleware
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = encoding
+        return response
@@ -16,6 +16,64 @@ from configurations import Configuration
 from configurations import values
 import dj_database_url
 from datetime import timedelta
+from importlib.util import find_spec
+
+
+def api_formats():
+    """
+    The REST framework renderer and parser classes. orjson replaces the
+    standard library json for application/json, and MessagePack is offered
+    as application/msgpack, when those packages are installed (see
+    blog/api/renderers.py).
+    """
+    renderers, parsers = [], []
+    if find_spec("orjson"):
+        renderers.append("blog.api.renderers.ORJSONRenderer")
+        parsers.append("blog.api.parsers.ORJSONParser")
+    else:
+        renderers.append("rest_framework.renderers.JSONRenderer")
+        parsers.append("rest_framework.parsers.JSONParser")
+    if find_spec("msgpack"):
+        renderers.append("blog.api.renderers.MessagePackRenderer")
+        parsers.append("blog.api.parsers.MessagePackParser")
+    renderers.append("rest_framework.renderers.BrowsableAPIRenderer")
+    parsers += ["rest_framework.parsers.FormParser", "rest_framework.parsers.MultiPartParser"]
+    return renderers, parsers
+
+
+api_renderers, api_parsers = api_formats()
+
+
+def build_middleware(debug_toolbar=False, compress=False, conditional_get=False):
+    """
+    The MIDDLEWARE list for a configuration. Every middleware runs for every
+    request, so each configuration only gets the ones it needs: the debug
+    toolbar is for development, and compressing responses and answering
+    conditional requests with 304s pay off in production.
+    """
+    middleware = [
+        # first, so the latency it records covers everything else
+        "blango.traffic.TrafficRecorderMiddleware",
+    ]
+    if debug_toolbar:
+        middleware.append("debug_toolbar.middleware.DebugToolbarMiddleware")
+    middleware.append("django.middleware.security.SecurityMiddleware")
+    if compress:
+        # before the others, so it compresses the response they produce
+        middleware.append("blango.middleware.CompressionMiddleware")
+    if conditional_get:
+        # after compression in the list, so the ETag is computed on the
+        # uncompressed body
+        middleware.append("django.middleware.http.ConditionalGetMiddleware")
+    middleware += [
+        "django.contrib.sessions.middleware.SessionMiddleware",
+        "django.middleware.common.CommonMiddleware",
+        #"django.middleware.csrf.CsrfViewMiddleware",
+        "django.contrib.auth.middleware.AuthenticationMiddleware",
+        "django.contrib.messages.middleware.MessageMiddleware",
+        #"django.middleware.clickjacking.XFrameOptionsMiddleware",
+    ]
+    return middleware
 
 class Dev(Configuration):
     # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -57,6 +115,7 @@ class Dev(Configuration):
         'django.contrib.staticfiles',
         'blango_auth',
         'blog',
+        'blango_tasks',
         'crispy_forms',
         'crispy_bootstrap5',
         'debug_toolbar',
@@ -73,17 +132,17 @@ class Dev(Configuration):
     SIMPLE_JWT = {
       "ACCESS_TOKEN_LIFETIME": timedelta(days=1),
       "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
+      "TOKEN_OBTAIN_SERIALIZER": "blog.api.serializers.BlangoTokenObtainPairSerializer",
     }
 
     MEDIA_ROOT = BASE_DIR / "media"
     MEDIA_URL = "/media/"
 
     REST_FRAMEWORK = {
+      # dispatches to the cached Basic, Token and JWT authenticators or to
+      # SessionAuthentication, depending on the request's headers
       "DEFAULT_AUTHENTICATION_CLASSES": [
-          "rest_framework.authentication.BasicAuthentication",
-          "rest_framework.authentication.SessionAuthentication",
-          "rest_framework.authentication.TokenAuthentication",
-          "rest_framework_simplejwt.authentication.JWTAuthentication",
+          "blog.api.authentication.HeaderDispatchAuthentication",
       ],
       "DEFAULT_PERMISSION_CLASSES": [
           "rest_framework.permissions.IsAuthenticatedOrReadOnly"
@@ -100,6 +159,8 @@ class Dev(Configuration):
           "user_sustained": "5000/day",
           "user_burst": "100/minute",
       },
+      "DEFAULT_RENDERER_CLASSES": api_renderers,
+      "DEFAULT_PARSER_CLASSES": api_parsers,
       "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
       "PAGE_SIZE": 100,
       "DEFAULT_FILTER_BACKENDS": [
@@ -108,19 +169,105 @@ class Dev(Configuration):
         ],
     }
 
+    # How long (seconds) and how many verified Basic auth credential pairs
+    # CachedBasicAuthentication remembers before hashing the password again.
+    BASIC_AUTH_CACHE_TTL = 300
+    BASIC_AUTH_CACHE_SIZE = 1024
+    # The cache must be shared by every process that serves the site or runs
+    # tasks: API credentials (blog/api/authentication.py), the trending
+    # ranking, the tag index generation and the comment limits are kept in
+    # it, and a revoked token would keep working in the processes that
+    # didn't see the change. The local memory cache is only shared within
+    # one process, which is enough for runserver; Prod uses memcached, and
+    # "manage.py check --deploy" fails on a per-process cache.
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    # How long (seconds) token keys and users (without their password hashes)
+    # stay in the cache used by CachedTokenAuthentication and
+    # CachedJWTAuthentication.
+    # Entries are also removed as soon as the user or token changes.
+    API_AUTH_CACHE_TTL = 300
+    # Build the user for safe (read only) JWT requests from the token's claims
+    # rather than from the database.
+    JWT_CLAIMS_USER_FOR_READS = values.BooleanValue(False)
+
     CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
     CRISPY_TEMPLATE_PACK = "bootstrap5"
 
-    MIDDLEWARE = [
-        'debug_toolbar.middleware.DebugToolbarMiddleware',
-        'django.middleware.security.SecurityMiddleware',
-        'django.contrib.sessions.middleware.SessionMiddleware',
-        'django.middleware.common.CommonMiddleware',
-        #'django.middleware.csrf.CsrfViewMiddleware',
-        'django.contrib.auth.middleware.AuthenticationMiddleware',
-        'django.contrib.messages.middleware.MessageMiddleware',
-        #'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    ]
+    MIDDLEWARE = build_middleware(debug_toolbar=True)
+
+    # Response compression (used by Prod), see blango/middleware.py.
+    COMPRESSION_MIN_SIZE = values.IntegerValue(200)
+    COMPRESSION_CACHE_BYTES = values.IntegerValue(16 * 1024 * 1024)
+    COMPRESSION_GZIP_LEVEL = 6
+    COMPRESSION_BROTLI_QUALITY = 5
+
+    # Request sampling for capacity planning, see blango/traffic.py.
+    # Recording is off unless TRAFFIC_LOG_PATH is set.
+    TRAFFIC_LOG_PATH = values.Value(None)
+    TRAFFIC_SAMPLE_RATE = values.FloatValue(1.0)
+    TRAFFIC_LOG_MAX_BYTES = values.IntegerValue(50 * 1024 * 1024)
+    TRAFFIC_LOG_BACKUP_COUNT = values.IntegerValue(10)
+    TRAFFIC_QUEUE_SIZE = values.IntegerValue(10000)
+
+    # Related posts, see blog/related.py: how many neighbours are kept for
+    # each post, and how much the words of the summaries count next to the
+    # tags (0 compares tags only).
+    RELATED_POSTS_COUNT = values.IntegerValue(5)
+    RELATED_POSTS_SUMMARY_WEIGHT = values.FloatValue(0.5)
+
+    # Post view counting, see blog/analytics.py: how often (seconds) each
+    # server process writes its counts (0 never does), and how long the
+    # hourly counts are kept.
+    ANALYTICS_FLUSH_INTERVAL = values.FloatValue(10.0)
+    ANALYTICS_RETENTION_DAYS = values.IntegerValue(7)
+
+    # The trending posts ranking written by the rank_trending_posts command,
+    # see blog/trending.py. Comments, views and the publish time within the
+    # window count for their weight, halved every TRENDING_HALF_LIFE_HOURS;
+    # the trending score of the posts/<pk>/stats API route decays the same.
+    # The ranking is kept for TRENDING_CACHE_SECONDS, a few runs of the
+    # command, so it doesn't outlive the command being stopped for long.
+    TRENDING_WINDOW_DAYS = values.IntegerValue(7)
+    TRENDING_HALF_LIFE_HOURS = values.FloatValue(12.0)
+    TRENDING_COMMENT_WEIGHT = values.FloatValue(3.0)
+    TRENDING_VIEW_WEIGHT = values.FloatValue(0.2)
+    TRENDING_PUBLISH_WEIGHT = values.FloatValue(5.0)
+    TRENDING_POSTS_COUNT = values.IntegerValue(200)
+    TRENDING_CACHE_SECONDS = values.IntegerValue(900)
+
+    # The background task queue, see blango_tasks/worker.py: how long (seconds)
+    # an idle worker waits before looking for tasks again, how long a task
+    # may run before it is taken to be abandoned and how often each worker
+    # looks for abandoned ones, and the retry delays.
+    TASKS_POLL_INTERVAL = values.FloatValue(1.0)
+    TASKS_LOCK_TIMEOUT = values.IntegerValue(600)
+    TASKS_STALE_SWEEP_INTERVAL = values.FloatValue(60.0)
+    TASKS_MAX_ATTEMPTS = values.IntegerValue(5)
+    TASKS_RETRY_BACKOFF = values.IntegerValue(30)
+    TASKS_RETRY_BACKOFF_MAX = values.IntegerValue(3600)
+
+    # How many comments the post page, the post API route and each page of
+    # posts/<pk>/comments show, see blog/comments.py.
+    COMMENTS_PAGE_SIZE = values.IntegerValue(20)
+
+    # Comment intake, see blog/intake.py: each user and each IP address can
+    # post a burst of comments, then one every interval (seconds); the same
+    # comment can't be posted twice within COMMENT_DUPLICATE_SECONDS; and
+    # comments with too many links or a blocked word are turned away.
+    COMMENT_USER_BURST = values.IntegerValue(5)
+    COMMENT_USER_INTERVAL = values.FloatValue(30.0)
+    COMMENT_IP_BURST = values.IntegerValue(20)
+    COMMENT_IP_INTERVAL = values.FloatValue(10.0)
+    COMMENT_DUPLICATE_SECONDS = values.IntegerValue(3600)
+    COMMENT_MAX_LINKS = values.IntegerValue(3)
+    COMMENT_BLOCKED_WORDS = values.ListValue([])
+
+    # Queued email, see blango_tasks/mail.py: the backend the task workers
+    # deliver with, how many messages they send over one connection, and
+    # how many times a message is tried before it is kept as failed.
+    EMAIL_QUEUE_BACKEND = values.Value("django.core.mail.backends.console.EmailBackend")
+    EMAIL_QUEUE_BATCH_SIZE = values.IntegerValue(100)
+    EMAIL_QUEUE_MAX_ATTEMPTS = values.IntegerValue(5)
 
     #INTERNAL_IPS = ["192.168.11.179"]
     INTERNAL_IPS = ["192.168.10.93"]
@@ -195,6 +342,7 @@ class Dev(Configuration):
     """
 
     WSGI_APPLICATION = 'blango.wsgi.application'
+    TEST_RUNNER = "blango.test_runner.BlangoTestRunner"
 
 
     # Database
@@ -267,6 +415,10 @@ class Dev(Configuration):
     ACCOUNT_USERNAME_REQUIRED = False
     ACCOUNT_AUTHENTICATION_METHOD = "email"
 
+    # Where build_api_schema (also run at startup) writes the OpenAPI schema,
+    # see blog/api/schema.py.
+    API_SCHEMA_DIR = values.Value(str(BASE_DIR / "api_schema"))
+
     SWAGGER_SETTINGS = {
         "SECURITY_DEFINITIONS": {
             "Token": {"type": "apiKey", "name": "Authorization", "in": "header"},
@@ -275,5 +427,38 @@ class Dev(Configuration):
     }
 
 class Prod(Dev):
+    """
+    Profile for serving the project. The apps and middleware that are only
+    used during development are left out, so each worker has less to import
+    when it starts (see the import_report command).
+    """
     DEBUG = False
     SECRET_KEY = values.SecretValue()
+    INSTALLED_APPS = [
+        app for app in Dev.INSTALLED_APPS
+        if app not in ("debug_toolbar", "allauth", "allauth.account", "allauth.socialaccount")
+    ]
+    MIDDLEWARE = build_middleware(compress=True, conditional_get=True)
+    # shared by all processes (needs pymemcache), see CACHES in Dev
+    CACHES = values.DictValue(
+        {
+            "default": {
+                "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+                "LOCATION": "127.0.0.1:11211",
+            }
+        }
+    )
+    # registrations and other requests that send mail only queue it
+    EMAIL_BACKEND = "blango_tasks.mail.QueuedEmailBackend"
+    EMAIL_QUEUE_BACKEND = values.Value("django.core.mail.backends.smtp.EmailBackend")
+
+class Asgi(Prod):
+    """
+    Profile for serving the project with an ASGI server through
+    blango/asgi.py, for example: uvicorn --workers 4 blango.asgi:application
+
+    The read-only views are routed to their async versions. The debug
+    toolbar middleware, which is sync only and would force every request
+    back onto a thread, is already left out by Prod.
+    """
+    ROOT_URLCONF = "blango.asgi_urls"
@@ -0,0 +1,19 @@
+"""
+The test runner (TEST_RUNNER). Post views are not written out by a
+background thread during the tests, which call view_counter.flush()
+themselves; a thread writing to the test database from its own
+connection would race with them.
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class BlangoTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_settings = override_settings(ANALYTICS_FLUSH_INTERVAL=0)
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,184 @@
+"""
+The JSON lines format used to record and replay HTTP traffic.
+
+Each line of a traffic log is a JSON object describing one request, for
+example:
+
+    {"ts": "2024-11-20T18:02:11.503Z", "method": "GET",
+     "path": "/api/v1/posts/", "query": "page=2", "auth": "Token",
+     "status": 200, "latency_ms": 12.4, "bytes": 5120}
+
+Only method and path are needed to replay a request; the other keys
+describe how the request was answered when it was recorded. auth holds
+the scheme of the Authorization header (Basic, Token, Bearer), Session
+for a request with a session cookie, or null for an anonymous one; the
+credentials themselves are never recorded.
+
+Lines that are not JSON objects with a path, such as the change requests
+in requests.jsonl, are skipped by read_traffic.
+
+TrafficRecorderMiddleware writes logs in this format. It is enabled by
+setting TRAFFIC_LOG_PATH (DJANGO_TRAFFIC_LOG_PATH in the environment), and
+samples TRAFFIC_SAMPLE_RATE of the requests. Records are handed to a
+background thread through a queue holding at most TRAFFIC_QUEUE_SIZE
+records, so a slow disk never holds up a response; records that do not
+fit are dropped and counted. The file is rotated when it reaches
+TRAFFIC_LOG_MAX_BYTES, keeping TRAFFIC_LOG_BACKUP_COUNT old files.
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueListener, RotatingFileHandler
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.deprecation import MiddlewareMixin
+
+logger = logging.getLogger(__name__)
+
+TRAFFIC_FIELDS = ("ts", "method", "path", "query", "auth", "status", "latency_ms", "bytes")
+
+
+def read_traffic(paths):
+    """
+    Yield the request records in the traffic logs at paths, in order.
+    """
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning("%s:%d is not valid JSON, skipping", path, line_number)
+                    continue
+                if not isinstance(record, dict) or not record.get("path"):
+                    logger.debug("%s:%d is not a request record, skipping", path, line_number)
+                    continue
+                record.setdefault("method", "GET")
+                record.setdefault("query", "")
+                yield record
+
+
+def request_target(record):
+    """
+    The request target (path and query string) for a record.
+    """
+    if record.get("query"):
+        return f"{record['path']}?{record['query']}"
+    return record["path"]
+
+
+def auth_scheme(request):
+    """
+    The auth value recorded for a request: the Authorization header scheme,
+    Session when there is a session cookie, or None.
+    """
+    authorization = request.META.get("HTTP_AUTHORIZATION")
+    if authorization:
+        return authorization.split(" ", 1)[0].capitalize()
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        return "Session"
+    return None
+
+
+class TrafficFormatter(logging.Formatter):
+    # the record's msg is the request dict; it is only turned into JSON on
+    # the listener thread
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc)
+            .isoformat(timespec="milliseconds")
+            .replace("+00:00", "Z")
+        }
+        entry.update(record.msg)
+        return json.dumps(entry, separators=(", ", ": "))
+
+
+class TrafficRecorder:
+    """
+    Appends request records to a rotating JSON lines file from a background
+    thread. record() never blocks: when the queue is full the record is
+    dropped and counted in dropped.
+    """
+
+    def __init__(self, path, max_bytes, backup_count, queue_size):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        handler = RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+        )
+        handler.setFormatter(TrafficFormatter())
+        self.listener = QueueListener(self.queue, handler)
+        self.listener.start()
+        atexit.register(self.close)
+
+    def record(self, entry):
+        try:
+            self.queue.put_nowait(logging.makeLogRecord({"msg": entry}))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning("Traffic recorder queue is full, %d records dropped", self.dropped)
+
+    def close(self):
+        # writes out everything still queued, then stops the thread
+        if self.listener._thread is not None:
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+
+
+class TrafficRecorderMiddleware(MiddlewareMixin):
+    """
+    Records a sample of the requests handled by the site in the traffic log
+    format. Put it first in MIDDLEWARE so the latency covers the whole
+    middleware chain.
+    """
+
+    def __init__(self, get_response):
+        if not settings.TRAFFIC_LOG_PATH:
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+        self.sample_rate = settings.TRAFFIC_SAMPLE_RATE
+        self.recorder = TrafficRecorder(
+            settings.TRAFFIC_LOG_PATH,
+            settings.TRAFFIC_LOG_MAX_BYTES,
+            settings.TRAFFIC_LOG_BACKUP_COUNT,
+            settings.TRAFFIC_QUEUE_SIZE,
+        )
+
+    def process_request(self, request):
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            request._traffic_started = time.perf_counter()
+
+    def process_response(self, request, response):
+        started = getattr(request, "_traffic_started", None)
+        if started is None:
+            return response
+        latency = time.perf_counter() - started
+
+        if response.streaming:
+            size = response.get("Content-Length")
+            size = int(size) if size else None
+        else:
+            size = len(response.content)
+
+        self.recorder.record(
+            {
+                "method": request.method,
+                "path": request.path,
+                "query": request.META.get("QUERY_STRING", ""),
+                "auth": auth_scheme(request),
+                "status": response.status_code,
+                "latency_ms": round(latency * 1000, 3),
+                "bytes": size,
+            }
+        )
+        return response
@@ -13,7 +13,6 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-import debug_toolbar
 from django.contrib import admin
 from django.urls import path, include
 import blog.views
@@ -23,8 +22,6 @@ from django_registration.backends.activation.views import RegistrationView
 from blango_auth.forms import BlangoRegistrationForm
 from django.conf.urls.static import static
 
-print(f"Time zone: {settings.TIME_ZONE}")
-
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("",blog.views.index),
@@ -44,6 +41,9 @@ urlpatterns = [
     #path("post-list/", blog.views.post_, name="blog-post-table"),
 ]
 if settings.DEBUG:
+    # only imported here, as the Prod configuration doesn't install it
+    import debug_toolbar
+
     urlpatterns += [
         path("__debug__/", include(debug_toolbar.urls)),
     ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -18,3 +18,7 @@ from configurations.wsgi import get_wsgi_application
 #os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blango.settings')
 
 application = get_wsgi_application()
+
+from blog.warmup import warm_up
+
+warm_up()
@@ -0,0 +1,33 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from blango_tasks.mail import schedule_delivery
+from blango_tasks.models import QueuedEmail, Task
+
+
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ("name", "lane", "status", "attempts", "run_at", "created_at")
+    list_filter = ("status", "lane", "name")
+    readonly_fields = ("locked_by", "locked_at", "last_error", "created_at")
+
+
+admin.site.register(Task, TaskAdmin)
+
+
+class QueuedEmailAdmin(admin.ModelAdmin):
+    list_display = ("subject", "recipients", "status", "attempts", "send_at", "created_at")
+    list_filter = ("status",)
+    exclude = ("message",)
+    readonly_fields = ("locked_by", "locked_at", "last_error", "created_at")
+    actions = ["send_again"]
+
+    @admin.action(description="Send the selected messages again")
+    def send_again(self, request, queryset):
+        count = queryset.exclude(status=QueuedEmail.SENDING).update(
+            status=QueuedEmail.QUEUED, attempts=0, send_at=timezone.now(), last_error=""
+        )
+        schedule_delivery()
+        self.message_user(request, f"Queued {count} messages to be sent again.")
+
+
+admin.site.register(QueuedEmail, QueuedEmailAdmin)
@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class BlangoTasksConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'blango_tasks'
+
+    def ready(self):
+        # importing each app's tasks module registers the tasks it defines,
+        # so a worker can run them
+        autodiscover_modules("tasks")
+        import blango_tasks.mail  # noqa: F401, registers deliver_email
@@ -0,0 +1,171 @@
+"""
+Sending email through the task queue.
+
+With EMAIL_BACKEND set to "blango_tasks.mail.QueuedEmailBackend" (as Prod
+does), sending a message only stores it as a QueuedEmail row and makes
+sure a deliver_email task is queued, so a request that sends mail, such as
+a registration, doesn't wait on the mail server.
+
+deliver_email runs on the high lane. It sends the due messages in batches
+of EMAIL_QUEUE_BATCH_SIZE with the EMAIL_QUEUE_BACKEND backend, over one
+connection per batch rather than one per message. A message that can't be
+sent is tried again on the TASKS_RETRY_BACKOFF schedule, and is kept as
+failed once it has been tried EMAIL_QUEUE_MAX_ATTEMPTS times; failed
+messages can be queued again from the admin.
+
+Messages are stored pickled, so attachments and alternatives survive, and
+are sent exactly as they were built.
+"""
+import copy
+import logging
+import pickle
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db.models import F, Min
+from django.utils import timezone
+
+from blango_tasks.models import QueuedEmail, Task
+from blango_tasks.registry import task
+from blango_tasks.worker import retry_delay
+
+logger = logging.getLogger(__name__)
+
+
+def queued_email(message):
+    # the connection can't be pickled, and the worker uses its own
+    message = copy.copy(message)
+    message.connection = None
+    return QueuedEmail(
+        message=pickle.dumps(message),
+        subject=message.subject[:255],
+        recipients=", ".join(message.recipients()),
+    )
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        emails = [queued_email(m) for m in email_messages if m.recipients()]
+        if not emails:
+            return 0
+        try:
+            QueuedEmail.objects.bulk_create(emails)
+            schedule_delivery()
+        except Exception:
+            if not self.fail_silently:
+                raise
+            logger.exception("Could not queue %d messages", len(emails))
+            return 0
+        return len(emails)
+
+
+def schedule_delivery(at=None):
+    """
+    Queue a deliver_email task to run at the given time (now by default),
+    unless one is already queued to run by then; one run sends everything
+    that is due.
+    """
+    at = at or timezone.now()
+    pending = Task.objects.filter(name=deliver_email.name, status=Task.QUEUED, run_at__lte=at)
+    if not pending.exists():
+        deliver_email.enqueue(delay=max(at - timezone.now(), timedelta(0)))
+
+
+def claim_batch(now):
+    lock_timeout = timedelta(seconds=settings.TASKS_LOCK_TIMEOUT)
+    QueuedEmail.objects.filter(status=QueuedEmail.SENDING, locked_at__lt=now - lock_timeout).update(
+        status=QueuedEmail.QUEUED, locked_by="", locked_at=None
+    )
+    due = QueuedEmail.objects.filter(status=QueuedEmail.QUEUED, send_at__lte=now)
+    pks = list(
+        due.order_by("send_at", "pk").values_list("pk", flat=True)[: settings.EMAIL_QUEUE_BATCH_SIZE]
+    )
+    # another worker may claim some of them at the same time; each one only
+    # sends the messages its own update changed
+    locked_by = uuid.uuid4().hex
+    QueuedEmail.objects.filter(pk__in=pks, status=QueuedEmail.QUEUED).update(
+        status=QueuedEmail.SENDING, locked_by=locked_by, locked_at=now, attempts=F("attempts") + 1
+    )
+    return list(QueuedEmail.objects.filter(status=QueuedEmail.SENDING, locked_by=locked_by))
+
+
+def send_batch(emails):
+    """
+    Send emails over one connection. Returns the ones sent and a list of
+    (email, error) for the others, which include messages the backend
+    reports as not sent without raising.
+    """
+    connection = get_connection(settings.EMAIL_QUEUE_BACKEND, fail_silently=False)
+    sent, failed = [], []
+    try:
+        connection.open()
+    except Exception:
+        error = traceback.format_exc()
+        return [], [(email, error) for email in emails]
+    try:
+        for email in emails:
+            try:
+                sent_count = connection.send_messages([pickle.loads(bytes(email.message))])
+            except Exception:
+                failed.append((email, traceback.format_exc()))
+                # the connection may be broken, start the next message on a
+                # new one
+                connection.close()
+                try:
+                    connection.open()
+                except Exception:
+                    pass
+            else:
+                # a backend can skip a message without raising, and then
+                # doesn't count it
+                if sent_count == 1:
+                    sent.append(email)
+                else:
+                    failed.append((email, "The email backend did not send the message."))
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def record_failures(failed, now):
+    for email, error in failed:
+        if email.attempts >= settings.EMAIL_QUEUE_MAX_ATTEMPTS:
+            logger.error("Giving up on email %s:\n%s", email, error)
+            status, send_at = QueuedEmail.FAILED, email.send_at
+        else:
+            logger.warning("Could not send email %s, will retry:\n%s", email, error)
+            status, send_at = QueuedEmail.QUEUED, now + retry_delay(email.attempts)
+        QueuedEmail.objects.filter(pk=email.pk).update(
+            status=status, send_at=send_at, locked_by="", locked_at=None, last_error=error
+        )
+
+
+@task(lane=Task.HIGH)
+def deliver_email():
+    """
+    Send the queued messages that are due, a batch at a time, then schedule
+    another run for when the next retry is due.
+    """
+    sent_count = 0
+    while True:
+        emails = claim_batch(timezone.now())
+        if not emails:
+            break
+        sent, failed = send_batch(emails)
+        QueuedEmail.objects.filter(pk__in=[email.pk for email in sent]).delete()
+        record_failures(failed, timezone.now())
+        sent_count += len(sent)
+        if not sent:
+            # nothing got through, leave the rest for the retry
+            break
+    logger.debug("Sent %d queued messages", sent_count)
+
+    next_retry = QueuedEmail.objects.filter(status=QueuedEmail.QUEUED).aggregate(
+        at=Min("send_at")
+    )["at"]
+    if next_retry is not None:
+        schedule_delivery(next_retry)
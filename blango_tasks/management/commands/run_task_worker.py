@@ -0,0 +1,62 @@
+"""
+Run queued tasks until stopped with SIGTERM or Ctrl-C.
+
+    python manage.py run_task_worker
+    python manage.py run_task_worker --processes 2 --threads 4
+    python manage.py run_task_worker --lanes high --threads 2
+
+See blango_tasks/worker.py.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from blango_tasks.models import Task
+from blango_tasks.worker import Worker, run_workers
+
+LANES = {label.lower(): value for value, label in Task.LANE_CHOICES}
+
+
+class Command(BaseCommand):
+    help = "Run the tasks queued with blango_tasks, in a pool of processes and threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=1, help="Number of worker processes.")
+        parser.add_argument(
+            "--threads", type=int, default=1, help="Number of worker threads in each process."
+        )
+        parser.add_argument(
+            "--lanes",
+            help=f"Comma separated lanes to take tasks from ({', '.join(LANES)}). Defaults to all.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            help="Seconds to wait when no task is due. Defaults to TASKS_POLL_INTERVAL.",
+        )
+        parser.add_argument(
+            "--burst", action="store_true", help="Run the tasks that are due, then exit."
+        )
+
+    def handle(self, *args, **options):
+        lanes = None
+        if options["lanes"]:
+            try:
+                lanes = [LANES[lane.strip().lower()] for lane in options["lanes"].split(",")]
+            except KeyError as e:
+                raise CommandError(f"Unknown lane {e.args[0]}, should be one of {', '.join(LANES)}")
+        if options["processes"] < 1 or options["threads"] < 1:
+            raise CommandError("--processes and --threads must be at least 1")
+
+        if options["burst"]:
+            worker = Worker(lanes)
+            count = 0
+            while worker.run_once():
+                count += 1
+            self.stdout.write(f"Ran {count} tasks")
+            return
+
+        self.stdout.write(
+            f"Running tasks with {options['processes']} processes of {options['threads']} threads"
+        )
+        run_workers(
+            options["processes"], options["threads"], lanes, options["poll_interval"]
+        )
@@ -0,0 +1,76 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Task(models.Model):
+    """
+    A call of a registered task function waiting to run, running, or
+    given up on after max_attempts. Tasks that succeed are deleted. See
+    blango_tasks/worker.py.
+    """
+
+    HIGH = 0
+    DEFAULT = 1
+    LOW = 2
+    LANE_CHOICES = [(HIGH, "High"), (DEFAULT, "Default"), (LOW, "Low")]
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    FAILED = "failed"
+    STATUS_CHOICES = [(QUEUED, "Queued"), (RUNNING, "Running"), (FAILED, "Failed")]
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    lane = models.PositiveSmallIntegerField(choices=LANE_CHOICES, default=DEFAULT)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()})"
+
+    class Meta:
+        indexes = [
+            # the order workers claim tasks in
+            models.Index(fields=["status", "lane", "run_at"], name="task_claim_order"),
+        ]
+
+
+class QueuedEmail(models.Model):
+    """
+    A message accepted by QueuedEmailBackend and not delivered yet, or
+    given up on after EMAIL_QUEUE_MAX_ATTEMPTS (a dead letter, which can be
+    sent again from the admin). Delivered messages are deleted. See
+    blango_tasks/mail.py.
+    """
+
+    QUEUED = "queued"
+    SENDING = "sending"
+    FAILED = "failed"
+    STATUS_CHOICES = [(QUEUED, "Queued"), (SENDING, "Sending"), (FAILED, "Failed")]
+
+    # the pickled EmailMessage; subject and recipients are only for the admin
+    message = models.BinaryField()
+    subject = models.CharField(max_length=255, blank=True)
+    recipients = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    send_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.subject} to {self.recipients}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "send_at"], name="queued_email_send_order"),
+        ]
@@ -0,0 +1,69 @@
+"""
+Declaring tasks and queueing calls to them.
+
+    from blango_tasks.registry import task
+
+    @task(lane=Task.LOW, max_attempts=3)
+    def warm_hero_image(post_id):
+        ...
+
+    warm_hero_image.enqueue(post.pk)
+
+Tasks are defined in a tasks.py module of an installed app, which
+BlangoTasksConfig.ready() imports so that workers know them. enqueue()
+inserts a Task row in the caller's transaction, so a task queued by work
+that is rolled back is never run, and a worker only sees it once the
+transaction has committed. Arguments are stored as JSON, so pass ids
+rather than model instances.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from blango_tasks.models import Task
+
+registry = {}
+
+
+class TaskFunction:
+    def __init__(self, func, lane, max_attempts):
+        self.func = func
+        self.name = f"{func.__module__}.{func.__qualname__}"
+        self.lane = lane
+        self.max_attempts = max_attempts
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, delay=None, lane=None, **kwargs):
+        """
+        Queue a call with args and kwargs, to run after delay (seconds or a
+        timedelta) if given, in lane instead of the task's own.
+        """
+        if isinstance(delay, (int, float)):
+            delay = timedelta(seconds=delay)
+        return Task.objects.create(
+            name=self.name,
+            args=list(args),
+            kwargs=kwargs,
+            lane=self.lane if lane is None else lane,
+            max_attempts=self.max_attempts,
+            run_at=timezone.now() + delay if delay else timezone.now(),
+        )
+
+
+def task(func=None, *, lane=Task.DEFAULT, max_attempts=None):
+    """
+    Register func as a task; see the module docstring.
+    """
+
+    def register(func):
+        task_function = TaskFunction(
+            func, lane, max_attempts or settings.TASKS_MAX_ATTEMPTS
+        )
+        registry[task_function.name] = task_function
+        return task_function
+
+    return register(func) if func is not None else register
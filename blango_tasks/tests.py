@@ -0,0 +1,325 @@
+import socketserver
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from blango_tasks.mail import deliver_email
+from blango_tasks.models import QueuedEmail, Task
+from blango_tasks.registry import registry, task
+from blango_tasks.worker import Worker, default_worker_name, retry_delay
+from blog.models import Post
+
+calls = []
+
+
+@task
+def record(value):
+    calls.append(value)
+
+
+@task(lane=Task.HIGH)
+def record_urgently(value):
+    calls.append(f"urgent {value}")
+
+
+@task(max_attempts=2)
+def fail(value):
+    calls.append(value)
+    raise ValueError(value)
+
+
+class TaskQueueTestCase(TestCase):
+    def setUp(self):
+        calls.clear()
+        self.worker = Worker()
+
+    def run_all(self):
+        while self.worker.run_once():
+            pass
+
+    def test_threads_name_their_workers(self):
+        # as run_threads() does, the workers are built in this thread
+        stop_event = threading.Event()
+        stop_event.set()
+        workers = [Worker(stop_event=stop_event) for _ in range(2)]
+        # both threads are alive at once, so their idents differ
+        barrier = threading.Barrier(len(workers))
+
+        def run(worker):
+            barrier.wait()
+            worker.run(0)
+
+        threads = [threading.Thread(target=run, args=(worker,)) for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        names = {worker.name for worker in workers}
+        self.assertEqual(len(names), 2)
+        self.assertNotIn(default_worker_name(), names)
+        self.assertEqual(Worker(name="named").name, "named")
+
+    def test_tasks_run_by_lane_then_due_time(self):
+        record.enqueue("first")
+        record.enqueue("later", delay=60)
+        record_urgently.enqueue("second")
+        record.enqueue("third", lane=Task.LOW)
+        record.enqueue("fourth")
+        self.assertIn(record.name, registry)
+
+        self.run_all()
+        self.assertEqual(calls, ["urgent second", "first", "fourth", "third"])
+        # succeeded tasks are deleted, the delayed one is still waiting
+        self.assertEqual(list(Task.objects.values_list("args", flat=True)), [["later"]])
+
+    def test_worker_lanes(self):
+        record.enqueue("default")
+        record_urgently.enqueue("high")
+        Worker(lanes=[Task.HIGH]).run_once()
+        self.assertFalse(Worker(lanes=[Task.HIGH]).run_once())
+        self.assertEqual(calls, ["urgent high"])
+
+    @override_settings(TASKS_RETRY_BACKOFF=10, TASKS_RETRY_BACKOFF_MAX=15)
+    def test_retries_with_backoff_then_fails(self):
+        queued = fail.enqueue("boom")
+        self.assertTrue(self.worker.run_once())
+        task_row = Task.objects.get(pk=queued.pk)
+        self.assertEqual((task_row.status, task_row.attempts), (Task.QUEUED, 1))
+        self.assertIn("ValueError: boom", task_row.last_error)
+        self.assertGreater(task_row.run_at, timezone.now() + timedelta(seconds=9))
+        # not due yet
+        self.assertFalse(self.worker.run_once())
+
+        Task.objects.update(run_at=timezone.now())
+        self.assertTrue(self.worker.run_once())
+        task_row.refresh_from_db()
+        self.assertEqual((task_row.status, task_row.attempts), (Task.FAILED, 2))
+        self.assertFalse(self.worker.run_once())
+        self.assertEqual(calls, ["boom", "boom"])
+        self.assertEqual(retry_delay(5), timedelta(seconds=15))
+
+    def test_unknown_task_fails(self):
+        Task.objects.create(name="blango_tasks.tests.missing", max_attempts=1)
+        self.worker.run_once()
+        self.assertIn("No task is registered", Task.objects.get().last_error)
+
+    @override_settings(TASKS_LOCK_TIMEOUT=60)
+    def test_abandoned_task_is_queued_again(self):
+        record.enqueue("abandoned")
+        Task.objects.update(
+            status=Task.RUNNING, locked_by="gone", locked_at=timezone.now() - timedelta(minutes=5)
+        )
+        self.run_all()
+        self.assertEqual(calls, ["abandoned"])
+
+    @override_settings(TASKS_STALE_SWEEP_INTERVAL=60)
+    def test_abandoned_tasks_looked_for_on_an_interval(self):
+        with self.assertNumQueries(2):
+            self.assertIsNone(self.worker.claim())
+        # an idle poll is only the SELECT, no UPDATE
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.worker.claim())
+        self.worker.swept_at -= 60
+        with self.assertNumQueries(2):
+            self.assertIsNone(self.worker.claim())
+
+    def test_claim_is_exclusive(self):
+        record.enqueue("once")
+        task_row = self.worker.claim()
+        self.assertEqual(task_row.status, Task.RUNNING)
+        self.assertIsNone(Worker().claim())
+
+    def test_burst_command(self):
+        record.enqueue("a")
+        record.enqueue("b")
+        out = StringIO()
+        call_command("run_task_worker", "--burst", stdout=out)
+        self.assertIn("Ran 2 tasks", out.getvalue())
+        self.assertEqual(calls, ["a", "b"])
+
+    def test_hero_image_is_warmed_in_the_background(self):
+        user = get_user_model().objects.create_user(email="test@example.com", password="password")
+        post = Post.objects.create(
+            author=user,
+            published_at=timezone.now(),
+            title="Post",
+            slug="post",
+            summary="Summary",
+            content="Content",
+        )
+        self.assertFalse(Task.objects.exists())
+        post.hero_image = SimpleUploadedFile("hero.png", b"not read here")
+        with mock.patch("blog.models.Post.hero_image.field.storage.save", return_value="hero_images/hero.png"):
+            post.save()
+        self.assertEqual(
+            list(Task.objects.values_list("name", "args")), [("blog.tasks.warm_hero_image", [post.pk])]
+        )
+
+        with mock.patch("blog.tasks.VersatileImageFieldWarmer") as warmer:
+            warmer.return_value.warm.return_value = (3, [])
+            self.worker.run_once()
+        warmer.assert_called_once()
+        self.assertFalse(Task.objects.exists())
+
+
+class DroppingEmailBackend(BaseEmailBackend):
+    """
+    Reports every message as not sent without raising.
+    """
+
+    def send_messages(self, email_messages):
+        return 0
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """
+    Just enough of an SMTP server on localhost to receive messages. Mail to
+    bounce@example.com is refused.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.port = self.server_address[1]
+        self.connections = 0
+        self.messages = []
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 localhost")
+        recipients = []
+        for line in self.rfile:
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb == "RCPT":
+                if "bounce@example.com" in command:
+                    self.reply("550 No such user")
+                    continue
+                recipients.append(command)
+            elif verb == "DATA":
+                self.reply("354 Go ahead")
+                data = b""
+                for data_line in self.rfile:
+                    if data_line == b".\r\n":
+                        break
+                    data += data_line
+                self.server.messages.append((recipients, data.decode()))
+                recipients = []
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            self.reply("250 OK")
+
+
+class QueuedEmailTestCase(TestCase):
+    def setUp(self):
+        self.smtp = SMTPStandIn().__enter__()
+        self.addCleanup(self.smtp.__exit__)
+        settings = override_settings(
+            EMAIL_BACKEND="blango_tasks.mail.QueuedEmailBackend",
+            EMAIL_QUEUE_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST="127.0.0.1",
+            EMAIL_PORT=self.smtp.port,
+            EMAIL_QUEUE_MAX_ATTEMPTS=2,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def run_worker(self):
+        worker = Worker()
+        while worker.run_once():
+            pass
+
+    def test_registration_mail_is_queued(self):
+        response = self.client.post(
+            reverse("django_registration_register"),
+            {"email": "new@example.com", "password1": "a-Long-passw0rd", "password2": "a-Long-passw0rd"},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.smtp.connections, 0)
+        self.assertEqual(QueuedEmail.objects.get().recipients, "new@example.com")
+        self.assertEqual(Task.objects.get().name, deliver_email.name)
+
+        self.run_worker()
+        [(recipients, data)] = self.smtp.messages
+        self.assertEqual([r.lower() for r in recipients], ["rcpt to:<new@example.com>"])
+        self.assertIn("activate", data)
+        self.assertFalse(QueuedEmail.objects.exists())
+
+    def test_batches_share_a_connection(self):
+        sent = mail.send_mass_mail(
+            [(f"Message {i}", "Body", "blango@example.com", [f"user{i}@example.com"]) for i in range(5)]
+        )
+        self.assertEqual(sent, 5)
+        # one delivery task is enough for all of them
+        self.assertEqual(Task.objects.count(), 1)
+
+        with override_settings(EMAIL_QUEUE_BATCH_SIZE=2):
+            self.run_worker()
+        self.assertEqual(len(self.smtp.messages), 5)
+        self.assertEqual(self.smtp.connections, 3)
+        self.assertFalse(QueuedEmail.objects.exists())
+
+    @override_settings(TASKS_RETRY_BACKOFF=60)
+    def test_failed_messages_are_retried_then_kept(self):
+        mail.send_mail("Bounces", "Body", "blango@example.com", ["bounce@example.com"])
+        mail.send_mail("Arrives", "Body", "blango@example.com", ["user@example.com"])
+        self.run_worker()
+        self.assertEqual(len(self.smtp.messages), 1)
+        bounced = QueuedEmail.objects.get()
+        self.assertEqual((bounced.status, bounced.attempts), (QueuedEmail.QUEUED, 1))
+        self.assertIn("SMTPRecipientsRefused", bounced.last_error)
+        # a delivery is scheduled for the retry
+        retry = Task.objects.get()
+        self.assertLess(abs(retry.run_at - bounced.send_at), timedelta(seconds=1))
+        self.assertGreater(retry.run_at, timezone.now() + timedelta(seconds=59))
+
+        Task.objects.update(run_at=timezone.now())
+        QueuedEmail.objects.update(send_at=timezone.now())
+        self.run_worker()
+        bounced.refresh_from_db()
+        self.assertEqual((bounced.status, bounced.attempts), (QueuedEmail.FAILED, 2))
+        self.assertFalse(Task.objects.exists())
+
+    @override_settings(
+        EMAIL_QUEUE_BACKEND="blango_tasks.tests.DroppingEmailBackend", TASKS_RETRY_BACKOFF=60
+    )
+    def test_messages_the_backend_drops_are_retried(self):
+        mail.send_mail("Dropped", "Body", "blango@example.com", ["user@example.com"])
+        self.run_worker()
+        dropped = QueuedEmail.objects.get()
+        self.assertEqual((dropped.status, dropped.attempts), (QueuedEmail.QUEUED, 1))
+        self.assertIn("did not send", dropped.last_error)
+        self.assertGreater(dropped.send_at, timezone.now() + timedelta(seconds=59))
+
+    def test_unreachable_server(self):
+        with override_settings(EMAIL_PORT=1):
+            mail.send_mail("Later", "Body", "blango@example.com", ["user@example.com"])
+            self.run_worker()
+        self.assertEqual(QueuedEmail.objects.get().attempts, 1)
+        self.assertIn("ConnectionRefusedError", QueuedEmail.objects.get().last_error)
@@ -0,0 +1,233 @@
+"""
+Running queued tasks.
+
+A worker thread repeatedly claims the next task that is due, runs it and
+records the outcome:
+
+- tasks are claimed highest lane first (Task.HIGH, DEFAULT, LOW), then in
+  the order they became due,
+- a claim is an UPDATE that only succeeds while the task is still queued,
+  so any number of threads and processes can share the table without a
+  task being run twice, on SQLite as well as on other databases,
+- a task that succeeds is deleted,
+- a task that raises is queued again after TASKS_RETRY_BACKOFF seconds,
+  doubled for each attempt up to TASKS_RETRY_BACKOFF_MAX, and marked
+  failed with its last error once it has been tried max_attempts times,
+- a task left running for TASKS_LOCK_TIMEOUT seconds, by a worker that
+  died, is queued again. Each worker looks for them every
+  TASKS_STALE_SWEEP_INTERVAL seconds rather than on every claim, since
+  the UPDATE takes SQLite's write lock even when there are none.
+
+run_workers() runs a pool of processes with a pool of threads each; the
+run_task_worker management command is its command line.
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, connections
+from django.db.models import F
+from django.utils import timezone
+
+from blango_tasks.models import Task
+from blango_tasks.registry import registry
+
+logger = logging.getLogger(__name__)
+
+# how many due tasks are looked at per claim, in case others claim the
+# first ones at the same time
+CLAIM_CANDIDATES = 10
+
+
+def retry_delay(attempts):
+    """
+    How long to wait before trying again after attempts failed attempts.
+    """
+    delay = settings.TASKS_RETRY_BACKOFF * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.TASKS_RETRY_BACKOFF_MAX))
+
+
+def default_worker_name():
+    # tasks are locked by name, so it must differ between the threads of a
+    # process as well as between processes
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+class Worker:
+    """
+    Claims and runs tasks; see the module docstring. Without a name, a
+    worker is named after the thread that runs it, so one built in another
+    thread and handed to a thread pool still gets a name of its own.
+    """
+
+    def __init__(self, lanes=None, name=None, stop_event=None):
+        self.lanes = lanes
+        self.name = name
+        self.stop_event = stop_event or threading.Event()
+        # time.monotonic() of the last requeue_stale()
+        self.swept_at = None
+
+    def requeue_stale(self, now):
+        stale = Task.objects.filter(
+            status=Task.RUNNING,
+            locked_at__lt=now - timedelta(seconds=settings.TASKS_LOCK_TIMEOUT),
+        )
+        count = stale.update(status=Task.QUEUED, locked_by="", locked_at=None)
+        if count:
+            logger.warning("Queued %d tasks again that were left running", count)
+
+    def claim(self):
+        if self.name is None:
+            self.name = default_worker_name()
+        now = timezone.now()
+        if (
+            self.swept_at is None
+            or time.monotonic() - self.swept_at >= settings.TASKS_STALE_SWEEP_INTERVAL
+        ):
+            self.requeue_stale(now)
+            self.swept_at = time.monotonic()
+        due = Task.objects.filter(status=Task.QUEUED, run_at__lte=now)
+        if self.lanes is not None:
+            due = due.filter(lane__in=self.lanes)
+        for task in due.order_by("lane", "run_at", "pk")[:CLAIM_CANDIDATES]:
+            claimed = Task.objects.filter(pk=task.pk, status=Task.QUEUED).update(
+                status=Task.RUNNING,
+                locked_by=self.name,
+                locked_at=now,
+                attempts=F("attempts") + 1,
+            )
+            if claimed:
+                # no other worker can change the row now, so it is not read
+                # again; a failed read would leave it running until the
+                # lock timeout
+                task.status, task.locked_by, task.locked_at = Task.RUNNING, self.name, now
+                task.attempts += 1
+                return task
+        return None
+
+    def run_task(self, task):
+        task_function = registry.get(task.name)
+        try:
+            if task_function is None:
+                raise LookupError(f"No task is registered as {task.name}")
+            task_function(*task.args, **task.kwargs)
+        except Exception:
+            error = traceback.format_exc()
+            if task.attempts >= task.max_attempts:
+                logger.error("Task %s failed for the last time:\n%s", task, error)
+                Task.objects.filter(pk=task.pk).update(
+                    status=Task.FAILED, locked_by="", locked_at=None, last_error=error
+                )
+            else:
+                delay = retry_delay(task.attempts)
+                logger.warning("Task %s failed, retrying in %s:\n%s", task, delay, error)
+                Task.objects.filter(pk=task.pk).update(
+                    status=Task.QUEUED,
+                    run_at=timezone.now() + delay,
+                    locked_by="",
+                    locked_at=None,
+                    last_error=error,
+                )
+            return False
+        Task.objects.filter(pk=task.pk).delete()
+        return True
+
+    def run_once(self):
+        """
+        Claim and run one task. Returns False if none was due.
+        """
+        task = self.claim()
+        if task is None:
+            return False
+        logger.debug("Running %s (attempt %d)", task, task.attempts)
+        self.run_task(task)
+        return True
+
+    def run(self, poll_interval):
+        if self.name is None:
+            self.name = default_worker_name()
+        try:
+            while not self.stop_event.is_set():
+                close_old_connections()
+                try:
+                    busy = self.run_once()
+                except Exception:
+                    # e.g. the database went away; try again after a pause
+                    logger.exception("Worker %s could not claim a task", self.name)
+                    busy = False
+                if not busy:
+                    self.stop_event.wait(poll_interval)
+        finally:
+            connection.close()
+
+
+def run_threads(threads, lanes, poll_interval, stop_event):
+    workers = [
+        threading.Thread(
+            target=Worker(lanes, stop_event=stop_event).run,
+            args=(poll_interval,),
+            name=f"task-worker-{i}",
+        )
+        for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def run_process(threads, lanes, poll_interval):
+    # a child process: stop once the running tasks finish on SIGTERM
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    run_threads(threads, lanes, poll_interval, stop_event)
+
+
+def run_workers(processes=1, threads=1, lanes=None, poll_interval=None):
+    """
+    Run tasks with threads worker threads in each of processes processes
+    until SIGTERM or SIGINT. Only tasks in lanes are run, if given.
+    """
+    poll_interval = poll_interval or settings.TASKS_POLL_INTERVAL
+    stop_event = threading.Event()
+
+    def stop(signum, frame):
+        logger.info("Stopping the task workers")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    if processes <= 1:
+        run_threads(threads, lanes, poll_interval, stop_event)
+        return
+
+    # the children must not share the parent's database connections
+    connections.close_all()
+    context = multiprocessing.get_context("fork")
+
+    def start_child():
+        child = context.Process(target=run_process, args=(threads, lanes, poll_interval))
+        child.start()
+        return child
+
+    children = [start_child() for _ in range(processes)]
+    while not stop_event.wait(5):
+        for i, child in enumerate(children):
+            if not child.is_alive():
+                logger.warning(
+                    "Task worker process %d exited (%s), restarting it", child.pid, child.exitcode
+                )
+                children[i] = start_child()
+    for child in children:
+        child.terminate()
+    for child in children:
+        child.join()
@@ -1,6 +1,6 @@
 from django.contrib import admin
 #from .models import Tag, Post, Comment
-from blog.models import Tag, Post, Comment, AuthorProfile
+from blog.models import Tag, Post, Comment, AuthorProfile, PostArchiveBucket
 
 class PostAdmin(admin.ModelAdmin):
     prepopulated_fields = {"slug": ("title",)}
@@ -11,4 +11,5 @@ admin.site.register(Post, PostAdmin)
 admin.site.register(Comment)
 
 admin.site.register(AuthorProfile)
+admin.site.register(PostArchiveBucket)
 #admin.site.register(PostAdmin)
\ No newline at end of file
@@ -0,0 +1,210 @@
+"""
+Post view counting.
+
+The post page and the posts/<pk> API route call record_view(), which only
+adds one to a counter in this process's memory, so reading a post never
+waits on a database write. A background thread in each server process,
+started by the process's first record_view(), writes the counts out every
+ANALYTICS_FLUSH_INTERVAL seconds in one transaction:
+
+- PostAnalytics.view_count, the post's total views, and
+- PostHourlyViews, its views per hour, kept for ANALYTICS_RETENTION_DAYS.
+
+The writes add to the stored values (view_count = view_count + n), so any
+number of processes can flush without losing each other's counts. Views
+that cannot be written are kept and tried again on the next flush; views
+still in memory when a process is killed without exiting cleanly are lost.
+The thread is started on first use rather than at startup because a
+process forked after startup, such as a gunicorn worker with --preload,
+doesn't have its parent's threads.
+
+A post's trending score is the sum of its hourly views, each halved for
+every TRENDING_HALF_LIFE_HOURS since its hour, as in blog/trending.py.
+"""
+import atexit
+import logging
+import math
+import os
+import threading
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from blog.models import Post, PostAnalytics, PostHourlyViews
+
+logger = logging.getLogger(__name__)
+
+
+def start_of_hour(when):
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+def write_views(counts):
+    """
+    Add counts, a Counter of (post id, hour) to views, to the database.
+    Views of posts that have been deleted are dropped.
+    """
+    post_ids = set(
+        Post.objects.filter(pk__in={pk for pk, _ in counts}).values_list("pk", flat=True)
+    )
+    counts = {key: n for key, n in counts.items() if key[0] in post_ids}
+    totals = Counter()
+    for (post_id, _), n in counts.items():
+        totals[post_id] += n
+
+    with transaction.atomic():
+        PostAnalytics.objects.bulk_create(
+            [PostAnalytics(post_id=pk) for pk in totals], ignore_conflicts=True
+        )
+        PostHourlyViews.objects.bulk_create(
+            [PostHourlyViews(post_id=pk, hour=hour) for pk, hour in counts],
+            ignore_conflicts=True,
+        )
+        for post_id, n in totals.items():
+            PostAnalytics.objects.filter(post_id=post_id).update(view_count=F("view_count") + n)
+        for (post_id, hour), n in counts.items():
+            PostHourlyViews.objects.filter(post_id=post_id, hour=hour).update(
+                views=F("views") + n
+            )
+
+
+def prune_hourly_views(now=None):
+    cutoff = (now or timezone.now()) - timedelta(days=settings.ANALYTICS_RETENTION_DAYS)
+    return PostHourlyViews.objects.filter(hour__lt=cutoff).delete()[0]
+
+
+class ViewCounter:
+    """
+    Views counted in memory by (post id, hour), written out by flush(),
+    from a background thread once start() has been called.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.thread = None
+        # the process the thread was started in
+        self.pid = None
+        self.stopped = threading.Event()
+        self.pruned_hour = None
+
+    def record(self, post_id, when=None):
+        hour = start_of_hour(when or timezone.now())
+        with self.lock:
+            self.counts[post_id, hour] += 1
+
+    def take(self):
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+        return counts
+
+    def flush(self):
+        counts = self.take()
+        if counts:
+            try:
+                write_views(counts)
+            except Exception:
+                logger.exception("Could not write %d view counts, keeping them", len(counts))
+                with self.lock:
+                    self.counts.update(counts)
+                return
+            logger.debug("Wrote %d view counts", len(counts))
+
+        hour = start_of_hour(timezone.now())
+        if hour != self.pruned_hour:
+            self.pruned_hour = hour
+            prune_hourly_views()
+
+    def run(self, interval):
+        while not self.stopped.wait(interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not flush the view counts")
+            finally:
+                # the thread's connection would otherwise outlive
+                # CONN_MAX_AGE unnoticed
+                connection.close()
+
+    def start(self, interval):
+        """
+        Start the thread that calls flush() every interval seconds, unless
+        it is running in this process already or interval is 0. A process
+        forked from one that started it has no thread, and the counts and
+        lock it inherited are its parent's, so it starts afresh.
+        """
+        pid = os.getpid()
+        if self.pid == pid or interval <= 0:
+            return
+        with self.start_lock:
+            if self.pid == pid:
+                return
+            if self.pid is None:
+                # inherited by forked processes, whose stop() is then theirs
+                atexit.register(self.stop)
+            else:
+                self.counts = Counter()
+                self.lock = threading.Lock()
+            self.pid = pid
+            self.thread = threading.Thread(
+                target=self.run, args=(interval,), name="view-counter", daemon=True
+            )
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+
+view_counter = ViewCounter()
+
+
+def record_view(post_id):
+    view_counter.start(settings.ANALYTICS_FLUSH_INTERVAL)
+    view_counter.record(post_id)
+
+
+def trending_score(hourly_views, now=None):
+    """
+    The decayed sum of (hour, views) pairs.
+    """
+    now = now or timezone.now()
+    half_life = settings.TRENDING_HALF_LIFE_HOURS * 3600
+    return sum(
+        views * math.pow(0.5, max(0.0, (now - hour).total_seconds()) / half_life)
+        for hour, views in hourly_views
+    )
+
+
+def post_stats(post_id, now=None):
+    """
+    A post's views in total and in the last 24 hours, and its trending
+    score, including the views this process has not written yet.
+    """
+    now = now or timezone.now()
+    hourly = Counter(
+        dict(
+            PostHourlyViews.objects.filter(post_id=post_id).values_list("hour", "views")
+        )
+    )
+    with view_counter.lock:
+        pending = {hour: n for (pk, hour), n in view_counter.counts.items() if pk == post_id}
+    hourly.update(pending)
+    total = (
+        PostAnalytics.objects.filter(post_id=post_id).values_list("view_count", flat=True).first()
+        or 0
+    )
+    day_ago = start_of_hour(now - timedelta(hours=23))
+    return {
+        "views": total + sum(pending.values()),
+        "views_24h": sum(n for hour, n in hourly.items() if hour >= day_ago),
+        "trending_score": round(trending_score(hourly.items(), now), 3),
+    }
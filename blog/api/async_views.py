@@ -0,0 +1,58 @@
+"""
+Async versions of the read-only API views, used by the Asgi configuration
+through blango/asgi_urls.py. See blog/async_views.py for how they work.
+
+A cached page is only returned after the view's throttles have counted the
+request, just as DRF does before the cache_page decorators on the view
+methods are reached. The throttles are checked by an instance of the DRF
+view, as APIView.initial() does, so scoped and view-aware throttles work,
+and a throttled request gets the view's own error response here rather
+than being handed to the sync view and counted twice. The post detail
+route has no page cache (it counts each view), so it is left to the sync
+view.
+"""
+from rest_framework.exceptions import Throttled
+
+from blog.async_views import async_read_view
+from blog.api.urls import router
+from blog.api.views import UserDetail
+
+
+def router_view(name):
+    # reuse the view functions the router built, so the actions stay in step
+    for pattern in router.urls:
+        if pattern.name == name:
+            return pattern.callback
+    raise LookupError(f"No route named {name}")
+
+
+def throttle_check(view):
+    def check_request(request, *args, **kwargs):
+        # set up the view as the function from as_view() does before
+        # dispatching, up to the throttles
+        api_view = view.cls(**view.initkwargs)
+        if getattr(view, "actions", None) is not None:
+            api_view.action_map = view.actions
+        api_view.args, api_view.kwargs = args, kwargs
+        api_view.headers = api_view.default_response_headers
+        drf_request = api_view.initialize_request(request, *args, **kwargs)
+        api_view.request = drf_request
+        api_view.format_kwarg = api_view.get_format_suffix(**kwargs)
+        try:
+            api_view.check_throttles(drf_request)
+        except Throttled as exc:
+            response = api_view.finalize_response(
+                drf_request, api_view.handle_exception(exc), *args, **kwargs
+            )
+            return response.render()
+        return None
+
+    return check_request
+
+
+def async_api_view(view):
+    return async_read_view(view, check_request=throttle_check(view))
+
+
+post_list = async_api_view(router_view("post-list"))
+user_detail = async_api_view(UserDetail.as_view())
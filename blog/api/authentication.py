@@ -0,0 +1,260 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import (
+    BaseAuthentication,
+    BasicAuthentication,
+    SessionAuthentication,
+    TokenAuthentication,
+    get_authorization_header,
+)
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+logger = logging.getLogger(__name__)
+
+VerifiedCredential = namedtuple("VerifiedCredential", ["user_pk", "username", "password_hash", "expires"])
+
+
+class VerifiedCredentialCache:
+    """
+    An in-process LRU of credential pairs that have recently passed a full
+    password check, keyed by a keyed HMAC of the pair so the password is
+    never kept. Each entry holds the user's password hash at the time of
+    the check, so it stops matching as soon as the password is changed.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def digest(username, password):
+        return salted_hmac(
+            "blog.api.authentication.VerifiedCredentialCache",
+            f"{username}\0{password}",
+            algorithm="sha256",
+        ).hexdigest()
+
+    def get(self, digest):
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is None:
+                return None
+            if entry.expires < time.monotonic():
+                del self.entries[digest]
+                return None
+            self.entries.move_to_end(digest)
+            return entry
+
+    def add(self, digest, user):
+        entry = VerifiedCredential(
+            user.pk, user.get_username(), user.password, time.monotonic() + self.ttl
+        )
+        with self.lock:
+            self.entries[digest] = entry
+            self.entries.move_to_end(digest)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def discard(self, digest):
+        with self.lock:
+            self.entries.pop(digest, None)
+
+
+verified_credentials = VerifiedCredentialCache(
+    settings.BASIC_AUTH_CACHE_SIZE, settings.BASIC_AUTH_CACHE_TTL
+)
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    """
+    BasicAuthentication that only runs the password hasher the first time
+    it sees a username and password pair within BASIC_AUTH_CACHE_TTL
+    seconds. Repeat requests with the same pair load the user by primary
+    key and compare its stored password hash with the one that was
+    verified, instead of hashing the password again.
+    """
+
+    def authenticate_credentials(self, userid, password, request=None):
+        digest = verified_credentials.digest(userid, password)
+        entry = verified_credentials.get(digest)
+        if entry is not None:
+            user = get_user_model()._default_manager.filter(pk=entry.user_pk).first()
+            if (
+                user is not None
+                and user.is_active
+                and user.get_username() == entry.username
+                and constant_time_compare(user.password, entry.password_hash)
+            ):
+                return (user, None)
+            verified_credentials.discard(digest)
+
+        user, auth = super().authenticate_credentials(userid, password, request)
+        verified_credentials.add(digest, user)
+        return (user, auth)
+
+
+AUTH_USER_CACHE_KEY = "api_auth_user_{}"
+AUTH_TOKEN_CACHE_KEY = "api_auth_token_{}"
+
+
+def token_cache_key(key):
+    # the token key is a credential, so only a hash of it is used in the
+    # shared cache
+    return AUTH_TOKEN_CACHE_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+def user_snapshot(user):
+    # every field but the password hash, which is kept out of the cache
+    return {
+        field.attname: getattr(user, field.attname)
+        for field in user._meta.concrete_fields
+        if field.attname != "password"
+    }
+
+
+def user_from_snapshot(snapshot):
+    # the password is left deferred: reading it loads it, and saving the
+    # user only writes the other fields
+    User = get_user_model()
+    return User.from_db(router.db_for_read(User), list(snapshot), list(snapshot.values()))
+
+
+def get_cached_user(pk):
+    """
+    Return the active user with primary key pk, or None if there is none
+    or it is inactive. The user's fields, except the password hash, are
+    kept in the shared cache (False for a missing user), so a cache hit
+    makes no query. Entries are removed when the user is saved or deleted.
+    """
+    key = AUTH_USER_CACHE_KEY.format(pk)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        user = get_user_model()._default_manager.filter(pk=pk).first()
+        snapshot = False if user is None else user_snapshot(user)
+        cache.set(key, snapshot, settings.API_AUTH_CACHE_TTL)
+        return user if snapshot and user.is_active else None
+    if not snapshot or not snapshot["is_active"]:
+        return None
+    return user_from_snapshot(snapshot)
+
+
+def invalidate_cached_user(pk):
+    cache.delete(AUTH_USER_CACHE_KEY.format(pk))
+
+
+def invalidate_cached_token(key):
+    cache.delete(token_cache_key(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that resolves token keys to user primary keys,
+    and those to users (see get_cached_user), through the shared cache, so
+    a repeat request makes no query.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        user_pk = cache.get(cache_key)
+        if user_pk is None:
+            user, token = super().authenticate_credentials(key)
+            ttl = settings.API_AUTH_CACHE_TTL
+            cache.set(cache_key, user.pk, ttl)
+            cache.set(AUTH_USER_CACHE_KEY.format(user.pk), user_snapshot(user), ttl)
+            return (user, token)
+
+        user = get_cached_user(user_pk)
+        if user is None:
+            raise AuthenticationFailed(_("User inactive or deleted."))
+        # an unsaved Token standing in for the row, which was not loaded
+        token = self.get_model()(key=key, user=user)
+        return (user, token)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that finds users through the shared cache (see
+    get_cached_user), so a repeat request makes no query.
+
+    With JWT_CLAIMS_USER_FOR_READS set, requests with a safe method get a
+    TokenUser built from the token's claims and do not touch the database
+    or the cache at all. The is_staff claim is set when the token is
+    issued (see BlangoTokenObtainPairSerializer), so it can be out of date
+    for as long as the access token lives.
+    """
+
+    def authenticate(self, request):
+        self.claims_user = (
+            settings.JWT_CLAIMS_USER_FOR_READS and request.method in SAFE_METHODS
+        )
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        if self.claims_user:
+            return jwt_settings.TOKEN_USER_CLASS(validated_token)
+
+        if jwt_settings.USER_ID_FIELD not in ("id", "pk"):
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User inactive or deleted."), code="user_inactive")
+        return user
+
+
+class HeaderDispatchAuthentication(BaseAuthentication):
+    """
+    Looks at the Authorization header scheme and the session cookie once
+    and runs only the authenticator that can match, instead of trying each
+    in turn. Requests with neither are anonymous without the session being
+    loaded or the database being queried.
+    """
+
+    basic_class = CachedBasicAuthentication
+    session_class = SessionAuthentication
+    token_class = CachedTokenAuthentication
+    jwt_class = CachedJWTAuthentication
+
+    def get_authenticator(self, request):
+        auth = get_authorization_header(request).split()
+        if auth:
+            scheme = auth[0].lower()
+            if scheme == b"basic":
+                return self.basic_class()
+            if scheme == self.token_class.keyword.lower().encode():
+                return self.token_class()
+            if scheme in {t.lower().encode() for t in jwt_settings.AUTH_HEADER_TYPES}:
+                return self.jwt_class()
+        if settings.SESSION_COOKIE_NAME in request.COOKIES:
+            return self.session_class()
+        return None
+
+    def authenticate(self, request):
+        authenticator = self.get_authenticator(request)
+        if authenticator is None:
+            return None
+        return authenticator.authenticate(request)
+
+    def authenticate_header(self, request):
+        return self.basic_class().authenticate_header(request)
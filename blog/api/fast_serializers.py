@@ -0,0 +1,131 @@
+"""
+A read-only path for serializing pages of posts, used by the post list,
+mine and tag posts actions instead of PostSerializer(many=True).
+
+PostSerializer builds and runs a field object for every field of every
+post, and loads each post's author and tags with their own queries. Here
+the posts are fetched as plain rows with post_rows(), their tags with one
+more query, and each row is turned into the same output PostSerializer
+gives:
+
+- plain values (id, title, slug, summary, content) are copied across,
+- dates are formatted by PostSerializer's own DateTimeField objects,
+- the author URL is worked out once per author, and
+- hero images fall back to PostSerializer's own field per row, since
+  their URLs depend on the files.
+
+The fields and their order come from PostSerializer. A field added to it
+that isn't a column in ROW_FIELDS needs handling here too; the comparison
+test in blog/test_post_api.py catches one that is missed.
+"""
+from rest_framework import serializers
+
+from blango_auth.models import User
+from blog.api.serializers import PostSerializer
+from blog.models import Post
+
+ROW_FIELDS = (
+    "id",
+    "author_id",
+    "author__email",
+    "created_at",
+    "modified_at",
+    "published_at",
+    "title",
+    "slug",
+    "summary",
+    "content",
+    "hero_image",
+    "ppoi",
+)
+
+# fields whose to_representation returns the value as it comes from the
+# database
+PASSTHROUGH_FIELDS = (serializers.CharField, serializers.SlugField, serializers.IntegerField)
+
+
+def post_rows(queryset):
+    """
+    The rows of a Post queryset as dicts, to be paginated and passed to
+    PostListSerializer.
+    """
+    return queryset.values(*ROW_FIELDS)
+
+
+def tags_by_post(post_ids):
+    # each post's tag values, ordered by value as Tag.Meta.ordering orders
+    # post.tags.all()
+    tags = {}
+    rows = (
+        Post.tags.through.objects.filter(post_id__in=post_ids)
+        .order_by("tag__value")
+        .values_list("post_id", "tag__value")
+    )
+    for post_id, value in rows:
+        tags.setdefault(post_id, []).append(value)
+    return tags
+
+
+class PostListSerializer:
+    """
+    Serializes rows from post_rows() as PostSerializer(many=True) would
+    serialize the posts. It is read-only; use PostSerializer for input.
+    """
+
+    def __init__(self, rows, context):
+        self.rows = rows
+        self.context = context
+
+    @property
+    def data(self):
+        rows = list(self.rows)
+        fields = PostSerializer(context=self.context).fields
+        tags = tags_by_post([row["id"] for row in rows])
+
+        author_field = fields["author"]
+        author_urls = {}
+
+        def author(row):
+            author_id = row["author_id"]
+            if author_id not in author_urls:
+                author_urls[author_id] = author_field.to_representation(
+                    User(pk=author_id, email=row["author__email"])
+                )
+            return author_urls[author_id]
+
+        hero_image_field = fields["hero_image"]
+        no_hero_image = hero_image_field.to_representation(Post().hero_image)
+
+        def hero_image(row):
+            if not row["hero_image"]:
+                return no_hero_image
+            post = Post(pk=row["id"], hero_image=row["hero_image"], ppoi=row["ppoi"])
+            return hero_image_field.to_representation(post.hero_image)
+
+        def tag_values(row):
+            return tags.get(row["id"], [])
+
+        def field_value(name, field):
+            if type(field) in PASSTHROUGH_FIELDS:
+                return lambda row: row[name]
+
+            def value(row):
+                value = row[name]
+                return None if value is None else field.to_representation(value)
+
+            return value
+
+        getters = []
+        for name, field in fields.items():
+            if field.write_only:
+                continue
+            if name == "author":
+                getters.append((name, author))
+            elif name == "hero_image":
+                getters.append((name, hero_image))
+            elif name == "tags":
+                getters.append((name, tag_values))
+            else:
+                getters.append((name, field_value(name, field)))
+
+        return [{name: getter(row) for name, getter in getters} for row in rows]
@@ -0,0 +1,47 @@
+"""
+Parsers matching the renderers in blog/api/renderers.py. orjson and msgpack
+are optional; settings.py only lists these parsers when the packages are
+installed.
+"""
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+from blog.api.renderers import MessagePackRenderer, ORJSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        try:
+            content = stream.read() if stream is not None else b""
+            if encoding.lower().replace("-", "") != "utf8":
+                content = content.decode(encoding).encode()
+            data = orjson.loads(content)
+        except (ValueError, UnicodeError) as exc:
+            raise ParseError("JSON parse error - %s" % str(exc))
+        return data
+
+
+class MessagePackParser(BaseParser):
+    media_type = "application/msgpack"
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read() if stream is not None else b"", raw=False)
+        except ValueError as exc:
+            raise ParseError("MessagePack parse error - %s" % str(exc))
@@ -0,0 +1,61 @@
+"""
+Faster and more compact alternatives to DRF's JSONRenderer. orjson and
+msgpack are optional; settings.py only lists these renderers when the
+packages are installed (see api_formats there).
+
+- ORJSONRenderer renders application/json with orjson, giving the same
+  output as JSONRenderer in a fraction of the time. The one difference is
+  with NaN and infinite floats, which JSONRenderer refuses to render and
+  orjson writes as null.
+- MessagePackRenderer renders application/msgpack, for clients that ask
+  for it in their Accept header or with ?format=msgpack.
+"""
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# DRF's encoder handles the types neither library does (lazy translations,
+# Decimal, querysets and so on), formatting them the way JSONRenderer does
+encode_default = JSONEncoder().default
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context) is not None or not self.compact:
+            # orjson can only indent by two spaces, so pretty printing (as
+            # in the browsable API) is left to JSONRenderer
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # non-string keys are turned into strings, as the json module does
+        ret = orjson.dumps(
+            data, default=encode_default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+        )
+        # as JSONRenderer does, so the output stays a strict javascript subset
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
@@ -0,0 +1,310 @@
+"""
+The OpenAPI schema served by the swagger routes in blog/api/urls.py.
+
+drf_yasg builds the schema by introspecting every view and serializer, so
+it is built once and the JSON and YAML documents are kept in memory,
+served with ETags so clients can revalidate them cheaply.
+
+The build_api_schema management command, which is also run at startup by
+blog.warmup.warm_up, writes the documents to API_SCHEMA_DIR along with a
+fingerprint of the URLconf they were built from. A process that finds
+documents there with a matching fingerprint loads them instead of building
+the schema again; when the URLconf has changed they are rebuilt. The
+fingerprint covers the routes and, for each view, its serializer's fields,
+its filters, pagination and parsers, the REST_FRAMEWORK setting and the
+source of the modules these are defined in, so a deploy that changes any
+of them rebuilds the schema.
+"""
+import functools
+import hashlib
+import inspect
+import logging
+import os
+import tempfile
+import threading
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.views.decorators.http import condition
+from rest_framework.request import Request
+
+logger = logging.getLogger(__name__)
+
+# drf_yasg is slow to import, so it is only imported once a schema has to be
+# built or the swagger UI is requested
+
+API_URL = f"https://{os.environ.get('CODIO_HOSTNAME')}-8000.codio.io/api/v1/"
+
+# file name: (content type, name of the drf_yasg.codecs class)
+SCHEMA_DOCUMENTS = {
+    "swagger.json": ("application/json", "OpenAPICodecJson"),
+    "swagger.yaml": ("application/yaml", "OpenAPICodecYaml"),
+}
+FINGERPRINT_FILE = "fingerprint"
+
+SchemaDocument = namedtuple("SchemaDocument", ["content", "content_type", "etag"])
+Schema = namedtuple("Schema", ["fingerprint", "documents"])
+
+_schema = None
+_schema_lock = threading.Lock()
+
+
+def urlconf_fingerprint(urlconf=None):
+    """
+    A digest of the URL patterns in urlconf and the views they point to.
+    """
+    # get_resolver returns the same resolver until the URLconf setting
+    # changes, so this is only worked out once per URLconf
+    return resolver_fingerprint(get_resolver(urlconf))
+
+
+@functools.lru_cache(maxsize=None)
+def source_digest(path):
+    # the source of a module a view, serializer or filter is defined in, so
+    # that changes get_fields() can't show, such as a get_serializer_class
+    # branch, still change the fingerprint
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except (OSError, TypeError):
+        return ""
+
+
+def class_description(cls):
+    if cls is None:
+        return ""
+    return f"{cls.__module__}.{cls.__qualname__}:{source_digest(inspect.getsourcefile(cls))}"
+
+
+def serializer_description(serializer_class, depth=0):
+    """
+    The serializer's fields, with their classes and, for nested serializers,
+    their own fields.
+    """
+    from rest_framework.serializers import BaseSerializer
+
+    description = [class_description(serializer_class)]
+    try:
+        fields = serializer_class().get_fields()
+    except Exception:
+        # a serializer that can't be built without arguments or context
+        return description
+    for name, field in fields.items():
+        description.append(f"{name}:{type(field).__qualname__}:{field.read_only}:{field.required}")
+        nested = getattr(field, "child", field)
+        if isinstance(nested, BaseSerializer) and depth < 3:
+            description.extend(serializer_description(type(nested), depth + 1))
+    return description
+
+
+def view_description(view):
+    """
+    What the schema of a view is built from: its serializer's fields, its
+    filters and pagination, and the source of the modules they come from.
+    """
+    serializer = getattr(view, "serializer_class", None)
+    filterset = getattr(view, "filterset_class", None)
+    description = [class_description(view)]
+    if serializer is not None:
+        description.extend(serializer_description(serializer))
+    description.append(class_description(filterset))
+    if filterset is not None:
+        description.append(repr(sorted(filterset.base_filters)))
+    for name in ("filter_backends", "pagination_class", "parser_classes", "renderer_classes"):
+        value = getattr(view, name, None)
+        if isinstance(value, (list, tuple)):
+            description.extend(class_description(cls) for cls in value)
+        elif isinstance(value, type):
+            description.append(class_description(value))
+    for name in ("filterset_fields", "ordering_fields", "search_fields"):
+        description.append(repr(getattr(view, name, None)))
+    return description
+
+
+@functools.lru_cache(maxsize=None)
+def resolver_fingerprint(resolver):
+    digest = hashlib.sha256()
+    # page sizes and the like are in the schema too
+    digest.update(repr(sorted(getattr(settings, "REST_FRAMEWORK", {}).items())).encode())
+
+    def walk(patterns, prefix):
+        for pattern in patterns:
+            route = prefix + str(pattern.pattern)
+            if isinstance(pattern, URLResolver):
+                walk(pattern.url_patterns, route)
+            elif isinstance(pattern, URLPattern):
+                callback = pattern.callback
+                view = getattr(callback, "cls", callback)
+                actions = getattr(callback, "actions", None) or {}
+                digest.update(
+                    "\0".join(
+                        [
+                            route,
+                            pattern.name or "",
+                            repr(sorted(actions.items())),
+                            *view_description(view),
+                        ]
+                    ).encode()
+                )
+                digest.update(b"\n")
+
+    walk(resolver.url_patterns, "")
+    return digest.hexdigest()
+
+
+def make_document(content, content_type):
+    return SchemaDocument(
+        content, content_type, '"{}"'.format(hashlib.sha256(content).hexdigest()[:32])
+    )
+
+
+def api_info():
+    from drf_yasg import openapi
+
+    return openapi.Info(
+        title="Blango API",
+        default_version="v1",
+        description="API for Blango Blog",
+    )
+
+
+def build_schema(fingerprint):
+    """
+    Introspect the API and encode the schema in every format.
+    """
+    from drf_yasg import codecs
+
+    # the views are introspected as if an anonymous user had asked for the
+    # schema, since their get_queryset methods expect a request
+    request = Request(RequestFactory().get(urlsplit(API_URL).path + "swagger.json"))
+    request.user = AnonymousUser()
+    generator = get_schema_view_class().generator_class(api_info(), url=API_URL)
+    swagger = generator.get_schema(request=request, public=True)
+    documents = {}
+    for name, (content_type, codec_name) in SCHEMA_DOCUMENTS.items():
+        try:
+            content = getattr(codecs, codec_name)(validators=[]).encode(swagger)
+        except Exception:
+            # e.g. the YAML codec with a ruamel.yaml it doesn't support; the
+            # other formats are still served
+            logger.exception("Could not encode %s", name)
+            continue
+        documents[name] = make_document(content, content_type)
+    return Schema(fingerprint, documents)
+
+
+def read_schema(directory, fingerprint):
+    # the documents written by write_schema, if they were built from the
+    # same URLconf
+    try:
+        with open(os.path.join(directory, FINGERPRINT_FILE)) as f:
+            if f.read().strip() != fingerprint:
+                return None
+    except OSError:
+        return None
+    documents = {}
+    for name, (content_type, _) in SCHEMA_DOCUMENTS.items():
+        try:
+            with open(os.path.join(directory, name), "rb") as f:
+                documents[name] = make_document(f.read(), content_type)
+        except FileNotFoundError:
+            pass
+    return Schema(fingerprint, documents)
+
+
+def write_schema(schema, directory):
+    os.makedirs(directory, exist_ok=True)
+    for name in SCHEMA_DOCUMENTS.keys() - schema.documents.keys():
+        # don't leave a document from an older schema behind
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+    files = [(name, document.content) for name, document in schema.documents.items()]
+    # the fingerprint goes last, so a partly written set is never loaded
+    files.append((FINGERPRINT_FILE, schema.fingerprint.encode()))
+    for name, content in files:
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{name}.")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(temp_path, os.path.join(directory, name))
+
+
+def get_schema(directory=None, write=False, force=False):
+    """
+    The current schema: from memory, from the documents in directory
+    (API_SCHEMA_DIR by default) or freshly built. With write, a freshly
+    built schema is written to directory. With force it is always built.
+    """
+    global _schema
+    directory = directory or settings.API_SCHEMA_DIR
+    fingerprint = urlconf_fingerprint()
+    with _schema_lock:
+        schema = _schema
+        if force or schema is None or schema.fingerprint != fingerprint:
+            schema = None if force or not directory else read_schema(directory, fingerprint)
+            if schema is None:
+                logger.info("Building the API schema")
+                schema = build_schema(fingerprint)
+                if write and directory:
+                    write_schema(schema, directory)
+            _schema = schema
+    return schema
+
+
+def get_document(name):
+    document = get_schema().documents.get(name)
+    if document is None:
+        raise Http404(f"{name} is not available")
+    return document
+
+
+def schema_etag(request, name):
+    return get_document(name).etag
+
+
+@condition(etag_func=schema_etag)
+def schema_document(request, name):
+    document = get_document(name)
+    return HttpResponse(document.content, content_type=document.content_type)
+
+
+def schema_format_view(request, format):
+    # serves the ^swagger(?P<format>\.json|\.yaml)$ route
+    return schema_document(request, "swagger" + format)
+
+
+@functools.lru_cache(maxsize=None)
+def get_schema_view_class():
+    from drf_yasg.renderers import SwaggerYAMLRenderer, _SpecRenderer
+    from drf_yasg.views import get_schema_view
+
+    class CachedSchemaView(get_schema_view(api_info(), url=API_URL, public=True)):
+        """
+        drf_yasg's schema view, with the schema itself (requested by the UI
+        as ?format=openapi) served from get_schema() instead of being rebuilt.
+        """
+
+        def get(self, request, version="", format=None):
+            renderer = request.accepted_renderer
+            if isinstance(renderer, _SpecRenderer):
+                name = "swagger.yaml" if isinstance(renderer, SwaggerYAMLRenderer) else "swagger.json"
+                return schema_document(request._request, name)
+            return super().get(request, version, format)
+
+    return CachedSchemaView
+
+
+@functools.lru_cache(maxsize=None)
+def get_swagger_ui_view():
+    return get_schema_view_class().with_ui("swagger", cache_timeout=0)
+
+
+def swagger_ui_view(request, *args, **kwargs):
+    # serves the swagger/ route
+    return get_swagger_ui_view()(request, *args, **kwargs)
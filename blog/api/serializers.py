@@ -1,21 +1,83 @@
 from rest_framework import serializers
+from rest_framework.exceptions import Throttled
 from blog.models import Post, Tag, Comment
 from blango_auth.models import User
+from blog.comments import first_comment_page
+from blog.intake import CommentRejected, check_comment, duplicate_key, remember_comment
 from versatileimagefield.serializers import VersatileImageFieldSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from django.conf import settings
+from django.urls import get_script_prefix, get_urlconf, reverse
+from django.utils.encoding import iri_to_uri
+from urllib.parse import quote
 import datetime
+import functools
 import logging
 logger = logging.getLogger(__name__)
 
+#stands in for the lookup value when a URL template is made by reversing
+URL_TEMPLATE_SENTINEL = "blango-lookup-value-0f3c9a"
+
+@functools.lru_cache(maxsize=1024)
+def url_template(view_name, lookup_url_kwarg, format, scheme_host, script_prefix, urlconf):
+    #The absolute URL for view_name with the sentinel as the lookup value.
+    #script_prefix and urlconf aren't used directly, but reverse depends on them.
+    kwargs = {lookup_url_kwarg: URL_TEMPLATE_SENTINEL}
+    if format is not None:
+        kwargs["format"] = format
+    #as HttpRequest.build_absolute_uri does for a path
+    return scheme_host + reverse(view_name, kwargs=kwargs).replace("//", "/")
+
+class CachedHyperlinkedRelatedField(serializers.HyperlinkedRelatedField):
+    #A HyperlinkedRelatedField that makes links by putting the lookup value into
+    #a URL template, reversed once per view name, format, host and URLconf,
+    #instead of reversing the URL for every object. Lookup values that can't be
+    #put in a template, and API versioning, go through the normal path.
+    def get_url(self, obj, view_name, request, format):
+        if hasattr(obj, "pk") and obj.pk in (None, ""):
+            return None
+        lookup_value = str(getattr(obj, self.lookup_field))
+        if (
+            not lookup_value
+            or "/" in lookup_value
+            or request is None
+            or getattr(request, "versioning_scheme", None) is not None
+        ):
+            return super().get_url(obj, view_name, request, format)
+
+        template = url_template(
+            view_name,
+            self.lookup_url_kwarg,
+            format,
+            f"{request.scheme}://{request.get_host()}",
+            get_script_prefix(),
+            get_urlconf() or settings.ROOT_URLCONF,
+        )
+        #quoted as reverse quotes the values it puts in a URL
+        value = quote(lookup_value, safe="!$&'()*+,;=/~:@")
+        return iri_to_uri(template.replace(URL_TEMPLATE_SENTINEL, value))
+
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = "__all__"
+        read_only_fields = ["post_count"]
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ["first_name", "last_name", "email"]
 
+class BlangoTokenObtainPairSerializer(TokenObtainPairSerializer):
+    #Adds an is_staff claim so that blog.api.authentication.CachedJWTAuthentication
+    #can build a TokenUser that knows whether the user is staff without loading
+    #the user (see JWT_CLAIMS_USER_FOR_READS in settings.py).
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token["is_staff"] = user.is_staff
+        return token
+
 class CommentSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(required=False)
     creator = UserSerializer(read_only=True)
@@ -25,6 +87,13 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = ["id", "creator", "content", "modified_at", "created_at"]
         readonly = ["modified_at", "created_at"]
 
+class FirstCommentsSerializer(serializers.ListSerializer):
+    #Serializes only the first page of a post's comments (see blog/comments.py);
+    #PostDetailSerializer.comments_next links to the rest. Written comments are
+    #still validated as a list.
+    def get_attribute(self, instance):
+        return first_comment_page(instance)[0]
+
 class TagField(serializers.SlugRelatedField):
     def to_internal_value(self, data):
         try:
@@ -63,12 +132,10 @@ class PostSerializer(serializers.ModelSerializer):
         read_only=True,
     )
 
-    author = serializers.HyperlinkedRelatedField(
+    author = CachedHyperlinkedRelatedField(
         queryset=User.objects.all(), view_name="api_user_detail", lookup_field="email"
     )
-    logger.debug("in serializers.py class PostSerializer and type of tags is %s",type(tags))
     #logger.debug(dir(tags))
-    logger.debug("in serializers.py class PostSerializer and author is %s",author)
     #logger.debug(dir(author))
     class Meta:
         model = Post
@@ -88,7 +155,8 @@ class TagField(serializers.SlugRelatedField):
 """
 
 class PostDetailSerializer(PostSerializer):
-    comments = CommentSerializer(many=True)
+    comments = FirstCommentsSerializer(child=CommentSerializer())
+    comments_next = serializers.SerializerMethodField()
     hero_image = VersatileImageFieldSerializer(
         sizes=[
             ("full_size", "url"),
@@ -98,10 +166,37 @@ class PostDetailSerializer(PostSerializer):
         read_only=True,
     )
     
+    def get_comments_next(self, instance):
+        #the URL of the posts/<pk>/comments page after the comments included
+        cursor = first_comment_page(instance)[1]
+        if cursor is None:
+            return None
+        url = reverse("post-comments", kwargs={"pk": instance.pk})
+        return self.context["request"].build_absolute_uri(f"{url}?cursor={cursor}")
+
     def update(self, instance, validated_data):
         logger.debug("in serializers.PostDetailSerializer.update validated_data is")
         logger.debug(validated_data)
         comments = validated_data.pop("comments")
+        #new comments go through the same checks as on the post page (see
+        #blog/intake.py) before anything is written, and are remembered for the
+        #duplicate check only once saved, so a rejected request can be sent again
+        request = self.context["request"]
+        new_comments = set()
+        for comment_data in comments:
+            if comment_data.get("id"):
+                continue
+            content = comment_data.get("content", "")
+            try:
+                key = duplicate_key(request.user.pk, instance.pk, content)
+                if key in new_comments:
+                    raise CommentRejected("You have already posted this comment.")
+                new_comments.add(key)
+                check_comment(request.user, request.META.get("REMOTE_ADDR"), instance, content)
+            except CommentRejected as e:
+                if e.wait is not None:
+                    raise Throttled(wait=e.wait, detail=str(e))
+                raise serializers.ValidationError({"comments": [str(e)]})
         logger.debug("in serializers.PostDetailSerializer.update comments is")
         logger.debug(comments)
         logger.debug("instance is %s",instance)
@@ -148,5 +243,6 @@ class PostDetailSerializer(PostSerializer):
             logger.debug("Broker is a skunk not a stock broker")
             logger.debug("comment.content_object is %s",comment.content_object)
             comment.save()
+            remember_comment(self.context["request"].user, instance, comment.content)
 
         return instance
\ No newline at end of file
@@ -5,9 +5,7 @@ from rest_framework.urlpatterns import format_suffix_patterns
 from rest_framework.authtoken import views
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-from drf_yasg import openapi
-from drf_yasg.views import get_schema_view
-import os
+from blog.api.schema import schema_format_view, swagger_ui_view
 
 #from blog.api.views import PostList, PostDetail, UserDetail
 from blog.api.views import PostList, PostDetail, UserDetail, TagViewSet
@@ -128,16 +126,6 @@ router.register("posts", PostViewSet) #per router.register("posts",PostViewSet),
                                       #need to do is register the appropriate view sets with a router, and let it do the rest. ..."
 #router.register("exprm", ExprmntViewSet)
 
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Blango API",
-        default_version="v1",
-        description="API for Blango Blog",
-    ),
-    url=f"https://{os.environ.get('CODIO_HOSTNAME')}-8000.codio.io/api/v1/",
-    public=True,
-)
-
 urlpatterns = [
     #path("posts/", PostList.as_view(), name="api_post_list"),
     #path("posts/<int:pk>", PostDetail.as_view(), name="api_post_detail"),
@@ -151,14 +139,15 @@ urlpatterns += [
     path("token-auth/", views.obtain_auth_token),
     path("jwt/", TokenObtainPairView.as_view(), name="jwt_obtain_pair"),
     path("jwt/refresh/", TokenRefreshView.as_view(), name="jwt_refresh"),
+    #the schema is built once and served from memory, see blog/api/schema.py
     re_path(
         r"^swagger(?P<format>\.json|\.yaml)$",
-        schema_view.without_ui(cache_timeout=0),
+        schema_format_view,
         name="schema-json",
     ),
     path(
         "swagger/",
-        schema_view.with_ui("swagger", cache_timeout=0),
+        swagger_ui_view,
         name="schema-swagger-ui",
     ),
 ]
@@ -2,7 +2,6 @@ from rest_framework import generics, viewsets
 from django.db.models import Q
 from django.utils import timezone
 
-from datetime import timedelta
 from django.http import Http404
 from django.utils.decorators import classonlymethod
 
@@ -13,7 +12,16 @@ from blog.api.serializers import (
     UserSerializer,
     PostDetailSerializer,
     TagSerializer,
+    CommentSerializer,
 )
+from blog.api.fast_serializers import PostListSerializer, post_rows
+from blog.analytics import post_stats, record_view
+from blog.archive import ARCHIVE_PERIODS, archive, time_window
+from blog.caching import POPULAR_TAGS_COUNT, get_popular_tags
+from blog.comments import comment_page
+from blog.related import get_related_posts
+from blog.tags import tag_index, with_cloud_weights
+from blog.trending import get_trending_post_ids
 from blog.models import Post, Tag
 #from blog.api.permissions import AuthorModifyOrReadOnly
 from blog.api.permissions import AuthorModifyOrReadOnly, IsAdminUserForObject
@@ -25,15 +33,27 @@ from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
 from django.views.decorators.vary import vary_on_headers, vary_on_cookie
 
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
 
 from blog.api.filters import PostFilterSet
 
-from django.urls import resolve
+from django.urls import resolve, reverse
 
 import logging
 logger = logging.getLogger(__name__)
 
+
+def post_list_response(view, posts, context):
+    """
+    A (paginated) response listing posts as PostSerializer(many=True) would,
+    through the read-only path in blog/api/fast_serializers.py.
+    """
+    rows = post_rows(posts)
+    page = view.paginate_queryset(rows)
+    if page is not None:
+        return view.get_paginated_response(PostListSerializer(page, context=context).data)
+    return Response(PostListSerializer(rows, context=context).data)
+
 """
 class PostList below extends generics.ListCreateAPIView which in turn 
 extends generics.GenericAPIView as well as mixins.ListModelMixin and 
@@ -66,7 +86,6 @@ class PostList(generics.ListCreateAPIView) are:
 """
 
 class PostList(generics.ListCreateAPIView):
-    logger.debug("in blog.api.views.PostList")
     queryset = Post.objects.all()
     serializer_class = PostSerializer
 
@@ -153,7 +172,6 @@ urlpatterns = [
 
 class PostDetail(generics.RetrieveUpdateDestroyAPIView):
     #permission_classes = [AuthorModifyOrReadOnly]
-    logger.debug("in blog.api.views.PostDetail")
     permission_classes = [AuthorModifyOrReadOnly | IsAdminUserForObject]
     queryset = Post.objects.all()
     #serializer_class = PostSerializer
@@ -322,7 +340,6 @@ class UserDetail(generics.RetrieveAPIView):
 
     lookup_field = "email"
     queryset = User.objects.all()
-    logger.debug("In blog.api.views.UserDetail berore def get")
     #logger.debug("queryset[0] and queryset[1] are")
     #logger.debug(queryset[0])
     #logger.debug(queryset[1])
@@ -389,7 +406,6 @@ class ExprmntViewSet(viewsets.ModelViewSet):
     #TypeError: as_view() takes 1 positional argument but 2 were given
     #I was unable to determine why this error occurs; therefore, to keep this error from occuring 
     #in blog.api.urls.py I commented out router.register("exprm", ExprmntViewSet)
-    logger.debug("At top of class ExprmntViewSet")
     lookup_field = "email"
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -427,6 +443,35 @@ class TagViewSet(viewsets.ModelViewSet):
         logger.debug("about to execute return super().dispatch(request, *args, **kwargs)")
         return super().dispatch(request, *args, **kwargs)
 
+    @action(methods=["get"], detail=False, name="Most used Tags")
+    def popular(self, request):
+        #The ?limit= (default 20, at most POPULAR_TAGS_COUNT) tags on the most posts,
+        #with a weight from 1 to 5 for sizing them in a tag cloud. The list comes
+        #from the cache in blog/caching.py, ordered by the Tag.post_count counts.
+        try:
+            limit = int(request.query_params.get("limit", 20))
+        except ValueError:
+            raise ValidationError({"limit": "should be a whole number"})
+        limit = max(1, min(limit, POPULAR_TAGS_COUNT))
+        return Response(with_cloud_weights(get_popular_tags(limit)))
+
+    @action(methods=["get"], detail=False, name="Tags starting with")
+    def autocomplete(self, request):
+        #The tags whose value starts with ?q=, ignoring case, alphabetically; at
+        #most ?limit= (default 10, at most 50) of them. They are looked up in the
+        #in-memory prefix index in blog/tags.py, not the database.
+        prefix = request.query_params.get("q", "").strip()
+        try:
+            limit = int(request.query_params.get("limit", 10))
+        except ValueError:
+            raise ValidationError({"limit": "should be a whole number"})
+        limit = max(1, min(limit, 50))
+        if not prefix:
+            return Response([])
+        return Response(
+            [{"id": pk, "value": value} for pk, value in tag_index.search(prefix, limit)]
+        )
+
     @action(methods=["get"], detail=True, name="Posts with the Tag")
     def posts(self, request, pk=None):
         logger.debug("in blog.api.views.TagViewSet.posts and request.META is")
@@ -569,21 +614,12 @@ class TagViewSet(viewsets.ModelViewSet):
         I hope this experience can help you guys out there. And hopefully the staff is 
         going to alter the code.'
         """
-        page = self.paginate_queryset(tag.posts.all())
         #page = self.paginate_queryset(tag.posts) bad code from Course 3 Module1 Guide
 
         #See JB Note below in class PostViewSet def mine() that describes why it
-        #it is necessary to include context={"request": request} in the below
-        #instatiations of PostSerializer.
-        if page is not None:
-            post_serializer = PostSerializer(
-                page, many=True, context={"request": request}
-            )
-            return self.get_paginated_response(post_serializer.data) 
-        post_serializer = PostSerializer(
-            tag.posts, many=True, context={"request": request}
-        )
-        return Response(post_serializer.data)
+        #it is necessary to include context={"request": request} when serializing
+        #the posts.
+        return post_list_response(self, tag.posts.all(), {"request": request})
 
     @method_decorator(cache_page(300))
     def list(self, *args, **kwargs):
@@ -657,7 +693,6 @@ class PostViewSet(viewsets.ModelViewSet):
 
     """
     queryset = Post.objects.all()
-    logger.debug("At top of blog.api.views.PostViewSet and queryset is %s",queryset)
     #filterset_fields = ["author", "tags"] commented out as now using PostFilterSet for customization
     filterset_class = PostFilterSet
     ordering_fields = ["published_at", "author", "title", "slug"]
@@ -688,8 +723,10 @@ class PostViewSet(viewsets.ModelViewSet):
            ) | User.objects.filter(last_name__startswith='D')
           see https://books.agiliq.com/projects/django-orm-cookbook/en/latest/query_relatedtool.html
           """
+          #author is compared by pk so that request.user can also be a TokenUser
+          #built from JWT claims (see JWT_CLAIMS_USER_FOR_READS in settings.py)
           queryset = self.queryset.filter(
-            Q(published_at__lte=timezone.now()) | Q(author=self.request.user)
+            Q(published_at__lte=timezone.now()) | Q(author=self.request.user.pk)
           )
 
         time_period_name = self.kwargs.get("period_name")
@@ -698,21 +735,19 @@ class PostViewSet(viewsets.ModelViewSet):
             # no further filtering required
             return queryset
 
-        if time_period_name == "new":
-            return queryset.filter(
-                published_at__gte=timezone.now() - timedelta(hours=1)
-            )
-        elif time_period_name == "today":
-            return queryset.filter(
-                published_at__date=timezone.now().date(),
-            )
-        elif time_period_name == "week":
-            return queryset.filter(published_at__gte=timezone.now() - timedelta(days=7))
-        else:
+        #the windows are half-open datetime ranges (see blog/archive.py) so that
+        #they are looked up in the published_at index
+        try:
+            start, end = time_window(time_period_name)
+        except ValueError:
             raise Http404(
                 f"Time period {time_period_name} is not valid, should be "
                 f"'new', 'today' or 'week'"
             )
+        queryset = queryset.filter(published_at__gte=start)
+        if end is not None:
+            queryset = queryset.filter(published_at__lt=end)
+        return queryset
 
     def get_serializer_class(self):
         logger.debug("at top of blog.api.views.get_serializer_class and self.action is %s",self.action)
@@ -737,9 +772,7 @@ class PostViewSet(viewsets.ModelViewSet):
     def mine(self, request):
         if request.user.is_anonymous:
             raise PermissionDenied("You must be logged in to see which Posts are yours")
-        posts = self.get_queryset().filter(author=request.user)
-
-        page = self.paginate_queryset(posts)
+        posts = self.get_queryset().filter(author=request.user.pk)
 
         """
         JB Note
@@ -759,14 +792,7 @@ class PostViewSet(viewsets.ModelViewSet):
         queryset=User.objects.all(), view_name="api_user_detail", lookup_field="email")
         """
 
-        if page is not None:
-            serializer = PostSerializer(page, many=True, context={"request": request})
-            #serializer = PostSerializer(page, many=True) 
-            return self.get_paginated_response(serializer.data)
-
-        serializer = PostSerializer(posts, many=True, context={"request": request})
-        #serializer = PostSerializer(posts, many=True)
-        return Response(serializer.data)
+        return post_list_response(self, posts, {"request": request})
 
     """
     @method_decorator(cache_page(120))
@@ -774,14 +800,92 @@ class PostViewSet(viewsets.ModelViewSet):
         return super(PostViewSet, self).list(*args, **kwargs)
     """
 
+    def retrieve(self, request, *args, **kwargs):
+        #As rest_framework.mixins.RetrieveModelMixin.retrieve, counting the view
+        #in memory (see blog/analytics.py) once the post is known to be visible.
+        instance = self.get_object()
+        record_view(instance.pk)
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
+
+    @action(methods=["get"], detail=True, name="Post view statistics")
+    def stats(self, request, pk=None):
+        #The post's total views, its views in the last 24 hours and its trending
+        #score, read from the counts written by blog/analytics.py.
+        post = self.get_object()
+        return Response(post_stats(post.pk))
+
+    @action(methods=["get"], detail=True, name="Post Comments")
+    def comments(self, request, pk=None):
+        #A page of the post's comments, oldest first, after ?cursor= (the first
+        #page without one). Keyset paged (see blog/comments.py), so a page
+        #costs the same however many comments the post has.
+        post = self.get_object()
+        try:
+            comments, cursor = comment_page(post, request.query_params.get("cursor"))
+        except ValueError:
+            raise ValidationError({"cursor": "is not valid"})
+        next_url = None
+        if cursor is not None:
+            next_url = request.build_absolute_uri(
+                f"{reverse('post-comments', kwargs={'pk': post.pk})}?cursor={cursor}"
+            )
+        return Response(
+            {
+                "next": next_url,
+                "results": CommentSerializer(
+                    comments, many=True, context=self.get_serializer_context()
+                ).data,
+            }
+        )
+
+    @action(methods=["get"], detail=False, name="Trending Posts")
+    def trending(self, request):
+        #Pages through the ranked post ids stored by the rank_trending_posts
+        #command (see blog/trending.py) and loads only the posts on the page, so
+        #the cost does not grow with the number of posts.
+        ranked = get_trending_post_ids()
+        page = self.paginate_queryset(ranked)
+        page_ids = ranked if page is None else page
+        rows = {row["id"]: row for row in post_rows(self.get_queryset().filter(pk__in=page_ids))}
+        data = PostListSerializer(
+            [rows[pk] for pk in page_ids if pk in rows], context=self.get_serializer_context()
+        ).data
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+    @action(methods=["get"], detail=True, name="Related Posts")
+    def related(self, request, pk=None):
+        #The posts most similar to this one, most similar first, from the neighbours
+        #stored ahead of time by blog/related.py. Only posts the user can see are
+        #listed.
+        post = self.get_object()
+        related_ids = [p["pk"] for p in get_related_posts(post)]
+        rows = {
+            row["id"]: row
+            for row in post_rows(self.get_queryset().filter(pk__in=related_ids))
+        }
+        rows = [rows[pk] for pk in related_ids if pk in rows]
+        return Response(PostListSerializer(rows, context=self.get_serializer_context()).data)
+
+    @action(methods=["get"], detail=False, name="Post counts by day or month")
+    def archive(self, request):
+        #One entry per day or month (?period=day, default month) with published
+        #posts, newest first, read from the counts kept in PostArchiveBucket
+        #rather than by counting the posts. See blog/archive.py.
+        period = request.query_params.get("period", "month")
+        if period not in ARCHIVE_PERIODS:
+            raise ValidationError(
+                {"period": f"should be one of {', '.join(ARCHIVE_PERIODS)}"}
+            )
+        return Response(archive(period))
+
     @method_decorator(cache_page(120))
     @method_decorator(vary_on_headers("Authorization", "Cookie"))
     def list(self, *args, **kwargs):
-        logger.debug("in views.PostViewSet.list about to call super(PostViewSet,self).list")
-        logger.debug("super(PostViewSet,self) is viewsets.ModelViewSet")
-        return super(PostViewSet, self).list(*args, **kwargs) #super is viewsets.ModelViewSet which for the list method relies                                                              #relies on the list method in class rest_framework.mixins.ListModelMixin
-                                                              #on the list method in class rest_framework.mixins.ListModelMixin.
-                                                              #See the code for class rest_framework.mixins.ModelViewSet.
-                                                              #A usefuel doc is:
-                                                              #https://www.cdrf.co/3.1/rest_framework.viewsets/ModelViewSet.html
-                                                              #
\ No newline at end of file
+        #Serializes the same as the list method of rest_framework.mixins.ListModelMixin
+        #(which ModelViewSet uses) would with PostSerializer, but through the faster
+        #read only path in blog/api/fast_serializers.py.
+        queryset = self.filter_queryset(self.get_queryset())
+        return post_list_response(self, queryset, self.get_serializer_context())
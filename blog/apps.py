@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class BlogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blog'
+
+    def ready(self):
+        # importing the module connects the receivers it defines
+        import blog.signals
+        import blog.checks  # noqa: F401, registers the system checks
@@ -0,0 +1,154 @@
+"""
+Time windows for the posts/by-time API route, and the per-day and
+per-month post counts behind the posts/archive route.
+
+The windows are half-open datetime ranges (start <= published_at < end) so
+they are answered from the published_at index, rather than by comparing a
+date function of every row.
+
+The counts are kept in PostArchiveBucket, keyed by the day or month of
+each post's published_at in TIME_ZONE. The receivers in blog/signals.py
+move a post between buckets as it is saved or deleted, so listing the
+archive reads one row per bucket instead of counting posts. Changes that
+bypass the signals (QuerySet.update(), raw SQL) can be repaired with the
+rebuild_post_archive management command.
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from blog.models import Post, PostArchiveBucket
+
+TIME_PERIODS = ("new", "today", "week")
+ARCHIVE_PERIODS = (PostArchiveBucket.DAY, PostArchiveBucket.MONTH)
+
+
+def start_of_day(day):
+    # midnight at the start of day in the current time zone
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def time_window(period_name, now=None):
+    """
+    The (start, end) of the by-time period period_name, where end is None
+    for a window that is open ended. Raises ValueError for an unknown name.
+    """
+    now = now or timezone.now()
+    if period_name == "new":
+        return now - timedelta(hours=1), None
+    if period_name == "today":
+        today = timezone.localdate(now)
+        return start_of_day(today), start_of_day(today + timedelta(days=1))
+    if period_name == "week":
+        return now - timedelta(days=7), None
+    raise ValueError(f"Unknown time period {period_name!r}")
+
+
+def bucket_starts(published_at):
+    """
+    The start of the day and month buckets a post published at
+    published_at is counted in.
+    """
+    day = timezone.localdate(published_at)
+    return {PostArchiveBucket.DAY: day, PostArchiveBucket.MONTH: day.replace(day=1)}
+
+
+def bucket_end(period, start):
+    if period == PostArchiveBucket.DAY:
+        return start + timedelta(days=1)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def adjust_buckets(published_at, delta):
+    """
+    Add delta to the counts of the buckets published_at falls in.
+    """
+    for period, start in bucket_starts(published_at).items():
+        buckets = PostArchiveBucket.objects.filter(period=period, start=start)
+        if delta < 0:
+            # a bucket is never taken below zero, which post_count (a
+            # positive integer) would refuse, e.g. when a rebuild raced with
+            # a delete: one that would reach zero or less is deleted instead
+            buckets.filter(post_count__lte=-delta).delete()
+            buckets.filter(post_count__gt=-delta).update(post_count=F("post_count") + delta)
+            continue
+        if buckets.update(post_count=F("post_count") + delta):
+            continue
+        try:
+            with transaction.atomic():
+                PostArchiveBucket.objects.create(period=period, start=start, post_count=delta)
+        except IntegrityError:
+            # created by another process since the update above
+            buckets.update(post_count=F("post_count") + delta)
+
+
+def move_post(old_published_at, new_published_at):
+    """
+    Update the buckets for a post whose published_at changed from
+    old_published_at to new_published_at, either of which may be None.
+    """
+    if old_published_at is not None and new_published_at is not None:
+        if bucket_starts(old_published_at) == bucket_starts(new_published_at):
+            return
+    if old_published_at is not None:
+        adjust_buckets(old_published_at, -1)
+    if new_published_at is not None:
+        adjust_buckets(new_published_at, 1)
+
+
+def count_buckets(published_ats):
+    counts = Counter()
+    for published_at in published_ats:
+        for period, start in bucket_starts(published_at).items():
+            counts[period, start] += 1
+    return counts
+
+
+@transaction.atomic
+def rebuild_buckets():
+    """
+    Recount every bucket from the posts. Returns the number of buckets.
+    """
+    counts = count_buckets(
+        Post.objects.exclude(published_at=None)
+        .values_list("published_at", flat=True)
+        .iterator()
+    )
+    PostArchiveBucket.objects.all().delete()
+    PostArchiveBucket.objects.bulk_create(
+        PostArchiveBucket(period=period, start=start, post_count=count)
+        for (period, start), count in counts.items()
+    )
+    return len(counts)
+
+
+def archive(period, now=None):
+    """
+    The buckets of period ("day" or "month") with published posts, newest
+    first, as dicts with the keys period, start, end and post_count.
+
+    Posts scheduled for the future are counted in their buckets as soon as
+    they are saved; they are taken back out here, which costs one query
+    over the (few) posts with a published_at after now.
+    """
+    now = now or timezone.now()
+    scheduled = count_buckets(
+        Post.objects.filter(published_at__gt=now).values_list("published_at", flat=True)
+    )
+    buckets = []
+    rows = PostArchiveBucket.objects.filter(period=period).order_by("-start")
+    for start, post_count in rows.values_list("start", "post_count"):
+        post_count -= scheduled[period, start]
+        if post_count > 0:
+            buckets.append(
+                {
+                    "period": period,
+                    "start": start,
+                    "end": bucket_end(period, start),
+                    "post_count": post_count,
+                }
+            )
+    return buckets
@@ -0,0 +1,113 @@
+"""
+Async versions of the read-only blog views, used by the Asgi configuration
+through blango/asgi_urls.py.
+
+Under ASGI every synchronous view is run through sync_to_async on the one
+thread that Django keeps for sync code, so requests that only need a page
+that is already in the cache still queue up behind slower ones. The views
+built by async_read_view answer anonymous GET and HEAD requests whose page
+is already cached (by the cache_page decorators on the sync views) without
+going through that thread, and hand everything else, including all writes
+and authenticated requests, to the sync view unchanged.
+
+Only views with a page cache are wrapped. post_detail has none (it counts
+each view and shows the comment form), so wrapping it would only add a
+hop; blango/asgi_urls.py leaves it to the sync view.
+
+Django 3.2 has no async ORM or async cache API, so the cache lookup runs in
+a pooled thread (thread_sensitive=False) that does not touch the database
+and can overlap with other requests. On Django versions with an async cache
+API the lookup is awaited directly instead.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches, DEFAULT_CACHE_ALIAS
+from django.utils.cache import get_cache_key
+
+import blog.views
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ("GET", "HEAD")
+
+
+def is_anonymous_read(request):
+    """
+    True for a GET or HEAD request that carries no credentials at all, so
+    the response cannot depend on who is asking.
+    """
+    return (
+        request.method in SAFE_METHODS
+        and "HTTP_AUTHORIZATION" not in request.META
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+    )
+
+
+def get_cached_page(request):
+    """
+    Look up the response that cache_page stored for this request, the same
+    way django.middleware.cache.FetchFromCacheMiddleware does. cache_page
+    uses the default cache and an empty key prefix unless told otherwise.
+    """
+    cache = caches[DEFAULT_CACHE_ALIAS]
+    cache_key = get_cache_key(request, "", "GET", cache=cache)
+    if cache_key is None:
+        return None
+    response = cache.get(cache_key)
+    if response is None and request.method == "HEAD":
+        cache_key = get_cache_key(request, "", "HEAD", cache=cache)
+        response = cache.get(cache_key)
+    return response
+
+
+async def aget_cached_page(request):
+    cache = caches[DEFAULT_CACHE_ALIAS]
+    if not hasattr(cache, "aget"):
+        return await sync_to_async(get_cached_page, thread_sensitive=False)(request)
+
+    cache_key = get_cache_key(request, "", "GET", cache=cache)
+    if cache_key is None:
+        return None
+    response = await cache.aget(cache_key)
+    if response is None and request.method == "HEAD":
+        cache_key = get_cache_key(request, "", "HEAD", cache=cache)
+        response = await cache.aget(cache_key)
+    return response
+
+
+def async_read_view(view, check_request=None):
+    """
+    Wrap the sync view function view in an async view that serves cached
+    pages to anonymous readers directly and delegates everything else.
+
+    check_request, if given, is called with the request and the view's
+    arguments before a cached page is returned (for example to apply API
+    throttling). It returns None to let the page be served, or the response
+    to return instead, such as a throttled one; the request is then not
+    handed to the sync view, which would check it again.
+    """
+    sync_view = sync_to_async(view)
+
+    async def async_view(request, *args, **kwargs):
+        if is_anonymous_read(request):
+            response = await aget_cached_page(request)
+            if response is not None:
+                if check_request is not None:
+                    denied = await sync_to_async(check_request, thread_sensitive=False)(
+                        request, *args, **kwargs
+                    )
+                    if denied is not None:
+                        return denied
+                logger.debug("Served %s from the page cache", request.path)
+                return response
+        return await sync_view(request, *args, **kwargs)
+
+    async_view.__name__ = view.__name__
+    async_view.__doc__ = view.__doc__
+    async_view.csrf_exempt = getattr(view, "csrf_exempt", False)
+    return async_view
+
+
+index = async_read_view(blog.views.index)
@@ -0,0 +1,148 @@
+"""
+Shared, cached data used when rendering blog pages.
+
+The helpers in this module keep small pieces of data that appear on many
+pages in Django's cache, so rendering a page does not have to query for
+them every time. The cache entries are invalidated by the receivers in
+blog/signals.py whenever the underlying rows change.
+"""
+import logging
+import math
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.html import format_html
+
+from blog.models import Post, Tag
+
+logger = logging.getLogger(__name__)
+
+RECENT_POSTS_CACHE_KEY = "blog_recent_posts"
+RECENT_POSTS_COUNT = 6
+AUTHOR_BYLINE_CACHE_KEY = "blog_author_byline_{}"
+POPULAR_TAGS_CACHE_KEY = "blog_popular_tags"
+POPULAR_TAGS_COUNT = 100
+
+
+def get_recent_posts():
+    """
+    Return the most recently published posts as a list of dicts with the
+    keys pk, slug and title, newest first.
+
+    One more post than RECENT_POSTS_COUNT is kept so that a page can drop
+    the post it is displaying and still show RECENT_POSTS_COUNT entries.
+    The list is shared by every page and only rebuilt after a post is
+    saved or deleted, or when a post scheduled for the future goes live.
+    """
+    posts = cache.get(RECENT_POSTS_CACHE_KEY)
+    if posts is not None:
+        return posts
+
+    now = timezone.now()
+    posts = list(
+        Post.objects.filter(published_at__lte=now)
+        .order_by("-published_at", "-pk")
+        .values("pk", "slug", "title")[: RECENT_POSTS_COUNT + 1]
+    )
+
+    # A post with a future published_at becomes visible without a save, so
+    # the entry must not outlive the next scheduled publish time.
+    next_published_at = (
+        Post.objects.filter(published_at__gt=now)
+        .order_by("published_at")
+        .values_list("published_at", flat=True)
+        .first()
+    )
+    if next_published_at is None:
+        timeout = None
+    else:
+        timeout = max(1, math.ceil((next_published_at - now).total_seconds()))
+
+    logger.debug("Caching %d recent posts for %s seconds", len(posts), timeout)
+    cache.set(RECENT_POSTS_CACHE_KEY, posts, timeout)
+    return posts
+
+
+def invalidate_recent_posts():
+    cache.delete(RECENT_POSTS_CACHE_KEY)
+
+
+def get_popular_tags(count=POPULAR_TAGS_COUNT):
+    """
+    Return up to count (at most POPULAR_TAGS_COUNT) of the tags on the most
+    posts, as dicts with the keys id, value and post_count, most used first.
+
+    The list is read from the post_count index and kept until a post's tags
+    change or a tag is saved or deleted.
+    """
+    tags = cache.get(POPULAR_TAGS_CACHE_KEY)
+    if tags is None:
+        tags = list(
+            Tag.objects.filter(post_count__gt=0)
+            .order_by("-post_count", "value")
+            .values("id", "value", "post_count")[:POPULAR_TAGS_COUNT]
+        )
+        cache.set(POPULAR_TAGS_CACHE_KEY, tags, None)
+    return tags[:count]
+
+
+def invalidate_popular_tags():
+    cache.delete(POPULAR_TAGS_CACHE_KEY)
+
+
+def render_author_byline(author):
+    """
+    Render the HTML used to credit an author: their full name if it is set,
+    otherwise their username (email address), linked to their email address.
+    """
+    if author.first_name and author.last_name:
+        name = f"{author.first_name} {author.last_name}"
+    else:
+        name = author.get_username()
+
+    if author.email:
+        return format_html('<a href="mailto:{}">{}</a>', author.email, name)
+    return format_html("{}", name)
+
+
+def get_author_bylines(author_ids):
+    """
+    Return a dict mapping each of the given user ids to its rendered byline.
+
+    Bylines are looked up in the cache in one call, and any that are missing
+    are rendered from a single query and cached until the user is saved.
+    """
+    keys = {AUTHOR_BYLINE_CACHE_KEY.format(pk): pk for pk in set(author_ids)}
+    cached = cache.get_many(keys)
+    bylines = {keys[key]: byline for key, byline in cached.items()}
+
+    missing = [pk for key, pk in keys.items() if key not in cached]
+    if missing:
+        authors = get_user_model().objects.filter(pk__in=missing).only(
+            "first_name", "last_name", "email"
+        )
+        rendered = {author.pk: render_author_byline(author) for author in authors}
+        cache.set_many(
+            {AUTHOR_BYLINE_CACHE_KEY.format(pk): byline for pk, byline in rendered.items()},
+            None,
+        )
+        bylines.update(rendered)
+
+    return bylines
+
+
+def attach_author_bylines(posts):
+    """
+    Evaluate posts and set an author_byline attribute on each one, so that a
+    page of posts gets all of its bylines with one cache lookup.
+    """
+    posts = list(posts)
+    bylines = get_author_bylines(post.author_id for post in posts)
+    for post in posts:
+        post.author_byline = bylines.get(post.author_id, "")
+    return posts
+
+
+def invalidate_author_byline(user_id):
+    cache.delete(AUTHOR_BYLINE_CACHE_KEY.format(user_id))
@@ -0,0 +1,32 @@
+"""
+System checks for the settings the blog app relies on.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# cache backends whose entries are only seen by the process that wrote them
+PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    # cached API credentials, the trending ranking, the tag index generation
+    # and the comment limits have to be seen by every server process
+    backend = settings.CACHES.get("default", {}).get("BACKEND")
+    if backend in PROCESS_LOCAL_CACHES:
+        return [
+            Error(
+                f"The default cache ({backend}) is not shared between processes.",
+                hint=(
+                    "Use memcached, as the Prod configuration does, or another "
+                    "cache every server and task worker process can reach. "
+                    "Otherwise a revoked API token keeps working in the other "
+                    "processes for up to API_AUTH_CACHE_TTL seconds."
+                ),
+                id="blog.E001",
+            )
+        ]
+    return []
@@ -0,0 +1,70 @@
+"""
+A post's comments a page at a time, oldest first.
+
+Pages are keyset paged on (created_at, pk): the cursor for the next page
+holds the position of the last comment on the page, and the next page is
+the COMMENTS_PAGE_SIZE comments after it, read from the comment_keyset
+index. So every page costs the same however many comments the post has,
+and comments added while someone pages through are neither skipped nor
+shown twice.
+
+The post page and PostDetailSerializer show the first page with a link to
+the next; the posts/<pk>/comments API route serves the following ones.
+"""
+import base64
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Q
+
+from blog.models import Comment, Post
+
+
+def encode_cursor(comment):
+    position = f"{comment.created_at.isoformat()}|{comment.pk}"
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    The (created_at, pk) position in cursor. Raises ValueError if it isn't
+    one made by encode_cursor().
+    """
+    try:
+        position = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, pk = position.split("|")
+        return datetime.fromisoformat(created_at), int(pk)
+    except (TypeError, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid comments cursor {cursor!r}") from e
+
+
+def comment_page(post, cursor=None, size=None):
+    """
+    The page of the post's comments after cursor (the first page if None),
+    with their creators, and the cursor for the next page, or None if this
+    is the last one.
+    """
+    size = size or settings.COMMENTS_PAGE_SIZE
+    comments = Comment.objects.filter(
+        content_type=ContentType.objects.get_for_model(Post), object_id=post.pk
+    )
+    if cursor is not None:
+        created_at, pk = decode_cursor(cursor)
+        comments = comments.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+        )
+    page = list(comments.select_related("creator").order_by("created_at", "pk")[: size + 1])
+    if len(page) > size:
+        return page[:size], encode_cursor(page[size - 1])
+    return page, None
+
+
+def first_comment_page(post):
+    """
+    comment_page(post), kept on the post so the comments and the cursor
+    serialized from it come from the same query.
+    """
+    if not hasattr(post, "_first_comment_page"):
+        post._first_comment_page = comment_page(post)
+    return post._first_comment_page
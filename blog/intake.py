@@ -0,0 +1,143 @@
+"""
+Checks run on a new comment before it is saved, so that a flood of
+comments is turned away without a database write per comment.
+
+check_comment() runs, in order:
+
+1. a token bucket per user and one per IP address, kept in the cache.
+   Each holds COMMENT_USER_BURST (COMMENT_IP_BURST) tokens and gains one
+   every COMMENT_USER_INTERVAL (COMMENT_IP_INTERVAL) seconds; both need a
+   token for a comment to go through.
+2. a classifier of simple signs of spam (see spam_reason()).
+3. duplicate suppression: a user can't post the same text to the same
+   post again within COMMENT_DUPLICATE_SECONDS of it being saved.
+
+The tokens are only taken from the buckets once all three have passed, so
+a rejected comment costs its author nothing.
+
+Only saved comments count as posted: call remember_comment() after saving
+one, so a comment whose save is abandoned, for example because another
+comment in the same API request was rejected, can be sent again.
+
+The buckets and the remembered comments are kept in the cache, so they
+limit a user across server processes only with the shared cache backend
+that CACHES sets up outside Dev (manage.py check --deploy reports
+blog.E001 otherwise); with a local memory cache each process keeps its
+own. They are read and written back without a lock, so two comments
+arriving at the same moment may both take the last token, and two
+identical ones may both get through; they only need to be roughly right to
+stop a flood.
+"""
+import hashlib
+import logging
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+LINK = re.compile(r"https?://|www\.", re.IGNORECASE)
+REPEATED_CHARACTER = re.compile(r"(.)\1{9,}")
+WHITESPACE = re.compile(r"\s+")
+
+
+class CommentRejected(Exception):
+    """
+    A comment was turned away; the message can be shown to its author.
+    wait is the number of seconds until a rate limited author can comment
+    again, or None if the comment itself was the problem.
+    """
+
+    def __init__(self, message, wait=None):
+        super().__init__(message)
+        self.wait = wait
+
+
+def bucket_tokens(key, burst, interval, now):
+    # the tokens in the bucket at key, which may not be a whole number
+    tokens, updated = cache.get(key, (burst, now))
+    return min(burst, tokens + (now - updated) / interval)
+
+
+def take_token(key, burst, interval, now=None):
+    """
+    Take a token from the bucket at key. Returns None if there was one,
+    otherwise the seconds until there will be.
+    """
+    now = time.time() if now is None else now
+    tokens = bucket_tokens(key, burst, interval, now)
+    if tokens < 1:
+        return (1 - tokens) * interval
+    # kept until the bucket would be full again anyway
+    cache.set(key, (tokens - 1, now), int((burst - tokens + 1) * interval) + 1)
+    return None
+
+
+def spam_reason(content):
+    """
+    Why content looks like spam, or None if it doesn't.
+    """
+    text = content.strip()
+    if not text:
+        return "The comment is empty."
+    if len(LINK.findall(text)) > settings.COMMENT_MAX_LINKS:
+        return "The comment has too many links."
+    letters = [c for c in text if c.isalpha()]
+    if len(letters) >= 20 and sum(c.isupper() for c in letters) > 0.7 * len(letters):
+        return "Please don't write the comment in capitals."
+    if REPEATED_CHARACTER.search(text):
+        return "The comment repeats the same character too many times."
+    words = set(WHITESPACE.split(text.casefold()))
+    if words & {word.casefold() for word in settings.COMMENT_BLOCKED_WORDS}:
+        return "The comment contains a blocked word."
+    return None
+
+
+def duplicate_key(user_id, post_id, content):
+    normalized = WHITESPACE.sub(" ", content.strip().casefold())
+    digest = hashlib.sha256(normalized.encode()).hexdigest()
+    return f"blog_comment_seen_{user_id}_{post_id}_{digest}"
+
+
+def check_comment(user, ip_address, post, content):
+    """
+    Raise CommentRejected if user (from ip_address) may not post content
+    on post now. A comment that passes takes a token from each bucket, so
+    call this only right before saving it.
+    """
+    now = time.time()
+    buckets = [
+        (f"user_{user.pk}", settings.COMMENT_USER_BURST, settings.COMMENT_USER_INTERVAL),
+        (f"ip_{ip_address}", settings.COMMENT_IP_BURST, settings.COMMENT_IP_INTERVAL),
+    ]
+    buckets = [(f"blog_comment_bucket_{name}", burst, interval) for name, burst, interval in buckets]
+    for key, burst, interval in buckets:
+        tokens = bucket_tokens(key, burst, interval, now)
+        if tokens < 1:
+            wait = (1 - tokens) * interval
+            logger.info("Comment by user %s from %s rate limited", user.pk, ip_address)
+            raise CommentRejected(
+                f"You are commenting too often, please wait {int(wait) + 1} seconds.", wait
+            )
+
+    reason = spam_reason(content)
+    if reason is not None:
+        logger.info("Comment by user %s on post %s rejected: %s", user.pk, post.pk, reason)
+        raise CommentRejected(reason)
+
+    if cache.get(duplicate_key(user.pk, post.pk, content)):
+        raise CommentRejected("You have already posted this comment.")
+
+    for key, burst, interval in buckets:
+        take_token(key, burst, interval, now)
+
+
+def remember_comment(user, post, content):
+    """
+    Record that user has saved content on post, for the duplicate check.
+    """
+    cache.set(
+        duplicate_key(user.pk, post.pk, content), True, settings.COMMENT_DUPLICATE_SECONDS
+    )
@@ -0,0 +1,41 @@
+"""
+Build the OpenAPI schema and write it to API_SCHEMA_DIR.
+
+    python manage.py build_api_schema
+    python manage.py build_api_schema --force --output-dir /srv/blango/api_schema
+
+The schema is only rebuilt when the URLconf has changed since the
+documents in the directory were written, unless --force is given. See
+blog/api/schema.py.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.api.schema import get_schema, read_schema, urlconf_fingerprint, write_schema
+
+
+class Command(BaseCommand):
+    help = "Build the OpenAPI schema served by the swagger routes and write it to API_SCHEMA_DIR."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output-dir", help="Directory to write the schema to. Defaults to API_SCHEMA_DIR."
+        )
+        parser.add_argument(
+            "--force", action="store_true", help="Rebuild even if the URLconf has not changed."
+        )
+
+    def handle(self, *args, **options):
+        directory = options["output_dir"] or settings.API_SCHEMA_DIR
+        if not directory:
+            raise CommandError("Set API_SCHEMA_DIR or pass --output-dir")
+        directory = str(directory)
+
+        if not options["force"] and read_schema(directory, urlconf_fingerprint()):
+            self.stdout.write(f"The schema in {directory} is up to date")
+            return
+
+        schema = get_schema(directory, force=True)
+        write_schema(schema, directory)
+        for name, document in schema.documents.items():
+            self.stdout.write(f"Wrote {name} ({len(document.content)} bytes) to {directory}")
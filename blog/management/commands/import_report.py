@@ -0,0 +1,113 @@
+"""
+Report the modules that take longest to import when a worker starts.
+
+    python manage.py import_report
+    python manage.py import_report --configuration Prod --limit 40 --sort self
+
+A fresh interpreter is started with python -X importtime and imports the
+WSGI application (or the module given with --module), as a worker would.
+Its import time log is summarised, slowest modules first, along with the
+worker's total import time and peak memory.
+
+The worker's warm up (blog.warmup.warm_up: building the API schema,
+loading the tag index, starting the view counter) is skipped, so only the
+cost of importing is measured and nothing is written to API_SCHEMA_DIR.
+"""
+import os
+import re
+import resource
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.warmup import SKIP_WARM_UP_VARIABLE
+
+# import time:       self [us] |  cumulative | imported package
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def parse_import_times(lines):
+    """
+    Yield (module, self_us, cumulative_us, depth) for each line of
+    -X importtime output.
+    """
+    for line in lines:
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            # the top level imports are indented by one space, and each
+            # nested level by two more
+            depth = (len(indent) - 1) // 2
+            yield module, int(self_us), int(cumulative_us), depth
+
+
+def top_level_package(module):
+    return module.split(".", 1)[0]
+
+
+class Command(BaseCommand):
+    help = "Import the application in a fresh interpreter and list the slowest modules to import."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--module", default="blango.wsgi", help="Module to import. Defaults to blango.wsgi."
+        )
+        parser.add_argument(
+            "--sort",
+            choices=["cumulative", "self"],
+            default="cumulative",
+            help="Rank modules by their own import time or including what they import.",
+        )
+        parser.add_argument("--limit", type=int, default=25, help="Number of modules to list.")
+
+    def handle(self, *args, **options):
+        # django-configurations' --configuration option has already been put
+        # in the environment, so the worker is imported with the same one
+        env = dict(os.environ)
+        env[SKIP_WARM_UP_VARIABLE] = "1"
+        before = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {options['module']}"],
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        peak_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        if process.returncode:
+            raise CommandError(
+                f"Importing {options['module']} failed:\n" + process.stderr[-2000:]
+            )
+
+        imports = list(parse_import_times(process.stderr.splitlines()))
+        if not imports:
+            raise CommandError("No import times were reported")
+
+        total_us = sum(cumulative for _, _, cumulative, depth in imports if depth == 0)
+        by_package = {}
+        for module, self_us, _, _ in imports:
+            package = top_level_package(module)
+            by_package[package] = by_package.get(package, 0) + self_us
+
+        column = 1 if options["sort"] == "self" else 2
+        slowest = sorted(imports, key=lambda i: -i[column])[: options["limit"]]
+
+        self.stdout.write(
+            f"Importing {options['module']} with configuration "
+            f"{env.get('DJANGO_CONFIGURATION', '(default)')}: "
+            f"{len(imports)} modules in {total_us / 1000:.0f} ms"
+        )
+        if peak_kb > before:
+            self.stdout.write(f"Peak memory of the worker: {peak_kb / 1024:.1f} MB")
+
+        width = max(len(module) for module, _, _, _ in slowest)
+        self.stdout.write(f"\n{'module':<{width}} {'self ms':>9} {'cumul ms':>9}")
+        for module, self_us, cumulative_us, _ in slowest:
+            self.stdout.write(
+                f"{module:<{width}} {self_us / 1000:>9.1f} {cumulative_us / 1000:>9.1f}"
+            )
+
+        self.stdout.write(f"\n{'package':<{width}} {'total ms':>9}")
+        for package, self_us in sorted(by_package.items(), key=lambda p: -p[1])[: options["limit"]]:
+            self.stdout.write(f"{package:<{width}} {self_us / 1000:>9.1f}")
@@ -0,0 +1,26 @@
+"""
+Rank the trending posts served by the posts/trending API route.
+
+    python manage.py rank_trending_posts
+
+Run it on a schedule, for example every five minutes from cron. The
+ranking is stored in the cache shared by the server processes, so it needs
+a shared cache backend (not the local memory one) to reach them. See
+blog/trending.py for how posts are scored.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog import trending
+
+
+class Command(BaseCommand):
+    help = "Score recent comments, views and publish times and store the trending posts ranking."
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        ranked = trending.rank_trending_posts()
+        self.stdout.write(
+            f"Ranked {len(ranked)} trending posts in {time.perf_counter() - start:.2f}s"
+        )
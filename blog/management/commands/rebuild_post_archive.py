@@ -0,0 +1,20 @@
+"""
+Recount the per-day and per-month archive buckets from the posts.
+
+    python manage.py rebuild_post_archive
+
+The buckets are kept up to date as posts are saved and deleted (see
+blog/archive.py); this repairs them after changes that bypassed the model's
+signals, such as QuerySet.update() or a bulk import.
+"""
+from django.core.management.base import BaseCommand
+
+from blog.archive import rebuild_buckets
+
+
+class Command(BaseCommand):
+    help = "Recount the post archive buckets served by the posts/archive API route."
+
+    def handle(self, *args, **options):
+        count = rebuild_buckets()
+        self.stdout.write(f"Rebuilt {count} archive buckets")
@@ -0,0 +1,27 @@
+"""
+Recompute the related posts of every post.
+
+    python manage.py rebuild_related_posts
+
+Run it after migrating to fill the RelatedPost table, and now and then to
+pick up summary edits and the drift in tag weights that the incremental
+updates leave (see blog/related.py).
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog import related
+
+
+class Command(BaseCommand):
+    help = "Recompute the related posts shown on post pages and by the posts/<pk>/related API route."
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = related.rebuild_related_posts()
+        method = "NumPy" if related.numpy is not None else "an inverted index"
+        self.stdout.write(
+            f"Found related posts for {count} posts with {method} "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
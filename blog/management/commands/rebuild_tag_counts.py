@@ -0,0 +1,21 @@
+"""
+Recount the number of posts with each tag.
+
+    python manage.py rebuild_tag_counts
+
+Tag.post_count is kept up to date as posts are tagged and deleted (see
+blog/tags.py); this repairs it after changes that bypassed the signals.
+"""
+from django.core.management.base import BaseCommand
+
+from blog.caching import invalidate_popular_tags
+from blog.tags import rebuild_tag_counts
+
+
+class Command(BaseCommand):
+    help = "Recount Tag.post_count, used by the tags/popular API route."
+
+    def handle(self, *args, **options):
+        count = rebuild_tag_counts()
+        invalidate_popular_tags()
+        self.stdout.write(f"Corrected the post count of {count} tags")
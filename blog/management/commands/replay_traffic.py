@@ -0,0 +1,261 @@
+"""
+Replay recorded traffic against a server and report how it performed.
+
+    python manage.py replay_traffic traffic.jsonl --concurrency 20 --rate 200
+    python manage.py replay_traffic traffic.jsonl --server asgi
+    python manage.py replay_traffic traffic.jsonl --url https://staging.example.com
+
+The logs use the format described in blango/traffic.py (the format written
+by the traffic recorder middleware). Unless --url is given, a server for
+this project is started in the background for the duration of the run:
+Django's threaded WSGI server, or uvicorn for --server asgi. Run the
+command with the configuration under test, for example
+DJANGO_CONFIGURATION=Asgi, so the local server and the route names in the
+report match it.
+"""
+import http.client
+import queue
+import socket
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import Resolver404, resolve
+
+from blango.traffic import read_traffic, request_target
+
+HOST_HEADER = "localhost"
+
+
+def percentile(sorted_values, percent):
+    # nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def route_name(path):
+    # the URL pattern the path resolves to, so that the report groups
+    # /api/v1/posts/1/ and /api/v1/posts/2/ together
+    try:
+        route = resolve(path).route
+    except Resolver404:
+        return "(unresolved)"
+    return "/" + route.replace("^", "").replace("$", "")
+
+
+def start_wsgi_server():
+    from django.core.servers.basehttp import (
+        get_internal_wsgi_application,
+        ThreadedWSGIServer,
+        WSGIRequestHandler,
+    )
+
+    class QuietRequestHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadedWSGIServer(("127.0.0.1", 0), QuietRequestHandler)
+    httpd.set_app(get_internal_wsgi_application())
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd.server_address[1], httpd.shutdown
+
+
+def start_asgi_server():
+    try:
+        import uvicorn
+    except ImportError:
+        raise CommandError("uvicorn must be installed to replay against an ASGI server")
+    from django.core.asgi import get_asgi_application
+
+    # bind the socket here so the port is known before uvicorn starts
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+
+    config = uvicorn.Config(
+        get_asgi_application(), log_level="warning", lifespan="off", access_log=False
+    )
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise CommandError("The ASGI server failed to start")
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+
+    return port, stop
+
+
+class Command(BaseCommand):
+    help = "Replay JSON lines traffic logs against a server and report latency per route."
+
+    def add_arguments(self, parser):
+        parser.add_argument("logs", nargs="+", help="Traffic log files to replay, in order.")
+        parser.add_argument(
+            "--url",
+            help="Base URL of a running server. By default a local server is started.",
+        )
+        parser.add_argument(
+            "--server",
+            choices=["wsgi", "asgi"],
+            default="wsgi",
+            help="The kind of local server to start when --url is not given.",
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=10, help="Number of requests in flight at once."
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=0,
+            help="Requests per second to send, across all workers. 0 sends as fast as possible.",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=1, help="Number of times to replay the logs."
+        )
+        parser.add_argument(
+            "--methods",
+            default="GET,HEAD",
+            help="Comma separated methods to replay; recorded requests have no bodies.",
+        )
+        parser.add_argument(
+            "--auth",
+            action="append",
+            default=[],
+            metavar="SCHEME=HEADER",
+            help=(
+                "Authorization header to send for requests recorded with an auth scheme, "
+                "for example --auth 'Token=Token 9944b09199c6'. Requests for schemes "
+                "without one are sent anonymously."
+            ),
+        )
+        parser.add_argument("--timeout", type=float, default=30, help="Per request timeout.")
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1:
+            raise CommandError("--concurrency must be at least 1")
+
+        methods = {m.strip().upper() for m in options["methods"].split(",") if m.strip()}
+        auth_headers = {}
+        for value in options["auth"]:
+            scheme, sep, header = value.partition("=")
+            if not sep:
+                raise CommandError(f"--auth {value} should look like SCHEME=HEADER")
+            auth_headers[scheme] = header
+
+        records = [r for r in read_traffic(options["logs"]) if r["method"].upper() in methods]
+        records = records * options["repeat"]
+        if not records:
+            raise CommandError("No replayable requests found in the logs")
+
+        stop_server = None
+        if options["url"]:
+            url = urlsplit(options["url"])
+            scheme, host, port = url.scheme, url.hostname, url.port
+            host_header = url.netloc
+            prefix = url.path.rstrip("/")
+        else:
+            start = start_asgi_server if options["server"] == "asgi" else start_wsgi_server
+            port, stop_server = start()
+            scheme, host, host_header, prefix = "http", "127.0.0.1", HOST_HEADER, ""
+            self.stdout.write(f"Started a local {options['server'].upper()} server on port {port}")
+
+        connection_class = (
+            http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        )
+
+        work = queue.Queue()
+        for item in enumerate(records):
+            work.put(item)
+        results = []
+        rate = options["rate"]
+
+        def worker():
+            connection = connection_class(host, port, timeout=options["timeout"])
+            while True:
+                try:
+                    index, record = work.get_nowait()
+                except queue.Empty:
+                    break
+                if rate:
+                    delay = started + index / rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                headers = {"Host": host_header}
+                if record.get("auth") in auth_headers:
+                    headers["Authorization"] = auth_headers[record["auth"]]
+
+                sent = time.perf_counter()
+                try:
+                    connection.request(
+                        record["method"].upper(), prefix + request_target(record), headers=headers
+                    )
+                    response = connection.getresponse()
+                    response.read()
+                    status = response.status
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    status = None
+                results.append((record["method"].upper(), record["path"], status, time.perf_counter() - sent))
+            connection.close()
+
+        self.stdout.write(
+            f"Replaying {len(records)} requests with concurrency {options['concurrency']}"
+            + (f" at {rate:g} req/s" if rate else "")
+        )
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(options["concurrency"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if stop_server is not None:
+            stop_server()
+
+        self.report(results, elapsed)
+
+    def report(self, results, elapsed):
+        by_route = defaultdict(list)
+        statuses = Counter()
+        errors = Counter()
+        for method, path, status, latency in results:
+            key = f"{method} {route_name(path)}"
+            by_route[key].append(latency * 1000)
+            statuses[status or "error"] += 1
+            if status is None or status >= 400:
+                errors[key] += 1
+
+        total_errors = sum(errors.values())
+        self.stdout.write(
+            f"\n{len(results)} requests in {elapsed:.2f}s, "
+            f"{len(results) / elapsed:.1f} req/s, "
+            f"{100 * total_errors / len(results):.1f}% errors\n"
+        )
+        width = max(len(key) for key in by_route)
+        self.stdout.write(
+            f"{'route':<{width}} {'n':>7} {'err%':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+        )
+        for key in sorted(by_route, key=lambda k: -len(by_route[k])):
+            latencies = sorted(by_route[key])
+            self.stdout.write(
+                f"{key:<{width}} {len(latencies):>7} "
+                f"{100 * errors[key] / len(latencies):>5.1f}% "
+                f"{percentile(latencies, 50):>9.2f} "
+                f"{percentile(latencies, 95):>9.2f} "
+                f"{percentile(latencies, 99):>9.2f}"
+            )
+        self.stdout.write(
+            "\nStatus codes: "
+            + " ".join(f"{status}={count}" for status, count in sorted(statuses.items(), key=str))
+        )
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.25 on 2026-10-19 12:29
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def count_posts(apps, schema_editor):
+    Post = apps.get_model("blog", "Post")
+    PostArchiveBucket = apps.get_model("blog", "PostArchiveBucket")
+    counts = Counter()
+    published_ats = Post.objects.exclude(published_at=None).values_list("published_at", flat=True)
+    for published_at in published_ats.iterator():
+        day = timezone.localdate(published_at)
+        counts["day", day] += 1
+        counts["month", day.replace(day=1)] += 1
+    PostArchiveBucket.objects.bulk_create(
+        PostArchiveBucket(period=period, start=start, post_count=count)
+        for (period, start), count in counts.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_auto_20241112_1920'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostArchiveBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], max_length=5)),
+                ('start', models.DateField()),
+                ('post_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['period', '-start'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='postarchivebucket',
+            constraint=models.UniqueConstraint(fields=('period', 'start'), name='unique_post_archive_bucket'),
+        ),
+        migrations.RunPython(count_posts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-19 12:31
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_posts(apps, schema_editor):
+    Tag = apps.get_model("blog", "Tag")
+    tags = Tag.objects.annotate(count=Count("posts")).filter(count__gt=0)
+    for tag in tags:
+        tag.post_count = tag.count
+    Tag.objects.bulk_update(tags, ["post_count"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_postarchivebucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='post_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(count_posts, migrations.RunPython.noop),
+    ]
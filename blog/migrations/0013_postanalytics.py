@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-19 12:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_relatedpost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostAnalytics',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='analytics', serialize=False, to='blog.post')),
+                ('view_count', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PostHourlyViews',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(db_index=True)),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_views', to='blog.post')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='posthourlyviews',
+            constraint=models.UniqueConstraint(fields=('post', 'hour'), name='unique_post_hourly_views'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-19 12:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0013_postanalytics'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['content_type', 'object_id', 'created_at', 'id'], name='comment_keyset'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0014_comment_keyset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SummaryWord',
+            fields=[
+                ('word', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('post_count', models.PositiveIntegerField()),
+            ],
+        ),
+    ]
@@ -12,6 +12,9 @@ from versatileimagefield.fields import VersatileImageField, PPOIField
 
 class Tag(models.Model):
     value = models.TextField(max_length=100, unique=True)
+    # the number of posts with the tag, kept up to date by the receivers in
+    # blog/signals.py; see blog/tags.py
+    post_count = models.PositiveIntegerField(default=0, db_index=True)
 
     def __str__(self):
         return self.value
@@ -28,6 +31,14 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     modified_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # the order a post's comments are paged in, see blog/comments.py
+            models.Index(
+                fields=["content_type", "object_id", "created_at", "id"], name="comment_keyset"
+            ),
+        ]
+
 class Post(models.Model):
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -48,6 +59,93 @@ class Post(models.Model):
     def __str__(self):
         return self.title
 
+class PostArchiveBucket(models.Model):
+    """
+    The number of posts published on a day or in a month, in TIME_ZONE.
+    Kept up to date by the receivers in blog/signals.py; see blog/archive.py.
+    """
+
+    DAY = "day"
+    MONTH = "month"
+    PERIOD_CHOICES = [(DAY, "Day"), (MONTH, "Month")]
+
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    start = models.DateField()
+    post_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.period} {self.start}: {self.post_count}"
+
+    class Meta:
+        ordering = ["period", "-start"]
+        constraints = [
+            models.UniqueConstraint(fields=["period", "start"], name="unique_post_archive_bucket")
+        ]
+
+class RelatedPost(models.Model):
+    """
+    One of the posts most similar to post, with its cosine similarity.
+    Computed ahead of time by blog/related.py.
+    """
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="related_entries")
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+
+    def __str__(self):
+        return f"{self.related_id} for {self.post_id}: {self.score:.3f}"
+
+    class Meta:
+        ordering = ["post", "-score", "related"]
+        constraints = [
+            models.UniqueConstraint(fields=["post", "related"], name="unique_related_post")
+        ]
+
+class SummaryWord(models.Model):
+    """
+    The number of published posts whose summary has word, as of the last
+    rebuild of the related posts; blog/related.py weights the words of the
+    posts it refreshes by it.
+    """
+
+    word = models.CharField(max_length=50, primary_key=True)
+    post_count = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.word}: {self.post_count}"
+
+class PostAnalytics(models.Model):
+    """
+    The number of times a post has been viewed, written in batches by
+    blog/analytics.py.
+    """
+
+    post = models.OneToOneField(
+        Post, on_delete=models.CASCADE, primary_key=True, related_name="analytics"
+    )
+    view_count = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.post_id}: {self.view_count} views"
+
+class PostHourlyViews(models.Model):
+    """
+    The views of a post in the hour starting at hour, kept for
+    ANALYTICS_RETENTION_DAYS for the trending scores.
+    """
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="hourly_views")
+    hour = models.DateTimeField(db_index=True)
+    views = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.post_id} at {self.hour}: {self.views} views"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["post", "hour"], name="unique_post_hourly_views")
+        ]
+
 class AuthorProfile(models.Model):
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="profile"
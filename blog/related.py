@@ -0,0 +1,326 @@
+"""
+Related posts, worked out ahead of time and stored in RelatedPost.
+
+Each post with a published_at is described by a sparse vector of its tags,
+weighted by how rare each tag is (IDF), plus the TF-IDF weights of the
+words of its summary scaled by RELATED_POSTS_SUMMARY_WEIGHT. The
+RELATED_POSTS_COUNT posts with the highest cosine similarity to it are
+stored as its neighbours, so the post detail page and the posts/<pk>/related
+API route read a few rows instead of comparing posts.
+
+rebuild_related_posts() compares every post with every other one: in
+batches of matrix products when NumPy is installed, otherwise through an
+inverted index of the vectors. The rebuild also stores how many posts
+have each summary word in SummaryWord.
+
+When a post's tags change, or it is published, unpublished or deleted,
+the refresh_related task (blog/tasks.py) runs refresh_related_posts(),
+which recomputes the neighbours of that post and of the posts whose
+neighbours it may enter or leave. It only loads the vectors of those posts
+and of the posts that share a tag with them, weighting tags by a count of
+their posts and words by SummaryWord. So the IDF weights of the other
+posts drift a little between rebuilds, summary edits are only picked up
+by a rebuild, and a post can only enter the neighbours of a post it shares
+a tag with; the rebuild_related_posts management command does a full one.
+"""
+import heapq
+import logging
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from blog.models import Post, RelatedPost, SummaryWord
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+# rows of the similarity matrix worked out at once by the NumPy path
+BATCH_SIZE = 256
+
+WORD = re.compile(r"[^\W\d_]{3,}")
+# longer words don't fit in SummaryWord and are left out
+MAX_WORD_LENGTH = SummaryWord._meta.get_field("word").max_length
+STOP_WORDS = frozenset(
+    """
+    about after again all also and any are because been before being but can could
+    did does doing for from had has have her here him his how into its just more
+    most not now off once only other our out over own same she should some such
+    than that the their them then there these they this those through too under
+    until very was were what when where which while who why will with would you your
+    """.split()
+)
+
+
+def summary_words(summary):
+    return [
+        w
+        for w in WORD.findall(summary.lower())
+        if w not in STOP_WORDS and len(w) <= MAX_WORD_LENGTH
+    ]
+
+
+def normalized(weights, scale=1.0):
+    length = math.sqrt(sum(w * w for w in weights.values()))
+    if not length:
+        return {}
+    return {feature: w / length * scale for feature, w in weights.items()}
+
+
+def post_features(post_ids=None):
+    """
+    The tag features (a list) and summary word counts (a Counter) of every
+    post with a published_at, or of those among post_ids, as two dicts by
+    post id.
+    """
+    posts = Post.objects.exclude(published_at=None)
+    links = Post.tags.through.objects.filter(post__published_at__isnull=False)
+    if post_ids is not None:
+        posts = posts.filter(pk__in=post_ids)
+        links = links.filter(post_id__in=post_ids)
+
+    tags = defaultdict(list)
+    for post_id, tag_id in links.values_list("post_id", "tag_id").iterator():
+        tags[post_id].append(("tag", tag_id))
+
+    words = {}
+    if settings.RELATED_POSTS_SUMMARY_WEIGHT > 0:
+        for post_id, summary in posts.values_list("pk", "summary").iterator():
+            words[post_id] = Counter(("word", w) for w in summary_words(summary))
+    return tags, words
+
+
+def counted_frequencies(tags, words):
+    # the number of posts with each feature, when tags and words are those
+    # of every post
+    frequency = Counter()
+    for features in tags.values():
+        frequency.update(features)
+    for counts in words.values():
+        frequency.update(counts.keys())
+    return frequency
+
+
+def stored_frequencies(tags, words):
+    # the number of posts with each feature of some posts: tags are counted
+    # in the database, words read from SummaryWord, and a word written since
+    # the last rebuild is counted at least for the posts that have it here
+    tag_ids = {tag_id for features in tags.values() for _, tag_id in features}
+    frequency = counted_frequencies({}, words)
+    links = Post.tags.through.objects.filter(tag_id__in=tag_ids, post__published_at__isnull=False)
+    for tag_id, n in links.values("tag_id").annotate(n=Count("pk")).values_list("tag_id", "n"):
+        frequency["tag", tag_id] = n
+    word_set = {word for counts in words.values() for _, word in counts}
+    for word, n in SummaryWord.objects.filter(word__in=word_set).values_list("word", "post_count"):
+        frequency["word", word] = max(frequency["word", word], n)
+    return frequency
+
+
+def vectorize(tags, words, frequency):
+    summary_weight = settings.RELATED_POSTS_SUMMARY_WEIGHT
+    post_count = Post.objects.exclude(published_at=None).count()
+
+    def idf(feature):
+        return math.log((1 + post_count) / (1 + frequency[feature])) + 1
+
+    vectors = {}
+    for post_id in tags.keys() | words.keys():
+        vector = normalized({f: idf(f) for f in tags.get(post_id, ())})
+        counts = words.get(post_id)
+        if counts:
+            word_vector = normalized(
+                {f: (1 + math.log(n)) * idf(f) for f, n in counts.items()}, summary_weight
+            )
+            vector.update(word_vector)
+        vector = normalized(vector)
+        if vector:
+            vectors[post_id] = vector
+    return vectors
+
+
+def post_vectors(post_ids=None):
+    """
+    The unit length feature vector of every post with a published_at, or of
+    those among post_ids, as a dict of post id to {feature: weight}. Posts
+    with no features (no tags and no words) are left out.
+    """
+    if post_ids is not None and not post_ids:
+        return {}
+    tags, words = post_features(post_ids)
+    if post_ids is None:
+        frequency = counted_frequencies(tags, words)
+    else:
+        frequency = stored_frequencies(tags, words)
+    return vectorize(tags, words, frequency)
+
+
+def inverted_index(vectors):
+    postings = defaultdict(list)
+    for post_id, vector in vectors.items():
+        for feature, weight in vector.items():
+            postings[feature].append((post_id, weight))
+    return postings
+
+
+def top(scores, count):
+    # the highest scoring (post id, score) pairs, the newer post first on a
+    # tie so the order is stable
+    return heapq.nlargest(count, scores, key=lambda item: (item[1], item[0]))
+
+
+def similar_to(post_id, vectors, postings, count):
+    scores = defaultdict(float)
+    for feature, weight in vectors[post_id].items():
+        for other_id, other_weight in postings[feature]:
+            if other_id != post_id:
+                scores[other_id] += weight * other_weight
+    return top(((other_id, s) for other_id, s in scores.items() if s > 0), count)
+
+
+def all_neighbours_numpy(vectors, count):
+    post_ids = list(vectors)
+    features = {f: i for i, f in enumerate({f for v in vectors.values() for f in v})}
+    matrix = numpy.zeros((len(post_ids), len(features)), dtype=numpy.float32)
+    for row, post_id in enumerate(post_ids):
+        for feature, weight in vectors[post_id].items():
+            matrix[row, features[feature]] = weight
+
+    neighbours = {}
+    for start in range(0, len(post_ids), BATCH_SIZE):
+        scores = matrix[start : start + BATCH_SIZE] @ matrix.T
+        for offset, row in enumerate(scores):
+            row[start + offset] = 0
+            candidates = numpy.flatnonzero(row > 1e-6)
+            if len(candidates) > count:
+                candidates = candidates[numpy.argpartition(-row[candidates], count - 1)[:count]]
+            neighbours[post_ids[start + offset]] = top(
+                ((post_ids[i], float(row[i])) for i in candidates), count
+            )
+    return neighbours
+
+
+def all_neighbours(vectors, count):
+    if numpy is not None:
+        return all_neighbours_numpy(vectors, count)
+    postings = inverted_index(vectors)
+    return {post_id: similar_to(post_id, vectors, postings, count) for post_id in vectors}
+
+
+def store_neighbours(neighbours, post_ids):
+    # replace the rows of post_ids; the ones not in neighbours get none
+    RelatedPost.objects.filter(post_id__in=post_ids).delete()
+    RelatedPost.objects.bulk_create(
+        RelatedPost(post_id=post_id, related_id=related_id, score=score)
+        for post_id in post_ids
+        for related_id, score in neighbours.get(post_id, ())
+    )
+
+
+@transaction.atomic
+def rebuild_related_posts():
+    """
+    Recompute the neighbours of every post. Returns the number of posts
+    that have any.
+    """
+    tags, words = post_features()
+    frequency = counted_frequencies(tags, words)
+    vectors = vectorize(tags, words, frequency)
+    neighbours = all_neighbours(vectors, settings.RELATED_POSTS_COUNT)
+    RelatedPost.objects.all().delete()
+    store_neighbours(neighbours, list(neighbours))
+    SummaryWord.objects.all().delete()
+    SummaryWord.objects.bulk_create(
+        (
+            SummaryWord(word=word, post_count=n)
+            for (kind, word), n in frequency.items()
+            if kind == "word"
+        ),
+        batch_size=1000,
+    )
+    return sum(1 for n in neighbours.values() if n)
+
+
+def posts_sharing_tags(post_ids):
+    links = Post.tags.through.objects
+    tag_ids = links.filter(post_id__in=post_ids).values("tag_id")
+    return set(
+        links.filter(tag_id__in=tag_ids, post__published_at__isnull=False).values_list(
+            "post_id", flat=True
+        )
+    )
+
+
+@transaction.atomic
+def refresh_related_posts(post_ids):
+    """
+    Recompute the neighbours of post_ids, and of each post whose neighbours
+    one of them is in or now belongs in, after their tags changed or they
+    were published or unpublished. For a deleted post, pass the ids of the
+    posts that had it as a neighbour.
+    """
+    count = settings.RELATED_POSTS_COUNT
+    post_ids = set(post_ids)
+
+    affected = set(post_ids)
+    affected.update(
+        RelatedPost.objects.filter(related_id__in=post_ids).values_list("post_id", flat=True)
+    )
+    # the posts sharing a tag with post_ids are the ones whose neighbours
+    # they can enter: those with fewer than count neighbours, or whose last
+    # one they now beat
+    sharing = posts_sharing_tags(post_ids)
+    vectors = post_vectors(post_ids | sharing)
+    postings = inverted_index(vectors)
+    stored = {
+        owner_id: (n, lowest)
+        for owner_id, n, lowest in RelatedPost.objects.filter(post_id__in=sharing)
+        .values("post_id")
+        .annotate(n=Count("pk"), lowest=Min("score"))
+        .values_list("post_id", "n", "lowest")
+    }
+    for post_id in post_ids & vectors.keys():
+        for other_id, score in similar_to(post_id, vectors, postings, len(vectors)):
+            n, lowest = stored.get(other_id, (0, 0.0))
+            if n < count or score > lowest:
+                affected.add(other_id)
+
+    # each affected post is compared with the posts sharing a tag with it,
+    # and with its current neighbours, which may only share summary words
+    candidates = affected | posts_sharing_tags(affected)
+    candidates.update(
+        RelatedPost.objects.filter(post_id__in=affected).values_list("related_id", flat=True)
+    )
+    vectors.update(post_vectors(candidates - vectors.keys()))
+    postings = inverted_index(vectors)
+
+    neighbours = {
+        pk: similar_to(pk, vectors, postings, count) for pk in affected if pk in vectors
+    }
+    store_neighbours(neighbours, affected)
+    logger.debug(
+        "Refreshed the related posts of %d posts against %d", len(affected), len(vectors)
+    )
+
+
+def get_related_posts(post, count=None):
+    """
+    The published posts related to post, most similar first, as dicts with
+    the keys pk, slug and title.
+    """
+    rows = (
+        RelatedPost.objects.filter(post=post, related__published_at__lte=timezone.now())
+        .order_by("-score", "-related")
+        .values("related__pk", "related__slug", "related__title")
+    )
+    return [
+        {"pk": row["related__pk"], "slug": row["related__slug"], "title": row["related__title"]}
+        for row in rows[: count or settings.RELATED_POSTS_COUNT]
+    ]
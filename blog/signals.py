@@ -0,0 +1,176 @@
+"""
+Signal receivers that keep the cached data in blog/caching.py, and the
+archive counts in blog/archive.py, in step with the database. They are
+connected in BlogConfig.ready().
+"""
+import threading
+
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.db import transaction
+from django.dispatch import receiver
+
+from blog.api.authentication import invalidate_cached_token, invalidate_cached_user
+from blog.archive import move_post
+from blog.caching import invalidate_author_byline, invalidate_popular_tags, invalidate_recent_posts
+from blog.models import Post, RelatedPost, Tag
+from blog.tasks import refresh_related, warm_hero_image
+from blog.tags import adjust_tag_counts, linked_post_count, linked_tag_ids, tag_deleted, tag_saved
+
+
+@receiver([post_save, post_delete], sender=Post)
+def post_changed(sender, instance, **kwargs):
+    invalidate_recent_posts()
+
+
+@receiver(pre_save, sender=Post)
+def remember_saved_values(sender, instance, **kwargs):
+    # the published_at the post is counted under in the archive and its
+    # hero image, read back because the instance may have been changed
+    # since it was loaded
+    saved = None
+    if instance.pk is not None:
+        saved = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list("published_at", "hero_image")
+            .first()
+        )
+    instance._archived_published_at, instance._saved_hero_image = saved or (None, None)
+
+
+@receiver(post_save, sender=Post)
+def hero_image_saved(sender, instance, **kwargs):
+    if instance.hero_image and instance.hero_image.name != getattr(
+        instance, "_saved_hero_image", None
+    ):
+        warm_hero_image.enqueue(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def archive_post_saved(sender, instance, **kwargs):
+    move_post(getattr(instance, "_archived_published_at", None), instance.published_at)
+
+
+@receiver(post_delete, sender=Post)
+def archive_post_deleted(sender, instance, **kwargs):
+    move_post(instance.published_at, None)
+
+
+# the ids of the posts whose related posts are refreshed when the current
+# transaction commits
+pending_related = threading.local()
+
+
+def schedule_related_refresh(post_ids):
+    # the changes of one transaction, such as the removals and additions of
+    # a tags.set(), are merged into one refresh_related task. Ids left from
+    # a transaction that was rolled back are only refreshed with the next
+    # ones, which does no harm.
+    post_ids = set(post_ids)
+    if post_ids:
+        pending_related.__dict__.setdefault("post_ids", set()).update(post_ids)
+        transaction.on_commit(queue_related_refresh)
+
+
+def queue_related_refresh():
+    post_ids = pending_related.__dict__.pop("post_ids", None)
+    if post_ids:
+        refresh_related.enqueue(sorted(post_ids))
+
+
+@receiver(post_save, sender=Post)
+def related_post_saved(sender, instance, **kwargs):
+    # a post is only compared with others while it has a published_at
+    was_published = getattr(instance, "_archived_published_at", None) is not None
+    if was_published != (instance.published_at is not None):
+        schedule_related_refresh([instance.pk])
+
+
+@receiver(pre_delete, sender=Post)
+def remember_related_owners(sender, instance, **kwargs):
+    # the rows naming the post as a neighbour are deleted with it
+    instance._related_owner_ids = list(
+        RelatedPost.objects.filter(related=instance).values_list("post_id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Post)
+def related_post_deleted(sender, instance, **kwargs):
+    schedule_related_refresh(instance.__dict__.pop("_related_owner_ids", ()))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def related_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and reverse:
+        instance._cleared_post_ids = list(instance.posts.values_list("pk", flat=True))
+    elif action == "post_clear":
+        if reverse:
+            schedule_related_refresh(instance.__dict__.pop("_cleared_post_ids", ()))
+        else:
+            schedule_related_refresh([instance.pk])
+    elif action in ("post_add", "post_remove") and pk_set:
+        schedule_related_refresh(pk_set if reverse else [instance.pk])
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def post_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # instance is a Post and pk_set holds tag ids, or with reverse (through
+    # tag.posts) instance is a Tag and pk_set holds post ids
+    if action == "post_add":
+        # Django only sends the ids that were not linked already
+        if reverse:
+            adjust_tag_counts([instance.pk], len(pk_set))
+        else:
+            adjust_tag_counts(pk_set, 1)
+    elif action in ("pre_remove", "pre_clear"):
+        # pk_set can include ids that are not linked, so the links that will
+        # actually be removed are looked up first (pk_set is None for clear)
+        if reverse:
+            instance._removed_tag_links = linked_post_count(instance.pk, pk_set)
+        else:
+            instance._removed_tag_links = linked_tag_ids(instance.pk, pk_set)
+        return
+    elif action in ("post_remove", "post_clear"):
+        removed = instance.__dict__.pop("_removed_tag_links", None)
+        if reverse:
+            adjust_tag_counts([instance.pk], -(removed or 0))
+        else:
+            adjust_tag_counts(removed, -1)
+    else:
+        return
+    invalidate_popular_tags()
+
+
+@receiver(pre_delete, sender=Post)
+def post_tags_deleted(sender, instance, **kwargs):
+    # the post's through rows are deleted without m2m_changed being sent
+    adjust_tag_counts(linked_tag_ids(instance.pk), -1)
+    invalidate_popular_tags()
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    invalidate_popular_tags()
+
+
+@receiver(post_save, sender=Tag)
+def index_tag_saved(sender, instance, **kwargs):
+    pk, value = instance.pk, instance.value
+    transaction.on_commit(lambda: tag_saved(pk, value))
+
+
+@receiver(post_delete, sender=Tag)
+def index_tag_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: tag_deleted(pk))
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, **kwargs):
+    invalidate_author_byline(instance.pk)
+    invalidate_cached_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender="authtoken.Token")
+def token_changed(sender, instance, **kwargs):
+    invalidate_cached_token(instance.key)
@@ -0,0 +1,215 @@
+"""
+Tag usage counts, and the prefix index behind tag autocomplete.
+
+Tag.post_count holds the number of posts with each tag, so popular tags
+and tag clouds are read from the tag rows (in post_count order, from its
+index) instead of grouping the Post.tags through table on every request.
+The receivers in blog/signals.py call the functions here when posts are
+tagged, untagged or deleted. Changes that bypass the signals (raw SQL, or
+deleting through rows directly) can be repaired with the
+rebuild_tag_counts management command.
+
+tag_index is an in-memory, sorted list of every tag's casefolded value,
+searched with bisect so a prefix lookup costs O(log tags + matches)
+instead of a case-insensitive LIKE over Tag.value. It is loaded on first
+use (at startup by blog.warmup.warm_up) and updated in place when a tag is
+saved or deleted in this process. At most every TAG_INDEX_CHECK_INTERVAL
+seconds each process compares what it loaded with
+
+- a generation number in the shared cache, bumped on every tag change,
+  and
+- the highest tag pk and the number of tags, read from the database,
+
+and reloads when either differs. The database check catches tags added or
+deleted in other processes even when the cache isn't shared; a renamed
+tag is only noticed through the generation, which needs the shared cache
+(see CACHES in blango/settings.py).
+"""
+import bisect
+import math
+import threading
+import time
+
+from django.core.cache import cache
+from django.db.models import Count, F, Max, Value
+from django.db.models.functions import Greatest
+
+from blog.models import Post, Tag
+
+PostTag = Post.tags.through
+
+
+def adjust_tag_counts(tag_ids, delta):
+    if tag_ids and delta:
+        # clamped, as post_count is a positive integer and a count a
+        # rebuild left lower than the links (e.g. racing with a delete) must
+        # not make the update fail
+        Tag.objects.filter(pk__in=tag_ids).update(
+            post_count=Greatest(F("post_count") + delta, Value(0))
+        )
+
+
+def linked_tag_ids(post_id, tag_ids=None):
+    links = PostTag.objects.filter(post_id=post_id)
+    if tag_ids is not None:
+        links = links.filter(tag_id__in=tag_ids)
+    return set(links.values_list("tag_id", flat=True))
+
+
+def linked_post_count(tag_id, post_ids=None):
+    links = PostTag.objects.filter(tag_id=tag_id)
+    if post_ids is not None:
+        links = links.filter(post_id__in=post_ids)
+    return links.count()
+
+
+def with_cloud_weights(tags, steps=5):
+    """
+    Copies of the tag dicts with a weight from 1 to steps added, on a log
+    scale of post_count, for sizing the tags in a tag cloud.
+    """
+    if not tags:
+        return []
+    low = math.log(min(tag["post_count"] for tag in tags))
+    spread = math.log(max(tag["post_count"] for tag in tags)) - low
+
+    def weight(post_count):
+        if not spread:
+            return steps
+        return 1 + round((math.log(post_count) - low) / spread * (steps - 1))
+
+    return [dict(tag, weight=weight(tag["post_count"])) for tag in tags]
+
+
+def rebuild_tag_counts():
+    """
+    Recount Tag.post_count from the through table. Returns the number of
+    tags whose count was wrong.
+    """
+    stale = [
+        tag
+        for tag in Tag.objects.annotate(count=Count("posts")).only("post_count")
+        if tag.post_count != tag.count
+    ]
+    for tag in stale:
+        tag.post_count = tag.count
+    Tag.objects.bulk_update(stale, ["post_count"], batch_size=500)
+    return len(stale)
+
+
+TAG_INDEX_GENERATION_CACHE_KEY = "blog_tag_index_generation"
+TAG_INDEX_CHECK_INTERVAL = 1.0
+
+
+def tag_index_generation():
+    return cache.get_or_set(TAG_INDEX_GENERATION_CACHE_KEY, 0, None)
+
+
+def bump_tag_index_generation():
+    try:
+        return cache.incr(TAG_INDEX_GENERATION_CACHE_KEY)
+    except ValueError:
+        # not in the cache (evicted or never set); any new value will do
+        generation = time.time_ns()
+        cache.set(TAG_INDEX_GENERATION_CACHE_KEY, generation, None)
+        return generation
+
+
+def tag_table_marker():
+    # changes whenever a tag is added or deleted, in any process
+    marker = Tag.objects.aggregate(max_pk=Max("pk"), count=Count("pk"))
+    return marker["max_pk"], marker["count"]
+
+
+class TagPrefixIndex:
+    """
+    Tags sorted by casefolded value, as (folded value, pk, value) entries,
+    for prefix lookups with bisect. See the module docstring.
+    """
+
+    def __init__(self):
+        self.entries = None
+        self.folded = {}
+        self.generation = None
+        self.marker = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+
+    def load(self):
+        generation = tag_index_generation()
+        marker = tag_table_marker()
+        entries = sorted(
+            (value.casefold(), pk, value) for pk, value in Tag.objects.values_list("pk", "value")
+        )
+        with self.lock:
+            self.entries = entries
+            self.folded = {pk: (folded, pk, value) for folded, pk, value in entries}
+            self.generation = generation
+            self.marker = marker
+            self.checked = time.monotonic()
+
+    def ensure_current(self):
+        if self.entries is None:
+            self.load()
+        elif time.monotonic() - self.checked > TAG_INDEX_CHECK_INTERVAL:
+            if (
+                tag_index_generation() != self.generation
+                or tag_table_marker() != self.marker
+            ):
+                self.load()
+            else:
+                self.checked = time.monotonic()
+
+    def search(self, prefix, limit=10):
+        """
+        Up to limit (pk, value) pairs of the tags whose value starts with
+        prefix, ignoring case, in alphabetical order.
+        """
+        self.ensure_current()
+        prefix = prefix.casefold()
+        with self.lock:
+            entries = self.entries
+            start = bisect.bisect_left(entries, (prefix,))
+            matches = []
+            for folded, pk, value in entries[start : start + limit]:
+                if not folded.startswith(prefix):
+                    break
+                matches.append((pk, value))
+        return matches
+
+    def discard(self, pk):
+        with self.lock:
+            if self.entries is None:
+                return
+            entry = self.folded.pop(pk, None)
+            if entry is not None:
+                del self.entries[bisect.bisect_left(self.entries, entry)]
+
+    def add(self, pk, value):
+        self.discard(pk)
+        with self.lock:
+            if self.entries is None:
+                return
+            entry = (value.casefold(), pk, value)
+            bisect.insort(self.entries, entry)
+            self.folded[pk] = entry
+
+    def changed_here(self, generation):
+        # after a change made in place, the new generation is taken as this
+        # index's own if no other process changed the tags in between
+        with self.lock:
+            if self.generation is not None and generation == self.generation + 1:
+                self.generation = generation
+
+
+tag_index = TagPrefixIndex()
+
+
+def tag_saved(pk, value):
+    tag_index.add(pk, value)
+    tag_index.changed_here(bump_tag_index_generation())
+
+
+def tag_deleted(pk):
+    tag_index.discard(pk)
+    tag_index.changed_here(bump_tag_index_generation())
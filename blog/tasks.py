@@ -0,0 +1,45 @@
+"""
+Background tasks for the blog app, run by the blango_tasks workers.
+"""
+import logging
+
+from versatileimagefield.image_warmer import VersatileImageFieldWarmer
+
+from blango_tasks.models import Task
+from blango_tasks.registry import task
+from blog.models import Post
+from blog.related import refresh_related_posts
+
+logger = logging.getLogger(__name__)
+
+
+def hero_image_sizes():
+    # the renditions the API links to; PostDetailSerializer's include the
+    # ones PostSerializer uses
+    from blog.api.serializers import PostDetailSerializer
+
+    return PostDetailSerializer().fields["hero_image"].sizes
+
+
+@task(lane=Task.LOW, max_attempts=3)
+def warm_hero_image(post_id):
+    """
+    Create the resized copies of a post's hero image ahead of time, so the
+    first request that links to them doesn't have to.
+    """
+    post = Post.objects.filter(pk=post_id).exclude(hero_image="").first()
+    if post is None or not post.hero_image:
+        return
+    warmed, failed = VersatileImageFieldWarmer(post, hero_image_sizes(), "hero_image").warm()
+    if failed:
+        raise RuntimeError(f"Could not create {', '.join(failed)}")
+    logger.debug("Created %d sizes of the hero image of post %s", warmed, post_id)
+
+
+@task(lane=Task.LOW)
+def refresh_related(post_ids):
+    """
+    Recompute the related posts after post_ids changed; queued by
+    blog/signals.py.
+    """
+    refresh_related_posts(post_ids)
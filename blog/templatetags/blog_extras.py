@@ -4,7 +4,8 @@ register = template.Library()
 django.utils.html.escape
 django.utils.safestring.mark_safe
 from django.utils.html import format_html
-from blog.models import Post
+from blog.caching import get_author_bylines, get_recent_posts, RECENT_POSTS_COUNT
+from blog.related import get_related_posts
 from django.contrib.auth import get_user_model
 import logging
 user_model = get_user_model()
@@ -13,32 +14,39 @@ logger = logging.getLogger(__name__)
 
 @register.inclusion_tag("blog/post-list.html")
 def recent_posts(post):
-    posts = Post.objects.exclude(pk=post.pk)[:6]
-    logger.debug("Loaded %d recent posts for post %d", len(posts), post.pk)
+    # the shared list is cached, so leave out the current post in memory
+    # rather than with a per-post query
+    posts = [p for p in get_recent_posts() if p["pk"] != post.pk][:RECENT_POSTS_COUNT]
     return {"title": "Recent Posts", "posts": posts}
 
+@register.inclusion_tag("blog/post-list.html")
+def related_posts(post):
+    # the neighbours are worked out ahead of time by blog/related.py
+    return {"title": "Related Posts", "posts": get_related_posts(post)}
+
 @register.filter
 def author_details(author, current_user):
     if not isinstance(author, user_model):
         # return empty string as safe default
         return ""
 
-    if author == current_user:
+    if author.pk == getattr(current_user, "pk", None):
         return format_html("<strong>me</strong>")
 
-    if author.first_name and author.last_name:
-        name = f"{author.first_name} {author.last_name}"
-    else:
-        name = f"{author.username}"
+    return get_author_bylines([author.pk]).get(author.pk, "")
 
-    if author.email:
-        prefix = format_html('<a href="mailto:{}">', author.email)
-        suffix = format_html("</a>")
-    else:
-        prefix = ""
-        suffix = ""
+@register.filter
+def post_byline(post, current_user):
+    # compare ids so that neither the author nor the user needs to be loaded
+    if post.author_id == getattr(current_user, "pk", None):
+        return format_html("<strong>me</strong>")
 
-    return format_html('{}{}{}', prefix, name, suffix)
+    # views that render a page of posts set author_byline in bulk with
+    # blog.caching.attach_author_bylines
+    byline = getattr(post, "author_byline", None)
+    if byline is None:
+        byline = get_author_bylines([post.author_id]).get(post.author_id, "")
+    return byline
 
 @register.simple_tag
 def row(extra_classes=""):
@@ -0,0 +1,225 @@
+import base64
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.models import TokenUser
+
+from blog.api.authentication import (
+    CachedBasicAuthentication,
+    CachedJWTAuthentication,
+    CachedTokenAuthentication,
+    HeaderDispatchAuthentication,
+    verified_credentials,
+)
+from blog.api.serializers import BlangoTokenObtainPairSerializer
+
+
+def basic_auth_header(username, password):
+    credentials = base64.b64encode(f"{username}:{password}".encode()).decode()
+    return "Basic " + credentials
+
+
+class CachedBasicAuthenticationTestCase(TestCase):
+    def setUp(self):
+        verified_credentials.entries.clear()
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com", password="password"
+        )
+        self.factory = APIRequestFactory()
+
+    def authenticate(self, password):
+        request = self.factory.get(
+            "/api/v1/posts/",
+            HTTP_AUTHORIZATION=basic_auth_header("test@example.com", password),
+        )
+        return CachedBasicAuthentication().authenticate(request)
+
+    def test_password_checked_once(self):
+        User = get_user_model()
+        with mock.patch.object(
+            User, "check_password", autospec=True, side_effect=User.check_password
+        ) as check_password:
+            self.assertEqual(self.authenticate("password")[0], self.user)
+            self.assertEqual(self.authenticate("password")[0], self.user)
+            self.assertEqual(self.authenticate("password")[0], self.user)
+        self.assertEqual(check_password.call_count, 1)
+
+    def test_wrong_password_not_cached(self):
+        self.authenticate("password")
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate("wrong")
+        self.assertEqual(len(verified_credentials.entries), 1)
+
+    def test_password_change_invalidates(self):
+        self.authenticate("password")
+        self.user.set_password("new-password")
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate("password")
+        self.assertEqual(self.authenticate("new-password")[0], self.user)
+
+    def test_inactive_user_rejected(self):
+        self.authenticate("password")
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate("password")
+
+
+class CachedTokenAuthenticationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com", password="password"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.factory = APIRequestFactory()
+
+    def authenticate(self, key=None):
+        request = self.factory.get(
+            "/api/v1/posts/", HTTP_AUTHORIZATION=f"Token {key or self.token.key}"
+        )
+        return CachedTokenAuthentication().authenticate(request)
+
+    def test_repeat_requests_use_cache(self):
+        self.authenticate()
+        # neither the token nor the user is read again
+        with self.assertNumQueries(0):
+            user, token = self.authenticate()
+        self.assertEqual(user, self.user)
+        self.assertEqual(token.key, self.token.key)
+
+    def test_deleted_token_rejected(self):
+        self.authenticate()
+        self.token.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(self.token.key)
+
+    def test_inactive_user_rejected(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+
+class CachedJWTAuthenticationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com", password="password", is_staff=True
+        )
+        self.access = str(BlangoTokenObtainPairSerializer.get_token(self.user).access_token)
+        self.factory = APIRequestFactory()
+
+    def authenticate(self, method="get"):
+        request = getattr(self.factory, method)(
+            "/api/v1/posts/", HTTP_AUTHORIZATION=f"Bearer {self.access}"
+        )
+        return CachedJWTAuthentication().authenticate(request)
+
+    def test_repeat_requests_use_cache(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate()
+        self.assertEqual(user, self.user)
+        self.assertEqual(user.email, self.user.email)
+        self.assertTrue(user.is_staff)
+
+    def test_inactive_user_rejected_from_cache(self):
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+        with self.assertNumQueries(0), self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_password_hash_not_cached(self):
+        self.authenticate()
+        self.assertNotIn("password", cache.get(f"api_auth_user_{self.user.pk}"))
+        user, _ = self.authenticate()
+        # loaded when needed, and not overwritten when the user is saved
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password("password"))
+        user, _ = self.authenticate()
+        user.first_name = "Changed"
+        user.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, "Changed")
+        self.assertTrue(self.user.check_password("password"))
+
+    def test_user_change_invalidates(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    @override_settings(JWT_CLAIMS_USER_FOR_READS=True)
+    def test_claims_user_for_reads(self):
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate()
+        self.assertIsInstance(user, TokenUser)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertTrue(user.is_staff)
+        user, _ = self.authenticate("post")
+        self.assertEqual(user, self.user)
+
+
+class HeaderDispatchAuthenticationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        verified_credentials.entries.clear()
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com", password="password"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.factory = APIRequestFactory()
+
+    def authenticator_for(self, **extra):
+        request = self.factory.get("/api/v1/posts/", **extra)
+        return HeaderDispatchAuthentication().get_authenticator(request)
+
+    def test_dispatch(self):
+        self.assertIsInstance(
+            self.authenticator_for(
+                HTTP_AUTHORIZATION=basic_auth_header("test@example.com", "password")
+            ),
+            CachedBasicAuthentication,
+        )
+        self.assertIsInstance(
+            self.authenticator_for(HTTP_AUTHORIZATION=f"Token {self.token.key}"),
+            CachedTokenAuthentication,
+        )
+        self.assertIsInstance(
+            self.authenticator_for(HTTP_AUTHORIZATION="Bearer x.y.z"), CachedJWTAuthentication
+        )
+        self.assertIsInstance(
+            self.authenticator_for(HTTP_COOKIE="sessionid=abc"), SessionAuthentication
+        )
+        self.assertIsNone(self.authenticator_for())
+        self.assertIsNone(self.authenticator_for(HTTP_AUTHORIZATION="Digest abc"))
+
+    def test_anonymous_read_skips_session(self):
+        client = APIClient()
+        with mock.patch.object(SessionAuthentication, "authenticate") as authenticate:
+            response = client.get("/api/v1/posts/")
+        self.assertEqual(response.status_code, 200)
+        authenticate.assert_not_called()
+        self.assertFalse(response.wsgi_request.session.accessed)
+
+    def test_token_request(self):
+        client = APIClient(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        response = client.get("/api/v1/posts/mine/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_unauthenticated_write_challenged(self):
+        response = APIClient().post("/api/v1/posts/", {})
+        self.assertEqual(response.status_code, 401)
+        self.assertTrue(response["WWW-Authenticate"].startswith("Basic"))
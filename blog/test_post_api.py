@@ -1,13 +1,39 @@
-from datetime import datetime
+import io
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse, set_script_prefix
 from django.utils import timezone
+from PIL import Image
 from pytz import UTC
 from rest_framework.authtoken.models import Token
-from rest_framework.test import APIClient
+from rest_framework import serializers
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
 
-from blog.models import Post
+from blog.api import renderers
+from blog.api.fast_serializers import PostListSerializer, post_rows
+from blog.api.serializers import CachedHyperlinkedRelatedField, PostSerializer, url_template
+from blog.analytics import ViewCounter, post_stats, view_counter
+from blog.api.views import PostViewSet
+from blog.management.commands import replay_traffic
+from blog import trending
+from blog.archive import time_window
+from blog.trending import TRENDING_POSTS_CACHE_KEY, rank_trending_posts
+from blog.models import Comment, Post, PostAnalytics, PostArchiveBucket, PostHourlyViews, Tag
 
 class PostApiTestCase(TestCase):
       def setUp(self):
@@ -100,4 +126,592 @@ class PostApiTestCase(TestCase):
         self.assertEqual(post.summary, post_dict["summary"])
         self.assertEqual(post.content, post_dict["content"])
         self.assertEqual(post.author, self.u1)
-        self.assertEqual(post.published_at, datetime(2021, 1, 10, 9, 0, 0, tzinfo=UTC))
\ No newline at end of file
+        self.assertEqual(post.published_at, datetime(2021, 1, 10, 9, 0, 0, tzinfo=UTC))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class PostListSerializerTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        users = [
+            get_user_model().objects.create_user(
+                email=f"test{i}+blango@example.com", password="password"
+            )
+            for i in range(3)
+        ]
+        tags = [Tag.objects.create(value=value) for value in ("zebra", "apple", "mango")]
+        now = timezone.now()
+        for i in range(12):
+            post = Post.objects.create(
+                author=users[i % 3],
+                published_at=None if i == 5 else now - timedelta(hours=i, microseconds=i),
+                title=f"Post {i} Title",
+                slug=f"post-{i}-slug",
+                summary=f"Post {i} Summary",
+                content=f"Post {i} Content",
+            )
+            post.tags.set(tags[: i % 4])
+
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, "hero_images"), exist_ok=True)
+        Image.new("RGB", (300, 200), "red").save(
+            os.path.join(settings.MEDIA_ROOT, "hero_images", "red.png")
+        )
+        Post.objects.filter(slug="post-3-slug").update(hero_image="hero_images/red.png")
+        # the thumbnail is made up front, as the installed Pillow may be too
+        # new for versatileimagefield to make it on demand
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, "__sized__", "hero_images"), exist_ok=True)
+        Image.new("RGB", (100, 100), "red").save(
+            os.path.join(
+                settings.MEDIA_ROOT, "__sized__", "hero_images", "red-thumbnail-100x100.png"
+            )
+        )
+
+        self.request = Request(APIRequestFactory().get("/api/v1/posts/"))
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def test_same_output_as_post_serializer(self):
+        for context in ({"request": self.request}, {"request": self.request, "format": "json"}):
+            posts = Post.objects.order_by("-published_at")
+            expected = self.render(PostSerializer(posts, many=True, context=context).data)
+            actual = self.render(PostListSerializer(post_rows(posts), context=context).data)
+            self.assertEqual(actual, expected)
+        self.assertIn(b"red-thumbnail-100x100.png", actual)
+
+    def test_list_query_count(self):
+        client = APIClient()
+        # the page's count, rows and tags
+        with self.assertNumQueries(3):
+            response = client.get("/api/v1/posts/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 11)
+
+
+
+class CachedHyperlinkedRelatedFieldTestCase(TestCase):
+    EMAILS = [
+        "test@example.com",
+        "first+last@example.com",
+        "o'neil@example.com",
+        "ünïcode@example.com",
+        "spaces here@example.com",
+        "a%2Fb@example.com",
+    ]
+
+    def fields(self, **context):
+        kwargs = dict(view_name="api_user_detail", lookup_field="email", read_only=True)
+        field = CachedHyperlinkedRelatedField(**kwargs)
+        expected_field = serializers.HyperlinkedRelatedField(**kwargs)
+        for f in (field, expected_field):
+            f.bind("author", serializers.Serializer(context=context))
+        return field, expected_field
+
+    def assertSameUrls(self, **context):
+        field, expected_field = self.fields(**context)
+        for email in self.EMAILS:
+            user = get_user_model()(pk=1, email=email)
+            self.assertEqual(field.to_representation(user), expected_field.to_representation(user))
+
+    def test_same_urls_as_reverse(self):
+        request = Request(APIRequestFactory().get("/api/v1/posts/", HTTP_HOST="localhost"))
+        self.assertSameUrls(request=request)
+        self.assertSameUrls(request=request, format="json")
+        secure = Request(APIRequestFactory().get("/api/v1/posts/", secure=True))
+        self.assertSameUrls(request=secure)
+
+    def test_script_prefix(self):
+        request = Request(APIRequestFactory().get("/api/v1/posts/"))
+        set_script_prefix("/blango/")
+        self.addCleanup(set_script_prefix, "/")
+        self.assertSameUrls(request=request)
+
+    def test_reversed_once(self):
+        url_template.cache_clear()
+        request = Request(APIRequestFactory().get("/api/v1/posts/"))
+        field, _ = self.fields(request=request)
+        with mock.patch("blog.api.serializers.reverse", wraps=reverse) as reverse_mock:
+            for i in range(10):
+                field.to_representation(get_user_model()(pk=i + 1, email=f"user{i}@example.com"))
+        self.assertEqual(reverse_mock.call_count, 1)
+
+
+class ApiFormatsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com", password="password"
+        )
+        for i in range(3):
+            post = Post.objects.create(
+                author=self.user,
+                published_at=timezone.now(),
+                title=f"Post {i} Title \u2028 ünïcode",
+                slug=f"post-{i}-slug",
+                summary=f"Post {i} Summary",
+                content=f"Post {i} Content",
+            )
+            post.tags.add(Tag.objects.create(value=f"tag-{i}"))
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+
+    @unittest.skipUnless(renderers.orjson, "orjson is not installed")
+    def test_orjson_output_matches_json_renderer(self):
+        for url in ("/api/v1/posts/", "/api/v1/tags/", "/api/v1/posts/1/"):
+            response = self.client.get(url, HTTP_ACCEPT="application/json")
+            self.assertEqual(response.status_code, 200)
+            self.assertIsInstance(response.accepted_renderer, renderers.ORJSONRenderer)
+            expected = renderers.JSONRenderer().render(response.data)
+            self.assertEqual(response.content, expected)
+
+        data = {1: "one", "nested": {2.5: [None, True]}}
+        self.assertEqual(
+            renderers.ORJSONRenderer().render(data), renderers.JSONRenderer().render(data)
+        )
+
+    @unittest.skipUnless(renderers.msgpack, "msgpack is not installed")
+    def test_msgpack(self):
+        response = self.client.get("/api/v1/posts/", HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        data = renderers.msgpack.unpackb(response.content)
+        self.assertEqual(data, json.loads(self.client.get("/api/v1/posts/").content))
+
+        body = renderers.msgpack.packb(
+            {
+                "title": "Packed Post",
+                "slug": "packed-post",
+                "summary": "Summary",
+                "content": "Content",
+                "author": "http://testserver/api/v1/users/test@example.com",
+                "published_at": "2021-01-10T09:00:00Z",
+                "tags": ["packed"],
+            }
+        )
+        response = self.client.post(
+            "/api/v1/posts/?format=msgpack", body, content_type="application/msgpack"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(renderers.msgpack.unpackb(response.content)["tags"], ["packed"])
+
+
+class PostArchiveTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com", password="password"
+        )
+        self.client = APIClient()
+
+    def create_post(self, published_at, slug):
+        return Post.objects.create(
+            author=self.user,
+            published_at=published_at,
+            title=slug,
+            slug=slug,
+            summary="Summary",
+            content="Content",
+        )
+
+    def buckets(self, period):
+        return {
+            (b.start.isoformat(), b.post_count)
+            for b in PostArchiveBucket.objects.filter(period=period)
+        }
+
+    def test_time_window_today_is_the_local_day(self):
+        now = datetime(2024, 3, 10, 23, 30, tzinfo=UTC)
+        with timezone.override("America/New_York"):
+            start, end = time_window("today", now)
+        # 19:30 in New York, on the day the clocks go forward
+        self.assertEqual(start, datetime(2024, 3, 10, 5, 0, tzinfo=UTC))
+        self.assertEqual(end, datetime(2024, 3, 11, 4, 0, tzinfo=UTC))
+        self.assertEqual(time_window("week", now), (now - timedelta(days=7), None))
+        with self.assertRaises(ValueError):
+            time_window("year", now)
+
+    def test_by_time_uses_half_open_ranges(self):
+        now = timezone.now()
+        today = time_window("today", now)[0]
+        self.create_post(today, "start-of-today")
+        self.create_post(today - timedelta(microseconds=1), "end-of-yesterday")
+        self.create_post(now - timedelta(minutes=5), "new")
+        self.create_post(now - timedelta(days=6), "this-week")
+        self.create_post(now - timedelta(days=8), "last-week")
+
+        def slugs(period_name):
+            response = self.client.get(f"/api/v1/posts/by-time/{period_name}/")
+            self.assertEqual(response.status_code, 200)
+            return {post["slug"] for post in response.json()["results"]}
+
+        self.assertIn("start-of-today", slugs("today"))
+        self.assertNotIn("end-of-yesterday", slugs("today"))
+        self.assertEqual(slugs("new"), {"new"})
+        self.assertNotIn("last-week", slugs("week"))
+        self.assertIn("this-week", slugs("week"))
+        self.assertEqual(self.client.get("/api/v1/posts/by-time/year/").status_code, 404)
+
+    def test_buckets_follow_saves_and_deletes(self):
+        post = self.create_post(datetime(2024, 1, 31, 12, tzinfo=UTC), "a")
+        self.create_post(datetime(2024, 1, 5, 12, tzinfo=UTC), "b")
+        self.create_post(None, "draft")
+        self.assertEqual(self.buckets("month"), {("2024-01-01", 2)})
+        self.assertEqual(self.buckets("day"), {("2024-01-31", 1), ("2024-01-05", 1)})
+
+        post.published_at = datetime(2024, 2, 1, 12, tzinfo=UTC)
+        post.save()
+        self.assertEqual(self.buckets("month"), {("2024-01-01", 1), ("2024-02-01", 1)})
+        self.assertEqual(self.buckets("day"), {("2024-02-01", 1), ("2024-01-05", 1)})
+
+        post.title = "not moved"
+        post.save()
+        post.delete()
+        self.assertEqual(self.buckets("month"), {("2024-01-01", 1)})
+
+        Post.objects.update(published_at=datetime(2023, 6, 1, tzinfo=UTC))
+        call_command("rebuild_post_archive", stdout=io.StringIO())
+        self.assertEqual(self.buckets("month"), {("2023-06-01", 2)})
+
+    def test_bucket_is_not_taken_below_zero(self):
+        post = self.create_post(timezone.now() - timedelta(days=3), "post")
+        # as left by a rebuild that didn't see the post
+        PostArchiveBucket.objects.update(post_count=0)
+        post.delete()
+        self.assertFalse(PostArchiveBucket.objects.exists())
+
+    def test_archive_api(self):
+        self.create_post(datetime(2024, 1, 31, 12, tzinfo=UTC), "a")
+        self.create_post(datetime(2024, 1, 5, 12, tzinfo=UTC), "b")
+        self.create_post(datetime(2023, 12, 1, tzinfo=UTC), "c")
+        self.create_post(timezone.now() + timedelta(days=1), "scheduled")
+
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/v1/posts/archive/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            [
+                {"period": "month", "start": "2024-01-01", "end": "2024-02-01", "post_count": 2},
+                {"period": "month", "start": "2023-12-01", "end": "2024-01-01", "post_count": 1},
+            ],
+        )
+        response = self.client.get("/api/v1/posts/archive/", {"period": "day"})
+        self.assertEqual(
+            [(b["start"], b["post_count"]) for b in response.json()],
+            [("2024-01-31", 1), ("2024-01-05", 1), ("2023-12-01", 1)],
+        )
+        response = self.client.get("/api/v1/posts/archive/", {"period": "year"})
+        self.assertEqual(response.status_code, 400)
+
+
+class PostAnalyticsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        view_counter.take()
+        view_counter.pruned_hour = None
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com", password="password"
+        )
+        self.post = Post.objects.create(
+            author=self.user,
+            published_at=timezone.now(),
+            title="Post Title",
+            slug="post-slug",
+            summary="Summary",
+            content="Content",
+        )
+        self.client = APIClient()
+        patcher = mock.patch.object(PostViewSet, "throttle_classes", [])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_views_are_counted_without_writes(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f"/api/v1/posts/{self.post.pk}/")
+        self.assertFalse([q for q in queries if not q["sql"].startswith("SELECT")])
+        self.client.get("/post/post-slug/")
+        self.assertFalse(PostAnalytics.objects.exists())
+
+        stats = self.client.get(f"/api/v1/posts/{self.post.pk}/stats/").json()
+        self.assertEqual(stats["views"], 2)
+        self.assertEqual(stats["views_24h"], 2)
+
+        view_counter.flush()
+        self.assertEqual(PostAnalytics.objects.get(post=self.post).view_count, 2)
+        self.client.get(f"/api/v1/posts/{self.post.pk}/")
+        view_counter.flush()
+        self.assertEqual(PostAnalytics.objects.get(post=self.post).view_count, 3)
+        self.assertEqual(PostHourlyViews.objects.get(post=self.post).views, 3)
+        self.assertEqual(self.client.get(f"/api/v1/posts/{self.post.pk}/stats/").json()["views"], 3)
+
+    def test_flusher_started_once_per_process(self):
+        counter = ViewCounter()
+        with mock.patch.object(ViewCounter, "run"), mock.patch("atexit.register") as register:
+            counter.start(0)
+            self.assertIsNone(counter.thread)
+            counter.start(10)
+            thread = counter.thread
+            counter.start(10)
+            self.assertIs(counter.thread, thread)
+            register.assert_called_once_with(counter.stop)
+
+            # as in a worker forked after the thread was started
+            counter.record(self.post.pk)
+            with mock.patch("os.getpid", return_value=counter.pid + 1):
+                counter.start(10)
+            self.assertIsNot(counter.thread, thread)
+            self.assertFalse(counter.counts)
+            register.assert_called_once()
+
+        # the test runner sets ANALYTICS_FLUSH_INTERVAL to 0
+        with mock.patch.object(view_counter, "start") as start:
+            self.client.get(f"/api/v1/posts/{self.post.pk}/")
+        start.assert_called_once_with(0)
+
+    def test_trending_score_decays(self):
+        now = timezone.now()
+        for hours_ago, views in ((0, 4), (6, 8), (30, 2)):
+            for _ in range(views):
+                view_counter.record(self.post.pk, now - timedelta(hours=hours_ago))
+        view_counter.flush()
+        stats = post_stats(self.post.pk, now)
+        self.assertEqual(stats["views"], 14)
+        self.assertEqual(stats["views_24h"], 12)
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        elapsed = (now - hour).total_seconds() / 3600
+        expected = sum(
+            views * 0.5 ** ((hours + elapsed) / settings.TRENDING_HALF_LIFE_HOURS)
+            for hours, views in ((0, 4), (6, 8), (30, 2))
+        )
+        self.assertAlmostEqual(stats["trending_score"], expected, places=2)
+
+    def test_flush_keeps_counts_on_error_and_drops_deleted_posts(self):
+        view_counter.record(self.post.pk)
+        with mock.patch("blog.analytics.write_views", side_effect=DatabaseError):
+            view_counter.flush()
+        view_counter.record(12345)
+        view_counter.flush()
+        self.assertEqual(PostAnalytics.objects.get(post=self.post).view_count, 1)
+        self.assertFalse(PostAnalytics.objects.filter(post_id=12345).exists())
+
+    def test_old_hourly_views_are_pruned(self):
+        view_counter.record(self.post.pk, timezone.now() - timedelta(days=30))
+        view_counter.record(self.post.pk)
+        view_counter.flush()
+        self.assertEqual(PostHourlyViews.objects.count(), 1)
+        self.assertEqual(PostAnalytics.objects.get(post=self.post).view_count, 2)
+
+
+class TrendingPostsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com", password="password"
+        )
+        now = timezone.now()
+        self.posts = {
+            slug: Post.objects.create(
+                author=self.user,
+                published_at=published_at,
+                title=slug,
+                slug=slug,
+                summary="Summary",
+                content="Content",
+            )
+            for slug, published_at in (
+                ("new", now - timedelta(hours=1)),
+                ("discussed", now - timedelta(days=2)),
+                ("viewed", now - timedelta(days=3)),
+                ("old", now - timedelta(days=30)),
+                ("scheduled", now + timedelta(days=1)),
+            )
+        }
+        for post in (self.posts["discussed"], self.posts["scheduled"]):
+            for _ in range(5):
+                Comment.objects.create(creator=self.user, content="Comment", content_object=post)
+        PostHourlyViews.objects.create(
+            post=self.posts["viewed"], hour=now.replace(minute=0, second=0, microsecond=0), views=20
+        )
+        self.client = APIClient()
+        patcher = mock.patch.object(PostViewSet, "throttle_classes", [])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def slugs(self, **params):
+        response = self.client.get("/api/v1/posts/trending/", params)
+        self.assertEqual(response.status_code, 200)
+        return [post["slug"] for post in response.json()["results"]]
+
+    def test_ranking(self):
+        call_command("rank_trending_posts", stdout=io.StringIO())
+        self.assertEqual(self.slugs(), ["discussed", "new", "viewed"])
+        with mock.patch.object(PageNumberPagination, "page_size", 1):
+            self.assertEqual(self.slugs(page=2), ["new"])
+
+        # the route serves the stored ranking until the job runs again
+        Comment.objects.create(
+            creator=self.user, content="Comment", content_object=self.posts["old"]
+        )
+        self.assertEqual(self.slugs(), ["discussed", "new", "viewed"])
+
+    def test_not_ranked_in_the_request_when_missing(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.slugs(), [])
+        self.assertLessEqual(len(queries), 1)
+        self.assertIsNone(cache.get(TRENDING_POSTS_CACHE_KEY))
+
+        with mock.patch.object(trending.cache, "set") as cache_set:
+            rank_trending_posts()
+        self.assertEqual(cache_set.call_args.args[2], settings.TRENDING_CACHE_SECONDS)
+
+    def test_page_loads_only_its_posts(self):
+        rank_trending_posts()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/api/v1/posts/trending/")
+        self.assertLessEqual(len(queries), 3)
+
+    @unittest.skipUnless(trending.numpy, "numpy is not installed")
+    def test_numpy_scores_match(self):
+        events = trending.trending_events(timezone.now())
+        scores = trending.score_posts(*events, 12.0)
+        with mock.patch.object(trending, "numpy", None):
+            expected = trending.score_posts(*events, 12.0)
+        self.assertEqual(scores.keys(), expected.keys())
+        for pk, score in expected.items():
+            self.assertAlmostEqual(scores[pk], score)
+
+
+@override_settings(COMMENTS_PAGE_SIZE=3)
+class CommentPagingTestCase(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com", password="password"
+        )
+        self.post = Post.objects.create(
+            author=self.user,
+            published_at=timezone.now(),
+            title="Post",
+            slug="post",
+            summary="Summary",
+            content="Content",
+        )
+        for i in range(7):
+            Comment.objects.create(creator=self.user, content=f"Comment {i}", content_object=self.post)
+        # comments 2 to 4 share a created_at, so pages have to break ties by pk
+        Comment.objects.filter(content__in=["Comment 2", "Comment 3", "Comment 4"]).update(
+            created_at=Comment.objects.get(content="Comment 2").created_at
+        )
+        self.client = APIClient()
+        patcher = mock.patch.object(PostViewSet, "throttle_classes", [])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_detail_has_the_first_page_and_a_link_to_the_rest(self):
+        response = self.client.get(f"/api/v1/posts/{self.post.pk}/")
+        data = response.json()
+        contents = [c["content"] for c in data["comments"]]
+        self.assertEqual(contents, ["Comment 0", "Comment 1", "Comment 2"])
+
+        next_url = data["comments_next"]
+        self.assertTrue(next_url.startswith(f"http://testserver/api/v1/posts/{self.post.pk}/comments/"))
+        pages = []
+        while next_url:
+            page = self.client.get(next_url).json()
+            pages.append([c["content"] for c in page["results"]])
+            next_url = page["next"]
+        self.assertEqual(pages, [["Comment 3", "Comment 4", "Comment 5"], ["Comment 6"]])
+
+    def test_first_page_without_cursor(self):
+        page = self.client.get(f"/api/v1/posts/{self.post.pk}/comments/").json()
+        self.assertEqual(len(page["results"]), 3)
+        self.assertEqual(page["results"][0]["creator"]["email"], "test@example.com")
+
+    def test_invalid_cursor(self):
+        for cursor in ("nonsense", "bm9uc2Vuc2U"):
+            response = self.client.get(f"/api/v1/posts/{self.post.pk}/comments/", {"cursor": cursor})
+            self.assertEqual(response.status_code, 400)
+
+    def test_no_next_link_on_the_last_page(self):
+        Comment.objects.filter(content__in=["Comment 5", "Comment 6", "Comment 0", "Comment 1"]).delete()
+        data = self.client.get(f"/api/v1/posts/{self.post.pk}/").json()
+        self.assertEqual(len(data["comments"]), 3)
+        self.assertIsNone(data["comments_next"])
+
+    def test_post_page(self):
+        response = self.client.get(reverse("blog-post-detail", args=["post"]))
+        self.assertContains(response, "Comment 2")
+        self.assertNotContains(response, "Comment 3")
+        cursor = response.context["comments_next"]
+        self.assertContains(response, f'href="?comments={cursor}"')
+
+        response = self.client.get(reverse("blog-post-detail", args=["post"]), {"comments": cursor})
+        self.assertNotContains(response, "Comment 2")
+        self.assertContains(response, "Comment 5")
+
+
+class ReplayTrafficTestCase(LiveServerTestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com", password="password"
+        )
+        self.post = Post.objects.create(
+            author=self.user,
+            published_at=timezone.now(),
+            title="Post Title",
+            slug="post-slug",
+            summary="Summary",
+            content="Content",
+        )
+        patcher = mock.patch.object(PostViewSet, "throttle_classes", [])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_percentile(self):
+        values = [1.0, 2.0, 3.0, 4.0]
+        self.assertEqual(replay_traffic.percentile(values, 50), 2.0)
+        self.assertEqual(replay_traffic.percentile(values, 95), 4.0)
+        self.assertEqual(replay_traffic.percentile(values, 1), 1.0)
+        self.assertEqual(replay_traffic.percentile([], 50), 0.0)
+
+    def test_route_name(self):
+        detail = replay_traffic.route_name("/api/v1/posts/1/")
+        self.assertEqual(detail, replay_traffic.route_name("/api/v1/posts/2/"))
+        self.assertTrue(detail.startswith("/api/v1/"))
+        self.assertEqual(replay_traffic.route_name("/api/v1/posts/"), "/api/v1/posts/")
+        self.assertEqual(replay_traffic.route_name("/no/such/page/"), "(unresolved)")
+
+    def test_replay(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "traffic.jsonl")
+            with open(path, "w") as f:
+                f.write('{"method": "GET", "path": "/api/v1/posts/"}\n')
+                f.write(f'{{"method": "GET", "path": "/api/v1/posts/{self.post.pk}/"}}\n')
+                f.write('{"method": "POST", "path": "/api/v1/posts/"}\n')
+                f.write('{"method": "GET", "path": "/no/such/page/"}\n')
+            out = io.StringIO()
+            call_command(
+                "replay_traffic", path, url=self.live_server_url, repeat=2, concurrency=2, stdout=out
+            )
+
+        lines = out.getvalue().splitlines()
+        self.assertIn("Replaying 6 requests with concurrency 2", lines)
+        self.assertEqual(lines[-1], "Status codes: 200=4 404=2")
+        header = next(line for line in lines if line.startswith("route"))
+        self.assertEqual(header.split()[1:], ["n", "err%", "p50", "ms", "p95", "ms", "p99", "ms"])
+        rows = {
+            line.rsplit(None, 5)[0].strip(): line.split()[-5:]
+            for line in lines[lines.index(header) + 1 : -2]
+        }
+        self.assertEqual(
+            set(rows),
+            {
+                "GET /api/v1/posts/",
+                "GET " + replay_traffic.route_name(f"/api/v1/posts/{self.post.pk}/"),
+                "GET (unresolved)",
+            },
+        )
+        for route, (n, errors, p50, p95, p99) in rows.items():
+            self.assertEqual(n, "2")
+            self.assertEqual(errors, "100.0%" if route == "GET (unresolved)" else "0.0%")
+            self.assertLessEqual(float(p50), float(p95))
+            self.assertLessEqual(float(p95), float(p99))
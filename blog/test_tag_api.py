@@ -1,9 +1,17 @@
-from django.test import LiveServerTestCase
+import time
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import LiveServerTestCase, TestCase
+from django.utils import timezone
 from requests.auth import HTTPBasicAuth
-from rest_framework.test import RequestsClient
+from rest_framework.test import APIClient, RequestsClient
 
 from django.contrib.auth import get_user_model
-from blog.models import Tag
+from blog.models import Post, Tag
+from blog.tags import bump_tag_index_generation, tag_index
 
 
 class TagApiTestCase(LiveServerTestCase):
@@ -44,4 +52,151 @@ class TagApiTestCase(LiveServerTestCase):
             self.live_server_url + "/api/v1/tags/", {"value": "tag5"}
         )
         self.assertEqual(resp.status_code, 201)
-        self.assertEqual(Tag.objects.all().count(), 5)
\ No newline at end of file
+        self.assertEqual(Tag.objects.all().count(), 5)
+
+
+class TagCountTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="testuser@example.com", password="password"
+        )
+        self.tags = {value: Tag.objects.create(value=value) for value in ("a", "b", "c", "d")}
+        self.client = APIClient()
+
+    def create_post(self, slug, *values):
+        post = Post.objects.create(
+            author=self.user,
+            published_at=timezone.now(),
+            title=slug,
+            slug=slug,
+            summary="Summary",
+            content="Content",
+        )
+        post.tags.add(*(self.tags[value] for value in values))
+        return post
+
+    def counts(self):
+        return dict(Tag.objects.values_list("value", "post_count"))
+
+    def test_count_is_not_taken_below_zero(self):
+        post = self.create_post("p1", "a")
+        Tag.objects.update(post_count=0)
+        post.delete()
+        self.assertEqual(self.counts()["a"], 0)
+
+    def test_counts_follow_tag_changes(self):
+        p1 = self.create_post("p1", "a", "b")
+        p2 = self.create_post("p2", "a")
+        p2.tags.add(self.tags["a"], self.tags["c"])
+        self.assertEqual(self.counts(), {"a": 2, "b": 1, "c": 1, "d": 0})
+
+        # removing a tag the post doesn't have changes nothing
+        p1.tags.remove(self.tags["b"], self.tags["d"])
+        self.assertEqual(self.counts(), {"a": 2, "b": 0, "c": 1, "d": 0})
+        p1.tags.set([self.tags["c"], self.tags["d"]])
+        self.assertEqual(self.counts(), {"a": 1, "b": 0, "c": 2, "d": 1})
+
+        self.tags["d"].posts.add(p2)
+        self.tags["c"].posts.remove(p1)
+        self.assertEqual(self.counts(), {"a": 1, "b": 0, "c": 1, "d": 2})
+        self.tags["d"].posts.clear()
+        p2.tags.clear()
+        self.assertEqual(self.counts(), {"a": 0, "b": 0, "c": 0, "d": 0})
+
+        self.create_post("p3", "a", "b").delete()
+        self.assertEqual(self.counts(), {"a": 0, "b": 0, "c": 0, "d": 0})
+
+    def test_rebuild_tag_counts(self):
+        self.create_post("p1", "a", "b")
+        Tag.objects.update(post_count=7)
+        out = StringIO()
+        call_command("rebuild_tag_counts", stdout=out)
+        self.assertIn("4 tags", out.getvalue())
+        self.assertEqual(self.counts(), {"a": 1, "b": 1, "c": 0, "d": 0})
+
+    def test_popular_tags(self):
+        for i in range(8):
+            self.create_post(f"a{i}", "a", *(["b"] if i < 2 else []))
+        self.create_post("c", "c")
+
+        response = self.client.get("/api/v1/tags/popular/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(t["value"], t["post_count"], t["weight"]) for t in response.json()],
+            [("a", 8, 5), ("b", 2, 2), ("c", 1, 1)],
+        )
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/v1/tags/popular/", {"limit": 1})
+        self.assertEqual([t["value"] for t in response.json()], ["a"])
+
+        # the cached list is dropped when the counts change
+        self.create_post("d", "d", "c")
+        response = self.client.get("/api/v1/tags/popular/", {"limit": 3})
+        self.assertEqual([t["value"] for t in response.json()], ["a", "b", "c"])
+        self.assertEqual(response.json()[2]["post_count"], 2)
+
+        self.assertEqual(self.client.get("/api/v1/tags/popular/", {"limit": "x"}).status_code, 400)
+
+
+class TagAutocompleteTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        for value in ("django", "Docker", "docs", "dog", "python", "pytest", "ümlaut"):
+            Tag.objects.create(value=value)
+        tag_index.load()
+        self.client = APIClient()
+
+    def search(self, q, **params):
+        response = self.client.get("/api/v1/tags/autocomplete/", {"q": q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [tag["value"] for tag in response.json()]
+
+    def test_prefix_search(self):
+        self.assertEqual(self.search("do"), ["Docker", "docs", "dog"])
+        self.assertEqual(self.search("DOC"), ["Docker", "docs"])
+        self.assertEqual(self.search("d", limit=2), ["django", "Docker"])
+        self.assertEqual(self.search("Üm"), ["ümlaut"])
+        self.assertEqual(self.search("x"), [])
+        self.assertEqual(self.search(""), [])
+        with self.assertNumQueries(0):
+            self.search("py")
+
+    def test_index_follows_tag_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.create(value="pydantic")
+        self.assertEqual(self.search("py"), ["pydantic", "pytest", "python"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.value = "rust"
+            tag.save()
+        self.assertEqual(self.search("py"), ["pytest", "python"])
+        self.assertEqual(self.search("ru"), ["rust"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.get(value="pytest").delete()
+        self.assertEqual(self.search("py"), ["python"])
+
+    def test_index_reloads_after_a_change_elsewhere(self):
+        # another process adding a tag bumps the generation in the shared cache
+        Tag.objects.bulk_create([Tag(value="pyramid")])
+        bump_tag_index_generation()
+        self.assertEqual(self.search("pyr"), [])
+        with mock.patch("blog.tags.TAG_INDEX_CHECK_INTERVAL", 0):
+            self.assertEqual(self.search("pyr"), ["pyramid"])
+
+    def test_index_reloads_after_a_tag_is_added_elsewhere_without_a_shared_cache(self):
+        # the other process's generation bump never reaches this cache
+        Tag.objects.bulk_create([Tag(value="pyramid")])
+        with mock.patch("blog.tags.TAG_INDEX_CHECK_INTERVAL", 0):
+            self.assertEqual(self.search("pyr"), ["pyramid"])
+            Tag.objects.filter(value="pyramid").delete()
+            self.assertEqual(self.search("pyr"), [])
+
+    def test_search_time(self):
+        Tag.objects.bulk_create(Tag(value=f"tag-{i:05}") for i in range(20000))
+        tag_index.load()
+        start = time.perf_counter()
+        for i in range(1000):
+            tag_index.search(f"tag-{i:03}")
+        self.assertLess((time.perf_counter() - start) / 1000, 0.001)
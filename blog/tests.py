@@ -1,3 +1,765 @@
-from django.test import TestCase
+import os
+import tempfile
+import gzip
+import unittest
+from contextlib import contextmanager
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from django.views.decorators.cache import cache_page
+from django.views.decorators.vary import vary_on_headers
+from rest_framework.authtoken.models import Token
+
+from blango_tasks.models import Task
+from blango_tasks.worker import Worker
+from blango.middleware import CompressionMiddleware, choose_encoding, compress
+from blango.settings import build_middleware
+from blango.traffic import read_traffic, TrafficRecorderMiddleware
+from blog.api import schema
+from blog.api.throttling import AnonBurstThrottle
+from blog.api.views import PostViewSet
+from blog.async_views import async_read_view
+from blog.management.commands.import_report import parse_import_times
+from blog.warmup import warm_up
+from blog.caching import attach_author_bylines
+from blog import related
+from blog.intake import CommentRejected, check_comment, spam_reason, take_token
+from blog.models import Comment, Post, RelatedPost, SummaryWord, Tag
+from blog.tasks import refresh_related
+from blog.templatetags.blog_extras import post_byline, recent_posts, related_posts
+
+
+class RecentPostsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com", password="password"
+        )
+        now = timezone.now()
+        self.posts = [
+            Post.objects.create(
+                author=self.user,
+                published_at=now - timedelta(hours=i),
+                title=f"Post {i} Title",
+                slug=f"post-{i}-slug",
+                summary=f"Post {i} Summary",
+                content=f"Post {i} Content",
+            )
+            for i in range(8)
+        ]
+        self.unpublished = Post.objects.create(
+            author=self.user,
+            published_at=now + timedelta(days=1),
+            title="Future Post",
+            slug="future-post",
+            summary="Future Summary",
+            content="Future Content",
+        )
+
+    def test_recent_posts_excludes_current_and_unpublished(self):
+        posts = recent_posts(self.posts[0])["posts"]
+        self.assertEqual(
+            [p["slug"] for p in posts], [p.slug for p in self.posts[1:7]]
+        )
+
+        posts = recent_posts(self.posts[3])["posts"]
+        self.assertEqual(len(posts), 6)
+        self.assertNotIn(self.posts[3].slug, [p["slug"] for p in posts])
+        self.assertNotIn(self.unpublished.slug, [p["slug"] for p in posts])
+
+    def test_recent_posts_cached_between_renders(self):
+        recent_posts(self.posts[0])
+        with self.assertNumQueries(0):
+            recent_posts(self.posts[1])
+            recent_posts(self.posts[2])
+
+    def test_recent_posts_invalidated_on_publish(self):
+        recent_posts(self.posts[0])
+        self.unpublished.published_at = timezone.now()
+        self.unpublished.save()
+        posts = recent_posts(self.posts[0])["posts"]
+        self.assertEqual(posts[0]["slug"], self.unpublished.slug)
+
+
+class AuthorBylineTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.u1 = get_user_model().objects.create_user(
+            email="test@example.com", password="password",
+            first_name="Test", last_name="User",
+        )
+        self.u2 = get_user_model().objects.create_user(
+            email="test2@example.com", password="password2"
+        )
+        for i, author in enumerate([self.u1, self.u2, self.u1]):
+            Post.objects.create(
+                author=author,
+                published_at=timezone.now(),
+                title=f"Post {i} Title",
+                slug=f"post-{i}-slug",
+                summary=f"Post {i} Summary",
+                content=f"Post {i} Content",
+            )
+
+    def test_bylines_fetched_in_bulk(self):
+        # one query for the posts and one for the two authors
+        with self.assertNumQueries(2):
+            posts = attach_author_bylines(Post.objects.all())
+        self.assertEqual(
+            posts[0].author_byline,
+            '<a href="mailto:test@example.com">Test User</a>',
+        )
+        self.assertEqual(
+            posts[1].author_byline,
+            '<a href="mailto:test2@example.com">test2@example.com</a>',
+        )
+
+        # the bylines are cached, so only the posts are queried
+        with self.assertNumQueries(1):
+            attach_author_bylines(Post.objects.all())
+
+    def test_byline_for_current_user(self):
+        posts = attach_author_bylines(Post.objects.all())
+        self.assertEqual(post_byline(posts[0], self.u1), "<strong>me</strong>")
+        self.assertEqual(post_byline(posts[1], self.u1), posts[1].author_byline)
+
+    def test_byline_invalidated_on_user_save(self):
+        attach_author_bylines(Post.objects.all())
+        self.u2.first_name = "Second"
+        self.u2.last_name = "Author"
+        self.u2.save()
+        posts = attach_author_bylines(Post.objects.all())
+        self.assertEqual(
+            posts[1].author_byline,
+            '<a href="mailto:test2@example.com">Second Author</a>',
+        )
+
+
+class AsyncReadViewTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.calls = []
+
+        @cache_page(60)
+        @vary_on_headers("Authorization")
+        def view(request):
+            self.calls.append(request)
+            return HttpResponse("hello")
+
+        self.async_view = async_read_view(view)
+
+    async def test_cached_page_served_without_sync_view(self):
+        await self.async_view(self.factory.get("/page/"))
+        response = await self.async_view(self.factory.get("/page/"))
+        self.assertEqual(response.content, b"hello")
+        self.assertEqual(len(self.calls), 1)
+
+    async def test_requests_with_credentials_delegated(self):
+        await self.async_view(self.factory.get("/page/"))
+        await self.async_view(
+            self.factory.get("/page/", HTTP_AUTHORIZATION="Token abc")
+        )
+        await self.async_view(self.factory.post("/page/"))
+        self.assertEqual(len(self.calls), 3)
+
+
+@override_settings(ROOT_URLCONF="blango.asgi_urls")
+class AsyncUrlsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com", password="password"
+        )
+        self.post = Post.objects.create(
+            author=self.user,
+            published_at=timezone.now(),
+            title="Post 1 Title",
+            slug="post-1-slug",
+            summary="Post 1 Summary",
+            content="Post 1 Content",
+        )
+        self.token = Token.objects.create(user=self.user)
+
+    async def test_read_views(self):
+        for url in [
+            "/",
+            "/post/post-1-slug/",
+            "/api/v1/posts/",
+            f"/api/v1/posts/{self.post.pk}/",
+            "/api/v1/users/test@example.com",
+        ]:
+            for _ in range(2):
+                resp = await self.async_client.get(url)
+                self.assertEqual(resp.status_code, 200, url)
+
+        resp = await self.async_client.get("/api/v1/posts/")
+        self.assertEqual(resp.json()["results"][0]["slug"], "post-1-slug")
+
+    async def test_throttled_once_from_the_page_cache(self):
+        with mock.patch.object(AnonBurstThrottle, "rate", "2/minute", create=True):
+            statuses = [
+                (await self.async_client.get("/api/v1/posts/")).status_code for _ in range(3)
+            ]
+        self.assertEqual(statuses, [200, 200, 429])
+        # the throttled request was answered without the sync view counting
+        # it again
+        self.assertEqual(len(cache.get("throttle_anon_sustained_127.0.0.1")), 3)
+
+    async def test_mine_not_shadowed(self):
+        resp = await self.async_client.get(
+            "/api/v1/posts/mine/", authorization="Token " + self.token.key
+        )
+        self.assertEqual(resp.status_code, 200)
+
+    async def test_write_delegated(self):
+        resp = await self.async_client.put(
+            f"/api/v1/posts/{self.post.pk}/",
+            {
+                "title": "New Title",
+                "slug": "post-1-slug",
+                "summary": "Post 1 Summary",
+                "content": "Post 1 Content",
+                "author": "http://testserver/api/v1/users/test@example.com",
+                "tags": [],
+                "comments": [],
+            },
+            content_type="application/json",
+            authorization="Token " + self.token.key,
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["title"], "New Title")
+
+
+class TrafficRecorderTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "traffic.jsonl")
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_records_are_replayable(self):
+        with self.settings(TRAFFIC_LOG_PATH=self.path):
+            middleware = TrafficRecorderMiddleware(lambda request: HttpResponse("hello"))
+        middleware(self.factory.get("/api/v1/posts/", {"page": "2"}))
+        middleware(
+            self.factory.get("/api/v1/tags/", HTTP_AUTHORIZATION="Token abc")
+        )
+        middleware.recorder.close()
+
+        records = list(read_traffic([self.path]))
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]["path"], "/api/v1/posts/")
+        self.assertEqual(records[0]["query"], "page=2")
+        self.assertIsNone(records[0]["auth"])
+        self.assertEqual(records[0]["status"], 200)
+        self.assertEqual(records[0]["bytes"], 5)
+        self.assertEqual(records[1]["auth"], "Token")
+        self.assertNotIn("abc", open(self.path).read())
+
+    def test_full_queue_drops_records(self):
+        with self.settings(TRAFFIC_LOG_PATH=self.path, TRAFFIC_QUEUE_SIZE=1):
+            middleware = TrafficRecorderMiddleware(lambda request: HttpResponse("hello"))
+        # stop the writer so nothing is taken off the queue
+        middleware.recorder.listener.stop()
+        for _ in range(3):
+            middleware(self.factory.get("/"))
+        self.assertEqual(middleware.recorder.dropped, 2)
+
+
+class ApiSchemaTestCase(TestCase):
+    def setUp(self):
+        schema._schema = None
+        self.schema_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(API_SCHEMA_DIR=self.schema_dir)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_schema_built_once_and_served_with_etag(self):
+        with mock.patch.object(schema, "build_schema", wraps=schema.build_schema) as build:
+            response = self.client.get("/api/v1/swagger.json")
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("/posts/", response.json()["paths"])
+            etag = response["ETag"]
+
+            response = self.client.get("/api/v1/swagger.json", HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+            response = self.client.get("/api/v1/swagger/?format=openapi")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["ETag"], etag)
+
+            # drf_yasg's YAML codec doesn't work with every ruamel.yaml
+            if "swagger.yaml" in schema.get_schema().documents:
+                response = self.client.get("/api/v1/swagger.yaml")
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.content.startswith(b"swagger:"))
+        self.assertEqual(build.call_count, 1)
+
+    def test_build_command(self):
+        out = StringIO()
+        call_command("build_api_schema", stdout=out)
+        self.assertIn("Wrote swagger.json", out.getvalue())
+        self.assertTrue(os.path.exists(os.path.join(self.schema_dir, "swagger.json")))
+
+        call_command("build_api_schema", stdout=out)
+        self.assertIn("up to date", out.getvalue())
+
+        # a new process loads the written documents instead of building
+        schema._schema = None
+        with mock.patch.object(schema, "build_schema") as build:
+            response = self.client.get("/api/v1/swagger.json")
+        self.assertEqual(response.status_code, 200)
+        build.assert_not_called()
+
+    def test_urlconf_change_rebuilds(self):
+        call_command("build_api_schema", stdout=StringIO())
+        self.assertIsNone(schema.read_schema(self.schema_dir, "another fingerprint"))
+
+    def test_serializer_and_pagination_changes_change_the_fingerprint(self):
+        from django.urls import get_resolver
+        from rest_framework import serializers as drf_serializers
+
+        from blog.api.serializers import TagSerializer
+
+        def fingerprint():
+            return schema.resolver_fingerprint.__wrapped__(get_resolver())
+
+        before = fingerprint()
+        self.assertEqual(fingerprint(), before)
+        fields = TagSerializer().get_fields()
+        fields["extra"] = drf_serializers.IntegerField()
+        with mock.patch.object(TagSerializer, "get_fields", return_value=fields):
+            self.assertNotEqual(fingerprint(), before)
+        rest_framework = {**settings.REST_FRAMEWORK, "PAGE_SIZE": 10}
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            self.assertNotEqual(fingerprint(), before)
+
+
+class ImportReportTestCase(TestCase):
+    def test_parse_import_times(self):
+        lines = [
+            "import time: self [us] | cumulative | imported package",
+            "import time:       120 |        120 |   _io",
+            "import time:       300 |        420 | blango",
+            "not an import time line",
+        ]
+        self.assertEqual(
+            list(parse_import_times(lines)), [("_io", 120, 120, 1), ("blango", 300, 420, 0)]
+        )
+
+    def test_warm_up_skipped(self):
+        with mock.patch("subprocess.run") as run:
+            run.return_value = mock.Mock(
+                returncode=0, stderr="import time:       300 |        420 | blango\n"
+            )
+            call_command("import_report", stdout=StringIO())
+        self.assertEqual(run.call_args.kwargs["env"]["BLANGO_SKIP_WARM_UP"], "1")
+
+        with mock.patch.dict(os.environ, {"BLANGO_SKIP_WARM_UP": "1"}):
+            with mock.patch("blog.api.schema.get_schema") as get_schema:
+                warm_up()
+        get_schema.assert_not_called()
+
+
+class ProdMiddlewareTestCase(TestCase):
+    PROD_MIDDLEWARE = build_middleware(compress=True, conditional_get=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com", password="password"
+        )
+        for i in range(20):
+            Post.objects.create(
+                author=self.user,
+                published_at=timezone.now() - timedelta(hours=i),
+                title=f"Post {i} Title",
+                slug=f"post-{i}-slug",
+                summary=f"Post {i} Summary",
+                content=f"Post {i} Content " * 20,
+            )
+
+    def test_stacks(self):
+        shared = [
+            "django.contrib.sessions.middleware.SessionMiddleware",
+            "django.middleware.common.CommonMiddleware",
+            "django.contrib.auth.middleware.AuthenticationMiddleware",
+            "django.contrib.messages.middleware.MessageMiddleware",
+        ]
+        self.assertEqual(
+            build_middleware(debug_toolbar=True),
+            [
+                "blango.traffic.TrafficRecorderMiddleware",
+                "debug_toolbar.middleware.DebugToolbarMiddleware",
+                "django.middleware.security.SecurityMiddleware",
+            ]
+            + shared,
+        )
+        # compression comes before the ETag is computed on the uncompressed body
+        self.assertEqual(
+            self.PROD_MIDDLEWARE,
+            [
+                "blango.traffic.TrafficRecorderMiddleware",
+                "django.middleware.security.SecurityMiddleware",
+                "blango.middleware.CompressionMiddleware",
+                "django.middleware.http.ConditionalGetMiddleware",
+            ]
+            + shared,
+        )
+
+    @mock.patch.object(PostViewSet, "throttle_classes", [])
+    def test_anonymous_post_list(self):
+        with override_settings(MIDDLEWARE=self.PROD_MIDDLEWARE):
+            client = Client()
+            client.get("/api/v1/posts/", HTTP_ACCEPT_ENCODING="gzip")
+            # served from the page cache: the middleware adds no queries and
+            # doesn't load the session
+            with self.assertNumQueries(0):
+                response = client.get("/api/v1/posts/", HTTP_ACCEPT_ENCODING="gzip")
+            self.assertFalse(response.wsgi_request.session.accessed)
+            self.assertIn(response["Content-Encoding"], ("gzip", "br"))
+
+            response = client.get(
+                "/api/v1/posts/", HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=response["ETag"]
+            )
+            self.assertEqual(response.status_code, 304)
+
+
+class CompressionMiddlewareTestCase(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.body = b'{"results": [' + b'{"content": "Post content"}, ' * 100 + b"]}"
+        self.middleware = CompressionMiddleware(
+            lambda request: HttpResponse(self.body, content_type="application/json")
+        )
+
+    def get(self, accept_encoding="gzip"):
+        return self.middleware(self.factory.get("/", HTTP_ACCEPT_ENCODING=accept_encoding))
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding("gzip, deflate"), "gzip")
+        self.assertEqual(choose_encoding("gzip;q=0, deflate"), None)
+        self.assertEqual(choose_encoding("*"), choose_encoding("br, gzip"))
+        self.assertEqual(choose_encoding(""), None)
+
+    def test_gzip(self):
+        response = self.get()
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertEqual(gzip.decompress(response.content), self.body)
+        self.assertEqual(int(response["Content-Length"]), len(response.content))
+
+        response = self.get("identity")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.content, self.body)
+
+    def test_small_and_binary_responses_untouched(self):
+        self.body = b"{}"
+        self.assertFalse(self.get().has_header("Content-Encoding"))
+
+        middleware = CompressionMiddleware(
+            lambda request: HttpResponse(b"\x89PNG" * 1000, content_type="image/png")
+        )
+        response = middleware(self.factory.get("/", HTTP_ACCEPT_ENCODING="gzip"))
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_same_body_compressed_once(self):
+        with mock.patch("blango.middleware.compress", wraps=compress) as compress_mock:
+            first = self.get()
+            second = self.get()
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(compress_mock.call_count, 1)
+
+    def test_streaming(self):
+        middleware = CompressionMiddleware(
+            lambda request: StreamingHttpResponse(
+                (b"line %d\n" % i for i in range(1000)), content_type="text/plain"
+            )
+        )
+        response = middleware(self.factory.get("/", HTTP_ACCEPT_ENCODING="gzip"))
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(
+            gzip.decompress(b"".join(response.streaming_content)),
+            b"".join(b"line %d\n" % i for i in range(1000)),
+        )
+
+
+class RelatedPostsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com", password="password"
+        )
+        self.tags = {value: Tag.objects.create(value=value) for value in "abcdef"}
+
+    def create_post(self, slug, tags, summary="", published=True):
+        with self.refreshed():
+            post = Post.objects.create(
+                author=self.user,
+                published_at=timezone.now() - timedelta(hours=1) if published else None,
+                title=slug,
+                slug=slug,
+                summary=summary,
+                content="Content",
+            )
+            post.tags.add(*(self.tags[value] for value in tags))
+        return post
+
+    @contextmanager
+    def refreshed(self):
+        # the refresh_related tasks queued on commit are run by a worker
+        with self.captureOnCommitCallbacks(execute=True):
+            yield
+        worker = Worker()
+        while worker.run_once():
+            pass
+
+    def related_slugs(self, post):
+        return [p["slug"] for p in related_posts(post)["posts"]]
+
+    def stored(self):
+        return {
+            (post_id, related_id, round(score, 5))
+            for post_id, related_id, score in RelatedPost.objects.values_list(
+                "post_id", "related_id", "score"
+            )
+        }
+
+    @override_settings(RELATED_POSTS_SUMMARY_WEIGHT=0)
+    def test_neighbours_by_tags(self):
+        p1 = self.create_post("p1", "abc")
+        p2 = self.create_post("p2", "ab")
+        p3 = self.create_post("p3", "c")
+        self.create_post("p4", "f")
+        draft = self.create_post("draft", "abc", published=False)
+
+        self.assertEqual(self.related_slugs(p1), ["p2", "p3"])
+        self.assertEqual(self.related_slugs(p2), ["p1"])
+        self.assertEqual(self.related_slugs(draft), [])
+        with self.assertNumQueries(1):
+            related_posts(p3)
+
+        # tagging a post moves it into other posts' neighbours
+        with self.refreshed():
+            p3.tags.add(self.tags["a"], self.tags["b"])
+        self.assertEqual(self.related_slugs(p2), ["p3", "p1"])
+        with self.refreshed():
+            self.tags["a"].posts.remove(p3)
+            self.tags["b"].posts.clear()
+        self.assertEqual(self.related_slugs(p2), ["p1"])
+        self.assertEqual(self.related_slugs(p3), ["p1"])
+
+        incremental = self.stored()
+        call_command("rebuild_related_posts", stdout=StringIO())
+        self.assertEqual(self.stored(), incremental)
+
+        with self.refreshed():
+            p1.delete()
+        self.assertEqual(self.related_slugs(p3), [])
+        with self.refreshed():
+            draft.published_at = timezone.now() - timedelta(minutes=1)
+            draft.save()
+        self.assertEqual(self.related_slugs(p3), ["draft"])
+
+    @override_settings(RELATED_POSTS_SUMMARY_WEIGHT=0)
+    def test_tag_changes_queue_one_refresh(self):
+        p1 = self.create_post("p1", "ab")
+        p2 = self.create_post("p2", "c")
+        with self.captureOnCommitCallbacks(execute=True):
+            p1.tags.set([self.tags["c"]])
+            p2.tags.add(self.tags["d"])
+        tasks = Task.objects.filter(name=refresh_related.name)
+        self.assertEqual(list(tasks.values_list("args", flat=True)), [[[p1.pk, p2.pk]]])
+
+        # nothing is recomputed in the request
+        self.assertEqual(self.related_slugs(p1), [])
+        Worker().run_once()
+        self.assertEqual(self.related_slugs(p1), ["p2"])
+        self.assertFalse(tasks.exists())
+
+    @override_settings(RELATED_POSTS_COUNT=2)
+    def test_summary_words_and_count(self):
+        # the posts tagged "a" are told apart by the words of their summaries
+        p1 = self.create_post("p1", "a", "Caching querysets with Redis")
+        self.create_post("p2", "a", "Redis caching in production")
+        self.create_post("p3", "a", "Writing templates")
+        p4 = self.create_post("p4", "c", "Unrelated gardening notes")
+        self.create_post("p5", "a", "Forms and templates")
+        self.assertEqual(self.related_slugs(p1), ["p2", "p5"])
+
+        call_command("rebuild_related_posts", stdout=StringIO())
+        self.assertEqual(SummaryWord.objects.get(word="templates").post_count, 2)
+        self.assertFalse(SummaryWord.objects.filter(word="and").exists())
+        # a refresh weights the words by the stored counts
+        with self.refreshed():
+            p4.tags.set([self.tags["a"]])
+            p4.summary = "Writing forms"
+            p4.save()
+        self.assertEqual(self.related_slugs(p4), ["p5", "p3"])
+        call_command("rebuild_related_posts", stdout=StringIO())
+        self.assertEqual(self.related_slugs(p4), ["p5", "p3"])
+
+    def test_post_detail_page_and_api(self):
+        p1 = self.create_post("p1", "ab")
+        self.create_post("p2", "a")
+        self.create_post("p3", "d")
+        response = self.client.get("/post/p1/")
+        self.assertContains(response, "Related Posts")
+        self.assertContains(response, 'href="/post/p2/"')
+
+        with mock.patch.object(PostViewSet, "throttle_classes", []):
+            response = self.client.get(f"/api/v1/posts/{p1.pk}/related/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p["slug"] for p in response.json()], ["p2"])
+        self.assertEqual(response.json()[0]["tags"], ["a"])
+
+    @unittest.skipUnless(related.numpy, "numpy is not installed")
+    def test_numpy_matches_inverted_index(self):
+        for i in range(30):
+            self.create_post(f"p{i}", "abcdef"[i % 6] + "abcdef"[i % 4], f"word{i % 3} text")
+        vectors = related.post_vectors()
+        with mock.patch.object(related, "numpy", None):
+            expected = related.all_neighbours(vectors, 5)
+        actual = related.all_neighbours(vectors, 5)
+        self.assertEqual(expected.keys(), actual.keys())
+        for post_id, neighbours in expected.items():
+            self.assertEqual(len(actual[post_id]), len(neighbours))
+            for (_, score), (_, actual_score) in zip(neighbours, actual[post_id]):
+                self.assertAlmostEqual(score, actual_score, places=5)
+
+
+@override_settings(
+    COMMENT_USER_BURST=2,
+    COMMENT_USER_INTERVAL=60.0,
+    COMMENT_IP_BURST=3,
+    COMMENT_IP_INTERVAL=60.0,
+    COMMENT_BLOCKED_WORDS=["casino"],
+)
+class CommentIntakeTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com", password="password"
+        )
+        self.post = Post.objects.create(
+            author=self.user,
+            published_at=timezone.now(),
+            title="Post",
+            slug="post",
+            summary="Summary",
+            content="Content",
+        )
+        self.client.force_login(self.user)
+
+    def comment(self, content, client=None):
+        return (client or self.client).post("/post/post/", {"content": content})
+
+    def test_anonymous_users_cannot_comment(self):
+        self.client.logout()
+        self.assertEqual(self.comment("Hello").status_code, 403)
+        self.assertNotContains(self.client.get("/post/post/"), "Add Comment")
+        self.assertFalse(Comment.objects.exists())
+
+    def test_inactive_users_cannot_comment(self):
+        self.user.is_active = False
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertEqual(self.comment("Hello").status_code, 403)
+
+    def test_user_bucket(self):
+        self.assertEqual(self.comment("First").status_code, 302)
+        self.assertEqual(self.comment("Second").status_code, 302)
+        response = self.comment("Third")
+        self.assertContains(response, "You are commenting too often", status_code=429)
+        self.assertEqual(Comment.objects.count(), 2)
+
+    def test_ip_bucket(self):
+        for i in range(3):
+            user = get_user_model().objects.create_user(email=f"user{i}@example.com")
+            client = Client()
+            client.force_login(user)
+            self.assertEqual(self.comment(f"From user {i}", client).status_code, 302)
+        self.assertEqual(self.comment("From the same address").status_code, 429)
+        # the user's own bucket wasn't touched by the rejected comment
+        self.assertIsNone(cache.get(f"blog_comment_bucket_user_{self.user.pk}"))
+
+    def test_bucket_refills(self):
+        self.assertIsNone(take_token("bucket", 1, 10.0, now=100.0))
+        self.assertEqual(take_token("bucket", 1, 10.0, now=104.0), 6.0)
+        self.assertIsNone(take_token("bucket", 1, 10.0, now=110.0))
+
+    def test_duplicates(self):
+        self.assertEqual(self.comment("Nice post").status_code, 302)
+        response = self.comment("  nice   POST ")
+        self.assertContains(response, "already posted", status_code=400)
+        self.assertEqual(Comment.objects.count(), 1)
+        # the rejected duplicate didn't take the second of the user's tokens
+        self.assertEqual(self.comment("Another comment").status_code, 302)
+
+    def test_spam_reason(self):
+        self.assertIsNone(spam_reason("A perfectly normal comment, see https://example.com"))
+        self.assertIsNotNone(spam_reason("http://a http://b www.c http://d"))
+        self.assertIsNotNone(spam_reason("THIS IS THE BEST POST I HAVE EVER READ"))
+        self.assertIsNotNone(spam_reason("Great!!!!!!!!!!!!!"))
+        self.assertIsNotNone(spam_reason("Visit my Casino"))
+        response = self.comment("Visit my casino")
+        self.assertContains(response, "blocked word", status_code=400)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_rejected_comments_are_not_written(self):
+        self.comment("First")
+        self.comment("Second")
+        with self.assertNumQueries(0):
+            with self.assertRaises(CommentRejected):
+                check_comment(self.user, "127.0.0.1", self.post, "Third")
+
+    def put_comments(self, *contents):
+        token, _ = Token.objects.get_or_create(user=self.user)
+        data = {
+            "title": "Post",
+            "slug": "post",
+            "summary": "Summary",
+            "content": "Content",
+            "author": "http://testserver/api/v1/users/test@example.com",
+            "tags": [],
+            "comments": [{"content": content} for content in contents],
+        }
+        with mock.patch.object(PostViewSet, "throttle_classes", []):
+            return self.client.put(
+                f"/api/v1/posts/{self.post.pk}/",
+                data,
+                content_type="application/json",
+                HTTP_AUTHORIZATION="Token " + token.key,
+            )
+
+    def test_api_comments_are_checked(self):
+        response = self.put_comments("Visit my casino")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Comment.objects.exists())
+
+    @override_settings(COMMENT_USER_BURST=10, COMMENT_IP_BURST=10)
+    def test_rejected_api_comments_can_be_sent_again(self):
+        # the first comment passed its checks but wasn't saved
+        response = self.put_comments("Nice post", "Visit my casino")
+        self.assertContains(response, "blocked word", status_code=400)
+        self.assertFalse(Comment.objects.exists())
+
+        response = self.put_comments("Nice post", "Thanks")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Comment.objects.count(), 2)
+        response = self.put_comments("Nice post")
+        self.assertContains(response, "already posted", status_code=400)
+        response = self.put_comments("Another one", "another ONE")
+        self.assertContains(response, "already posted", status_code=400)
+        self.assertEqual(Comment.objects.count(), 2)
@@ -0,0 +1,123 @@
+"""
+The trending posts ranking served by the posts/trending API route.
+
+A post's score adds up, over the last TRENDING_WINDOW_DAYS:
+
+- TRENDING_COMMENT_WEIGHT for each comment on it,
+- TRENDING_VIEW_WEIGHT for each view (from blog/analytics.py), and
+- TRENDING_PUBLISH_WEIGHT for having been published,
+
+each halved for every TRENDING_HALF_LIFE_HOURS since it happened. The
+events are read in three queries and summed per post as arrays, with
+NumPy when it is installed.
+
+Scoring is too slow to do per request, so rank_trending_posts() is run on
+a schedule by the rank_trending_posts management command (from cron, say
+every five minutes) and stores the ranked post ids in the cache for
+TRENDING_CACHE_SECONDS, which should be a few times the schedule's
+interval. The route pages through that list and loads only the posts on
+the page. This needs the cache shared by the server processes (CACHES, see
+the blog.E001 deploy check); with a local memory cache only the process
+that ran the command sees the list. While the list is missing, because the
+command hasn't run or stopped running, the route lists no posts rather
+than ranking them inside a request.
+"""
+import logging
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.utils import timezone
+
+from blog.models import Comment, Post, PostHourlyViews
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+TRENDING_POSTS_CACHE_KEY = "blog_trending_posts"
+
+
+def trending_events(now):
+    """
+    The scored events since the start of the window, as parallel lists of
+    post ids, ages in hours and weights.
+    """
+    since = now - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+    post_ids, ages, weights = [], [], []
+
+    def add(rows, weight):
+        for post_id, when, count in rows:
+            post_ids.append(post_id)
+            ages.append(max(0.0, (now - when).total_seconds() / 3600))
+            weights.append(weight * count)
+
+    published = Post.objects.filter(published_at__gte=since, published_at__lte=now)
+    add(
+        ((pk, published_at, 1) for pk, published_at in published.values_list("pk", "published_at")),
+        settings.TRENDING_PUBLISH_WEIGHT,
+    )
+    comments = Comment.objects.filter(
+        content_type=ContentType.objects.get_for_model(Post), created_at__gte=since
+    )
+    add(
+        ((pk, created_at, 1) for pk, created_at in comments.values_list("object_id", "created_at")),
+        settings.TRENDING_COMMENT_WEIGHT,
+    )
+    views = PostHourlyViews.objects.filter(hour__gte=since)
+    add(views.values_list("post_id", "hour", "views"), settings.TRENDING_VIEW_WEIGHT)
+    return post_ids, ages, weights
+
+
+def score_posts(post_ids, ages, weights, half_life):
+    """
+    A dict of post id to the sum of its decayed weights.
+    """
+    if not post_ids:
+        return {}
+    if numpy is not None:
+        ids, index = numpy.unique(numpy.array(post_ids), return_inverse=True)
+        decayed = numpy.array(weights) * numpy.exp2(-numpy.array(ages) / half_life)
+        totals = numpy.bincount(index, weights=decayed)
+        return dict(zip(ids.tolist(), totals.tolist()))
+    scores = {}
+    for post_id, age, weight in zip(post_ids, ages, weights):
+        scores[post_id] = scores.get(post_id, 0.0) + weight * math.pow(2, -age / half_life)
+    return scores
+
+
+def rank_trending_posts(now=None):
+    """
+    Score the posts and store the ids of the TRENDING_POSTS_COUNT highest
+    scoring published ones in the cache, best first. Returns the ids.
+    """
+    now = now or timezone.now()
+    scores = score_posts(*trending_events(now), settings.TRENDING_HALF_LIFE_HOURS)
+    # comments and views can belong to posts that are unpublished or gone
+    published = set(
+        Post.objects.filter(pk__in=scores.keys(), published_at__lte=now).values_list(
+            "pk", flat=True
+        )
+    )
+    ranked = sorted(
+        (pk for pk in scores if pk in published), key=lambda pk: (-scores[pk], -pk)
+    )[: settings.TRENDING_POSTS_COUNT]
+    cache.set(TRENDING_POSTS_CACHE_KEY, ranked, settings.TRENDING_CACHE_SECONDS)
+    logger.debug("Ranked %d trending posts out of %d scored", len(ranked), len(scores))
+    return ranked
+
+
+def get_trending_post_ids():
+    """
+    The stored ranking, or an empty list if there is none.
+    """
+    ranked = cache.get(TRENDING_POSTS_CACHE_KEY)
+    if ranked is None:
+        logger.info("No trending posts ranking, is rank_trending_posts scheduled?")
+        return []
+    return ranked
@@ -1,8 +1,13 @@
 from django.shortcuts import render, get_object_or_404
 from django.utils import timezone
 from blog.models import Post
+from blog.caching import attach_author_bylines
+from blog.analytics import record_view
+from blog.comments import comment_page
+from blog.intake import CommentRejected, check_comment, remember_comment
 from django.shortcuts import redirect
 from django.http import HttpResponseRedirect
+from django.core.exceptions import PermissionDenied
 from blog.forms import CommentForm
 from django.views.decorators.cache import cache_page
 import logging
@@ -24,7 +29,10 @@ def index(request):
     #Installing & Configuring Django Debug Toolbar for more on this. 
     #return HttpResponseRedirect("/ip/")
     #posts = Post.objects.filter(published_at__lte=timezone.now())
-    posts = Post.objects.filter(published_at__lte=timezone.now()).select_related("author")
+    #posts = Post.objects.filter(published_at__lte=timezone.now()).select_related("author")
+    #The bylines come from the cache in one lookup for the whole page, so the
+    #author rows no longer need to be joined in.
+    posts = attach_author_bylines(Post.objects.filter(published_at__lte=timezone.now()))
     logger.debug("Got %d posts", len(posts))
     return render(request, "blog/index.html", {"posts": posts})
 
@@ -45,7 +53,9 @@ def post_table(request):
 def post_detail(request, slug):
     post = get_object_or_404(Post, slug=slug)
     logger.debug("request user is_active is %r", request.user.is_active)
-    if request.user.is_active or not request.user.is_active:
+    status = 200
+    #only logged in, active users can comment; AnonymousUser.is_active is False
+    if request.user.is_active:
         logger.debug("request.method %s", request.method)
         if request.method == "POST":
             comment_form = CommentForm(request.POST)
@@ -53,15 +63,45 @@ def post_detail(request, slug):
             if comment_form.is_valid():
                 comment = comment_form.save(commit=False)
                 logger.debug("comment from comment_form.save is %s", comment)
-                comment.content_object = post
-                comment.creator = request.user
-                comment.save()
-                return redirect(request.path_info)
+                #rate limits and spam checks, in memory before the insert
+                #(see blog/intake.py)
+                try:
+                    check_comment(
+                        request.user, request.META.get("REMOTE_ADDR"), post, comment.content
+                    )
+                except CommentRejected as e:
+                    comment_form.add_error(None, str(e))
+                    status = 429 if e.wait is not None else 400
+                else:
+                    comment.content_object = post
+                    comment.creator = request.user
+                    comment.save()
+                    remember_comment(request.user, post, comment.content)
+                    return redirect(request.path_info)
         else:
             comment_form = CommentForm()
     else:
+        if request.method == "POST":
+            raise PermissionDenied("Log in to comment")
         comment_form = None
+    #the view is only counted in memory here, see blog/analytics.py
+    if request.method == "GET":
+        record_view(post.pk)
+    #one page of comments at a time, ?comments= being the cursor of the page
+    #(see blog/comments.py); a cursor that isn't valid shows the first page
+    try:
+        comments, comments_next = comment_page(post, request.GET.get("comments"))
+    except ValueError:
+        comments, comments_next = comment_page(post)
     #return render(request, "blog/post-detail.html", {"post": post})
     return render(
-        request, "blog/post-detail.html", {"post": post, "comment_form": comment_form}
+        request,
+        "blog/post-detail.html",
+        {
+            "post": post,
+            "comment_form": comment_form,
+            "comments": comments,
+            "comments_next": comments_next,
+        },
+        status=status,
     )
@@ -0,0 +1,32 @@
+"""
+Work done once when a server process starts (see blango/wsgi.py and
+blango/asgi.py), so the first requests don't pay for it.
+"""
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# set by the import_report command, which only measures imports
+SKIP_WARM_UP_VARIABLE = "BLANGO_SKIP_WARM_UP"
+
+
+def warm_up():
+    if os.environ.get(SKIP_WARM_UP_VARIABLE):
+        logger.debug("Skipping the warm up, %s is set", SKIP_WARM_UP_VARIABLE)
+        return
+
+    from blog.api.schema import get_schema
+    from blog.tags import tag_index
+
+    try:
+        get_schema(write=True)
+    except Exception:
+        # a server that can't build the schema can still serve everything else
+        logger.exception("Could not build the API schema at startup")
+
+    try:
+        tag_index.load()
+    except Exception:
+        # e.g. before the first migrate; the index is loaded on first use
+        logger.exception("Could not load the tag autocomplete index at startup")